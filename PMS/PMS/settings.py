@@ -49,6 +49,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Only active with REQUEST_TIMING_ENABLED
+    'apps.system.instrumentation.RequestTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'PMS.urls'
@@ -92,6 +94,49 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Computed allocation results, see apps/algorithm/allocation_cache.py. Any backend works,
+    # e.g. django.core.cache.backends.filebased.FileBasedCache or db.DatabaseCache
+    # (after `python manage.py createcachetable`) to share results between processes.
+    # Only edited allocations and allocate_cohorts results are saved as AllocationSnapshot
+    # rows, every other result lives here: with this per-process local-memory backend each
+    # worker process computes and keeps its own.
+    'allocation': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'allocation',
+    },
+}
+ALLOCATION_CACHE_ALIAS = 'allocation'
+ALLOCATION_CACHE_TIMEOUT = 60 * 60 * 24
+# Repair the previous allocation when only some students' priorities changed instead of
+# allocating from scratch, see apps/algorithm/incremental.py. Past the cascade limit of
+# students placed again the allocation runs in full.
+INCREMENTAL_ALLOCATION_ENABLED = True
+INCREMENTAL_ALLOCATION_CASCADE_LIMIT = 50
+# What-if simulations of subject capacities, see apps/algorithm/simulation.py. Scenarios run in
+# a pool of SIMULATION_WORKERS processes, one per CPU when None.
+SIMULATION_WORKERS = None
+SIMULATION_MAX_SCENARIOS = 100
+# Processes of the allocate_cohorts command and admin action, one per CPU when None
+COHORT_ALLOCATION_WORKERS = None
+
+# Stage timings, query counts and peak memory of the report and download requests, sent in a
+# Server-Timing header and logged to a rotating file, see apps/system/instrumentation.py
+REQUEST_TIMING_ENABLED = os.environ.get('REQUEST_TIMING_ENABLED', '').lower() in ('1', 'true', 'yes')
+REQUEST_TIMING_PATHS = ('/report/', '/download-allocation/', '/course/session/')
+REQUEST_TIMING_LOG_FILE = os.path.join(BASE_DIR, 'logs', 'request_timing.log')
+REQUEST_TIMING_LOG_MAX_BYTES = 5 * 1024 * 1024
+REQUEST_TIMING_LOG_BACKUP_COUNT = 5
+# Peak memory per request through tracemalloc, which slows the measured code down
+# and is only meaningful with one request served at a time, as its peak is process-wide
+REQUEST_TIMING_TRACE_MEMORY = False
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
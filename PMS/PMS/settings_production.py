@@ -54,6 +54,14 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Allocation results shared by all gunicorn workers of the container. Results that were not
+# edited or saved by allocate_cohorts are only stored here, so several containers need a
+# shared backend (e.g. db.DatabaseCache) to read the same state.
+CACHES['allocation'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(BASE_DIR, 'data', 'allocation_cache'),
+}
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -19,7 +19,8 @@ from django.views.generic import RedirectView
 
 from apps.ajax_apis import get_faculty_according_to_level, get_semester_according_to_level
 from apps.student.views import enter_priority_in_bulk
-from apps.system.views import display_report
+from apps.system.views import display_report, job_status, download_job_artifact, request_timings, \
+    allocation_simulation, allocation_simulation_api
 from apps.course.views import download_allocation_result
 
 urlpatterns = [
@@ -28,6 +29,12 @@ urlpatterns = [
     path('report/', display_report, name='display_result'),
     path('enter-priorities/', enter_priority_in_bulk, name='enter_priorities'),
     path('download-allocation/<int:session_id>/', download_allocation_result, name='download_allocation_result'),
+    path('jobs/<int:job_id>/', admin.site.admin_view(job_status), name='job_status'),
+    path('jobs/<int:job_id>/download/', admin.site.admin_view(download_job_artifact), name='download_job_artifact'),
+    path('request-timings/', admin.site.admin_view(request_timings), name='request_timings'),
+    path('allocation-simulation/', admin.site.admin_view(allocation_simulation), name='allocation_simulation'),
+    path('allocation-simulation/api/', admin.site.admin_view(allocation_simulation_api),
+         name='allocation_simulation_api'),
     
     # Include course URLs for Excel downloads
     path('course/', include('apps.course.urls')),
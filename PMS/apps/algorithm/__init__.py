@@ -145,6 +145,11 @@ STEP 5: We start eliminating the result_df table from bottom row as it has the l
         Here we obtain the result only in second iteration, but to make sure
         we iterate for number_of_subjects times
 
+        Reassigning a displaced student only ever adds students to the remaining subjects, so a
+        subject that reaches the threshold never falls below it again. The implementation therefore
+        makes a single bottom-up pass: subjects below the threshold are kept in a heap, bottom first,
+        and each one is checked against its live student count when it is popped.
+
 
 
 
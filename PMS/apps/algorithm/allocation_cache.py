@@ -0,0 +1,99 @@
+"""
+Cache of computed allocation results built on django.core.cache.
+
+The backend is the cache named by settings.ALLOCATION_CACHE_ALIAS, so it can be a
+local-memory, file-based or database cache. Keys contain a content hash of every input
+of the allocation, so a changed input can never hit an old result. Saving or deleting a
+priority, subject or semester also bumps the generation of that semester (see the
+signal receivers in apps.student.signals and apps.course.signals), which drops every
+result computed for it before.
+
+Results are stored in the compact binary form of apps.algorithm.packed_allocation rather
+than as pickled DataFrames, so they are small, quick to load and independent of the
+pandas version.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from apps.algorithm.packed_allocation import FORMAT_VERSION, PackedAllocation, pack_allocation
+
+DEFAULT_TIMEOUT = 60 * 60 * 24
+
+
+def get_allocation_cache():
+    return caches[getattr(settings, 'ALLOCATION_CACHE_ALIAS', 'default')]
+
+
+def get_generation_key(session_id):
+    return 'allocation-generation:%s' % session_id
+
+
+def get_generation(session_id):
+    return get_allocation_cache().get(get_generation_key(session_id), 0)
+
+
+def invalidate_allocation_cache(session_id):
+    """Forget every allocation cached for a semester."""
+    cache = get_allocation_cache()
+    key = get_generation_key(session_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def hash_allocation_inputs(*parts):
+    """Hash the given inputs (strings, numbers, bytes or nested lists/tuples of them)."""
+    digest = hashlib.sha256()
+
+    def update(value):
+        if isinstance(value, (list, tuple)):
+            digest.update(b'[')
+            for item in value:
+                update(item)
+            digest.update(b']')
+        elif isinstance(value, bytes):
+            digest.update(b'b%d:' % len(value))
+            digest.update(value)
+        else:
+            text = repr(value).encode()
+            digest.update(b's%d:' % len(text))
+            digest.update(text)
+
+    update(list(parts))
+    return digest.hexdigest()
+
+
+def get_cache_key(batch_id, session_id, stream_id, input_hash):
+    # The format version keeps results of an older format, e.g. in a file-based cache, from being read
+    return 'allocation:v%s:%s:%s:%s:%s:%s' % (FORMAT_VERSION, batch_id, session_id, stream_id,
+                                              get_generation(session_id), input_hash)
+
+
+def get_cached_result(batch_id, session_id, stream_id, input_hash):
+    """PackedAllocation of a cached result, or None"""
+    data = get_allocation_cache().get(get_cache_key(batch_id, session_id, stream_id, input_hash))
+    return None if data is None else PackedAllocation(data)
+
+
+def set_cached_result(batch_id, session_id, stream_id, input_hash, result_df):
+    timeout = getattr(settings, 'ALLOCATION_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    get_allocation_cache().set(get_cache_key(batch_id, session_id, stream_id, input_hash),
+                               pack_allocation(result_df), timeout)
+
+
+def get_state_key(batch_id, session_id, stream_id):
+    # No generation: the state is what the next allocation after a change is compared with
+    return 'allocation-state:%s:%s:%s' % (batch_id, session_id, stream_id)
+
+
+def get_allocation_state(batch_id, session_id, stream_id):
+    """State of the last greedy allocation of a batch, semester and stream, see apps.algorithm.incremental"""
+    return get_allocation_cache().get(get_state_key(batch_id, session_id, stream_id))
+
+
+def set_allocation_state(batch_id, session_id, stream_id, state):
+    timeout = getattr(settings, 'ALLOCATION_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    get_allocation_cache().set(get_state_key(batch_id, session_id, stream_id), state, timeout)
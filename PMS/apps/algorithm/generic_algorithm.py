@@ -1,15 +1,60 @@
+import heapq
+from collections import namedtuple
+
 import pandas as pd
 from apps.student.models import ElectivePriority
 from apps.utils import prepare_pandas_dataframe_from_database
 from apps.course.models import ElectiveSubject
+from apps.algorithm.numpy_engine import NumpyAllocationEngine
+from apps.algorithm.min_cost_flow import MinCostFlowAllocationEngine
+from apps.algorithm.incremental import IncrementalAllocationEngine, is_incremental_allocation_enabled
+from apps.algorithm.tie_breaking import order_students
+from apps.algorithm.allocation_cache import hash_allocation_inputs, get_cached_result, set_cached_result, \
+    get_allocation_state, set_allocation_state
+
+ENGINES = ('pandas', 'numpy', 'min_cost_flow')
+# Engines producing the same allocation as the pandas one, and so sharing its cached results
+GREEDY_ENGINES = ('pandas', 'numpy')
+
+
+# Inputs of a GenericAlgorithm loaded in bulk for many cohorts, see apps.course.cohorts:
+# the priority matrix of prepare_pandas_dataframe_from_database, the (subject name, min_students,
+# max_students) rows of the subjects and the student metadata of build_student_metadata
+CohortInputs = namedtuple('CohortInputs', ['df_of_priorities', 'subject_limits', 'student_metadata'])
+
+
+def build_student_metadata(rows):
+    """
+    Metadata of every student keyed by id, from (id, name, roll number, level name,
+    desired number of subjects) rows of their priorities in primary key order
+    """
+    metadata = {}
+    for student_id, name, roll_number, level_name, desired_number_of_subjects in rows:
+        # The first priority entry of a student carries the desired subject count
+        metadata.setdefault(student_id, {
+            'name': name,
+            'roll_number': roll_number,
+            'level': level_name or '',
+            'desired_number_of_subjects': desired_number_of_subjects,
+        })
+    return metadata
 
 
 class GenericAlgorithm:
-    def __init__(self, batch, semester, stream):
+    def __init__(self, batch, semester, stream, engine='pandas', inputs=None):
+        """
+        :param inputs: CohortInputs already loaded for this batch/semester/stream, instead of querying them
+        """
+        if engine not in ENGINES:
+            raise ValueError('Unknown allocation engine %r, expected one of %s' % (engine, ', '.join(ENGINES)))
         self.batch = batch
         self.semester = semester
         self.stream = stream
-        self.df_of_priorities = prepare_pandas_dataframe_from_database(batch, semester, stream)
+        self.engine = engine
+        if inputs is None:
+            self.df_of_priorities = prepare_pandas_dataframe_from_database(batch, semester, stream)
+        else:
+            self.df_of_priorities = inputs.df_of_priorities
         
         # Check if we have any students with elective selections
         if self.df_of_priorities.empty:
@@ -17,32 +62,75 @@ class GenericAlgorithm:
             self.subjects_list_in_order = []
             self.min_students_per_subject = {}
             self.max_students_per_subject = {}
+            self.student_metadata = {}
+            self.subject_counts = {}
+            self.eliminated_subjects = set()
+            self.input_hash = self.get_input_hash()
             return
             
         self.minimum_subject_threshold = semester.min_student
         # self.maximum_subject_limit = 24  # Maximum students per subject
         self.result_df = None
+        self.subject_counts = {}
+        self.eliminated_subjects = set()
         self.subjects_list_in_order = self.df_of_priorities.index
           # Fetch subject-specific min/max student counts from the database
         self.min_students_per_subject = {}
         self.max_students_per_subject = {}
-        for subject_name in self.subjects_list_in_order:
-            subject = ElectiveSubject.objects.get(subject_name=subject_name, elective_for=self.semester, stream=self.stream)
-            self.min_students_per_subject[subject_name] = subject.min_students
-            self.max_students_per_subject[subject_name] = subject.max_students
+        if inputs is None:
+            subject_limits = ElectiveSubject.objects.filter(elective_for=self.semester,
+                                                            stream=self.stream).values_list(
+                'subject_name', 'min_students', 'max_students')
+        else:
+            subject_limits = inputs.subject_limits
+        for subject_name, min_students, max_students in subject_limits:
+            self.min_students_per_subject.setdefault(subject_name, min_students)
+            self.max_students_per_subject.setdefault(subject_name, max_students)
+
+        self.student_metadata = self.load_student_metadata() if inputs is None else inputs.student_metadata
+        # Students are served in the tie-breaking order of the semester, see apps.algorithm.tie_breaking
+        self.df_of_priorities = self.df_of_priorities[order_students(
+            self.df_of_priorities.columns, self.student_metadata, semester.tie_breaking, semester.pk,
+            semester.lottery_seed)]
+        self.input_hash = self.get_input_hash()
+
+    def load_student_metadata(self):
+        """
+        Load name, roll number, academic level and desired subject count of every student
+        with priorities in this run using one joined query, keyed by student id (the
+        df_of_priorities and result_df columns).
+        """
+        rows = ElectivePriority.objects.filter(
+            student__batch=self.batch,
+            student__stream=self.stream,
+            session=self.semester
+        ).order_by('pk').values_list('student_id', 'student__name', 'student__roll_number', 'student__level__name',
+                                     'desired_number_of_subjects')
+        return build_student_metadata(rows)
 
-    def is_masters_student(self, student_name):
+    def get_input_hash(self):
+        """Content hash of everything the allocation depends on, used as the cache key"""
+        df = self.df_of_priorities
+        # The greedy engines share their results, other engines are part of the hash
+        engine = [] if self.engine in GREEDY_ENGINES else [self.engine]
+        return hash_allocation_inputs(
+            [str(index) for index in df.index],
+            [str(column) for column in df.columns],
+            df.to_numpy(dtype=float).tobytes(),
+            sorted(self.min_students_per_subject.items()),
+            sorted(self.max_students_per_subject.items()),
+            self.semester.min_student,
+            sorted((student_id, metadata['level'], metadata['desired_number_of_subjects'])
+                   for student_id, metadata in self.student_metadata.items()),
+            *engine
+        )
+
+    def is_masters_student(self, student_id):
         """Check if a student is a Masters student based on their academic level"""
-        from apps.authuser.models import StudentProxyModel
-        try:
-            # Get the first student with this name, batch, and stream
-            # If there are multiple students with the same name, we take the first one
-            student = StudentProxyModel.objects.filter(name=student_name, batch=self.batch, stream=self.stream).first()
-            if student:
-                return 'masters' in student.level.name.lower()
-            return False
-        except Exception:
-            return False
+        student = self.student_metadata.get(student_id)
+        if student:
+            return 'masters' in student['level'].lower()
+        return False
 
     def get_desired_number_of_subjects_for_student(self, student):
         """
@@ -50,10 +138,9 @@ class GenericAlgorithm:
         Uses the configured desired_number_of_subjects from the database.
         Defaults to 3 for Masters students and 2 for non-Masters students.
         """
-        priority_entry = ElectivePriority.objects.filter(student__name=student,
-                                               session=self.semester).first()
-        if priority_entry and priority_entry.desired_number_of_subjects:
-            return priority_entry.desired_number_of_subjects
+        metadata = self.student_metadata.get(student)
+        if metadata and metadata['desired_number_of_subjects']:
+            return metadata['desired_number_of_subjects']
 
         return 3 if self.is_masters_student(student) else 2
 
@@ -63,7 +150,8 @@ class GenericAlgorithm:
             row_sum = self.df_of_priorities.iloc[i].sum(skipna=True)
             priority_sum.append(row_sum)
         self.df_of_priorities['priority_sum'] = priority_sum
-        self.df_of_priorities = self.df_of_priorities.sort_values('priority_sum')
+        # A stable sort keeps subjects with the same sum in database order
+        self.df_of_priorities = self.df_of_priorities.sort_values('priority_sum', kind='stable')
         self.df_of_priorities.pop('priority_sum')
         return self.df_of_priorities
 
@@ -72,7 +160,7 @@ class GenericAlgorithm:
         if self.result_df is None:
             return False
         
-        current_count = sum(self.result_df.loc[subject_index])
+        current_count = self.subject_counts[subject_index]
         max_capacity = self.max_students_per_subject.get(subject_index, 24)  # Default to 24 if not set
         return current_count >= max_capacity
 
@@ -81,10 +169,7 @@ class GenericAlgorithm:
         
         # Filter out non-student columns before processing
         student_columns = [col for col in self.df_of_priorities.columns 
-                          if col not in ['number_of_students', 'priority_sum'] and not col.startswith('Unnamed')]
-          # Filter out non-student columns before processing
-        student_columns = [col for col in self.df_of_priorities.columns 
-                          if col not in ['number_of_students', 'priority_sum'] and not col.startswith('Unnamed')]
+                          if col not in ['number_of_students', 'priority_sum'] and not str(col).startswith('Unnamed')]
         
         self.result_df = pd.DataFrame({}, index=self.df_of_priorities.index.to_list(),
                                       columns=student_columns)
@@ -92,8 +177,8 @@ class GenericAlgorithm:
         for index in self.result_df.index:
             for column in self.result_df.columns:
                 self.result_df.at[index, column] = 0
-        
-        total_assignments = 0
+        # live number of students assigned to each subject
+        self.subject_counts = {index: 0 for index in self.result_df.index}
         
         for column in student_columns:  # Only iterate through actual student columns
             # Create a series for this student with only non-NaN values (subjects they selected)
@@ -102,7 +187,7 @@ class GenericAlgorithm:
             if student_priorities.empty:
                 continue
                   # Sort by priority (lower numbers = higher priority)
-            student_priorities = student_priorities.sort_values()
+            student_priorities = student_priorities.sort_values(kind='stable')
             indices = student_priorities.index.to_list()
             
             desired_subject_count = self.get_desired_number_of_subjects_for_student(column)
@@ -118,73 +203,146 @@ class GenericAlgorithm:
                     if not self.is_subject_at_capacity(subject_index):
                         self.result_df.at[subject_index, column] = 1
                         self.df_of_priorities.at[subject_index, column] = 999
+                        self.subject_counts[subject_index] += 1
                         assigned_count += 1
-                        total_assignments += 1
 
     def arrange_priority_for_a_particular_student(self, student):
+        """
+        Assign the student to the first subject in their priority order that has not been
+        eliminated and still has room. Returns that subject, or None.
+        """
         # Get only the subjects this student has selected (non-NaN values)
         student_priorities = self.df_of_priorities[student].dropna()
         if student_priorities.empty:
-            return
+            return None
             
-        student_priorities = student_priorities.sort_values()
+        student_priorities = student_priorities.sort_values(kind='stable')
         indices = student_priorities.index.to_list()
         # Find the first subject that still exists, hasn't reached capacity, and student has selected
         for subject_index in indices:
             # Skip subjects that have been eliminated from the results
-            if subject_index not in self.result_df.index:
+            if subject_index in self.eliminated_subjects:
                 continue
             if not pd.isna(self.df_of_priorities.at[subject_index, student]) and not self.is_subject_at_capacity(subject_index):
-                self.result_df.at[subject_index, student] = 1
+                # Subjects already given to the student are marked 999 and come last
+                if self.result_df.at[subject_index, student] != 1:
+                    self.result_df.at[subject_index, student] = 1
+                    self.subject_counts[subject_index] += 1
                 self.df_of_priorities.at[subject_index, student] = 999
-                break
-    
+                return subject_index
+        return None
+
+    def is_under_subscribed(self, subject_index):
+        current_count = self.subject_counts[subject_index]
+        return current_count == 0 or current_count < self.min_students_per_subject.get(subject_index, 0)
+
     def start_eliminating_from_bottom(self):
-        eliminated_any = False
-        # Use .tolist() to avoid modifying the index while iterating
-        for index in reversed(self.result_df.index.tolist()):
-            current_count = int(sum(self.result_df.loc[index]))
-            min_required = self.min_students_per_subject.get(index, 0)
-
-            if current_count == 0:
-                self.result_df = self.result_df.drop(index)
-                eliminated_any = True
-            elif current_count < min_required:
-                # Collect students to reassign BEFORE dropping the row
-                students_to_reassign = []
-                for column in self.result_df.columns:
-                    if self.result_df.at[index, column] == 1:
-                        students_to_reassign.append(column)
-
-                # Drop the subject row FIRST — prevents reassignment back to it
-                self.result_df = self.result_df.drop(index)
-                eliminated_any = True
-
-                # Now reassign displaced students to remaining viable subjects
-                for student in students_to_reassign:
-                    self.arrange_priority_for_a_particular_student(student)
-
-        return eliminated_any
+        """
+        Eliminate under-subscribed subjects from the bottom of the priority order and move
+        their students to their next available choice.
+
+        Reassignments only ever add students to the surviving subjects, so a subject that
+        has enough students keeps them. Only subjects that start below their minimum need
+        checking: they sit in a heap ordered bottom first and are checked against their live
+        count when popped, which may have grown from students displaced below them.
+        Eliminated rows are dropped from result_df once at the end.
+        """
+        self.eliminated_subjects = set()
+        positions = {subject_index: position for position, subject_index in enumerate(self.result_df.index)}
+        under_subscribed = [(-positions[subject_index], subject_index) for subject_index in self.result_df.index
+                            if self.is_under_subscribed(subject_index)]
+        heapq.heapify(under_subscribed)
+
+        while under_subscribed:
+            _, index = heapq.heappop(under_subscribed)
+            if not self.is_under_subscribed(index):
+                continue
+
+            # Collect students to reassign BEFORE eliminating the subject
+            students_to_reassign = [column for column in self.result_df.columns
+                                    if self.result_df.at[index, column] == 1]
+
+            # Eliminate the subject FIRST — prevents reassignment back to it
+            self.eliminated_subjects.add(index)
+            self.subject_counts[index] = 0
+
+            # Now reassign displaced students to remaining viable subjects
+            for student in students_to_reassign:
+                self.arrange_priority_for_a_particular_student(student)
+
+        if self.eliminated_subjects:
+            self.result_df = self.result_df.drop([index for index in self.result_df.index
+                                                  if index in self.eliminated_subjects])
+        return bool(self.eliminated_subjects)
 
     def run(self):
-        # Check if we have cached data first
+        # Check if we have saved (manually edited) data for these inputs first
         from apps.course.views import get_cached_allocation
-        cached_result = get_cached_allocation(self.batch.pk, self.semester.pk, self.stream.pk)
+        cached_result = get_cached_allocation(self.batch.pk, self.semester.pk, self.stream.pk, self.input_hash)
         
         if cached_result is not None:
             self.result_df = cached_result
             return self.result_df
+
+        # Then reuse an earlier computation on identical inputs
+        cached_result = get_cached_result(self.batch.pk, self.semester.pk, self.stream.pk, self.input_hash)
+        if cached_result is not None:
+            self.result_df = cached_result.to_result_df()
+            return self.result_df
+
         # If no cached data, run the normal algorithm
-        self.insert_from_priority_to_result()
-        
-        # Run elimination passes until no more subjects are eliminated (convergence)
-        max_iterations = len(self.subjects_list_in_order) * 2  # Safety limit
-        for i in range(max_iterations):
-            if not self.start_eliminating_from_bottom():
-                break
+        if self.engine in GREEDY_ENGINES and is_incremental_allocation_enabled():
+            self.result_df = self.run_incremental()
+        elif self.engine == 'numpy':
+            self.result_df = self.run_numpy_engine()
+        elif self.engine == 'min_cost_flow':
+            self.result_df = self.run_min_cost_flow_engine()
+        else:
+            self.insert_from_priority_to_result()
+            self.start_eliminating_from_bottom()
+        set_cached_result(self.batch.pk, self.semester.pk, self.stream.pk, self.input_hash, self.result_df)
         self.display_result()
         return self.result_df
 
+    def run_numpy_engine(self):
+        """Run the same allocation on NumPy arrays, see apps.algorithm.numpy_engine"""
+        if self.df_of_priorities.empty:
+            return pd.DataFrame()
+        engine = NumpyAllocationEngine(self.df_of_priorities, self.get_desired_number_of_subjects_for_student,
+                                       self.min_students_per_subject, self.max_students_per_subject)
+        return engine.run()
+
+    def run_incremental(self):
+        """
+        Repair the last allocation of this batch/semester/stream when only some students changed,
+        see apps.algorithm.incremental, or run the engine in full. Either way the new state is kept
+        for the next change.
+        """
+        if self.df_of_priorities.empty:
+            return pd.DataFrame()
+        engine = IncrementalAllocationEngine(self.df_of_priorities, self.get_desired_number_of_subjects_for_student,
+                                             self.min_students_per_subject, self.max_students_per_subject)
+        result_df = engine.repair(get_allocation_state(self.batch.pk, self.semester.pk, self.stream.pk))
+        if result_df is None:
+            if self.engine == 'numpy':
+                result_df = engine.run()
+            else:
+                self.insert_from_priority_to_result()
+                inserted_df = self.result_df.copy()
+                self.start_eliminating_from_bottom()
+                result_df = self.result_df
+                engine.load_result(inserted_df, result_df)
+        set_allocation_state(self.batch.pk, self.semester.pk, self.stream.pk, engine.get_state())
+        return result_df
+
+    def run_min_cost_flow_engine(self):
+        """Run the min-cost flow allocation, see apps.algorithm.min_cost_flow"""
+        if self.df_of_priorities.empty:
+            return pd.DataFrame()
+        engine = MinCostFlowAllocationEngine(self.df_of_priorities, self.get_desired_number_of_subjects_for_student,
+                                             self.min_students_per_subject, self.max_students_per_subject)
+        return engine.run()
+
     def display_result(self):
         # Method kept for compatibility, no debug output
         pass
@@ -194,8 +352,6 @@ class GenericAlgorithm:
         Special allocation method for Masters students that tries to give them 
         all subjects they selected in their priority list, respecting subject capacity limits.
         """
-        from apps.authuser.models import StudentProxyModel
-        
         # Get all Masters students in this batch/stream
         masters_students = []
         for column in self.result_df.columns:
@@ -209,7 +365,7 @@ class GenericAlgorithm:
                 continue
                 
             # Sort by priority (lower numbers = higher priority)
-            student_priorities = student_priorities.sort_values()
+            student_priorities = student_priorities.sort_values(kind='stable')
             
             # Try to assign all subjects the student selected
             for subject_index in student_priorities.index:
@@ -220,6 +376,7 @@ class GenericAlgorithm:
                         # Check if student is not already assigned to this subject
                         if self.result_df.at[subject_index, student] == 0:
                             self.result_df.at[subject_index, student] = 1
+                            self.subject_counts[subject_index] += 1
                             # Mark as assigned in priority DataFrame
                             self.df_of_priorities.at[subject_index, student] = 999
         
@@ -0,0 +1,219 @@
+"""
+Incremental re-allocation when only a few students' priorities change.
+
+Every allocation of the greedy engines leaves its state in the allocation cache (see
+get_allocation_state): the priorities it was computed from, the assignments after the
+insertion phase and the final assignments. The next allocation of the same batch,
+semester and stream diffs its priorities against that state, and when only some
+students were added, removed or edited it repairs the previous allocation instead of
+starting over:
+
+    insertion    Students are replayed in order, but an unchanged student keeps their
+                 previous subjects unless a subject they selected is full at their turn in
+                 one run and not in the other. Unchanged students placed again are the
+                 cascade of the change; past the cascade limit the repair gives up.
+    elimination  When every subject whose students changed stays clear of its min_students
+                 and max_students thresholds in both runs, elimination moves the same
+                 students as before and its result is kept. Otherwise elimination runs again
+                 on the repaired insertion, which only visits the under-subscribed subjects.
+
+Both phases reproduce the full run exactly, so the repaired result_df is the one a full
+run would give. Changed subjects or subject limits, and a changed order of the subjects or
+of the unchanged students (a new tie-breaking order), are not a student delta and need a
+full run.
+"""
+import numpy as np
+from django.conf import settings
+
+from apps.algorithm.numpy_engine import NumpyAllocationEngine, ASSIGNED_PRIORITY
+
+DEFAULT_CASCADE_LIMIT = 50
+
+
+def is_incremental_allocation_enabled():
+    return getattr(settings, 'INCREMENTAL_ALLOCATION_ENABLED', True)
+
+
+class IncrementalAllocationEngine(NumpyAllocationEngine):
+    def __init__(self, df_of_priorities, desired_number_of_subjects, min_students_per_subject,
+                 max_students_per_subject, cascade_limit=None):
+        """
+        Same arguments as NumpyAllocationEngine
+        :param cascade_limit: most unchanged students placed again before falling back to a full run,
+            settings.INCREMENTAL_ALLOCATION_CASCADE_LIMIT by default
+        """
+        super().__init__(df_of_priorities, desired_number_of_subjects, min_students_per_subject,
+                         max_students_per_subject)
+        if cascade_limit is None:
+            cascade_limit = getattr(settings, 'INCREMENTAL_ALLOCATION_CASCADE_LIMIT', DEFAULT_CASCADE_LIMIT)
+        self.cascade_limit = cascade_limit
+        self.initial_priorities = self.priorities.copy()
+        self.inserted = None
+        # Unchanged students placed again by the last repair
+        self.cascade = 0
+
+    def reset(self):
+        self.priorities = self.initial_priorities.copy()
+        self.assigned[:] = False
+        self.counts[:] = 0
+        self.active[:] = True
+        self.inserted = None
+
+    def insert_from_priority_to_result(self):
+        super().insert_from_priority_to_result()
+        self.inserted = self.assigned.copy()
+
+    def run(self):
+        self.reset()
+        return super().run()
+
+    def load_result(self, inserted_df, result_df):
+        """Take the state of an allocation computed by GenericAlgorithm instead of running it again"""
+        self.reset()
+        self.inserted = inserted_df.reindex(index=self.subjects, columns=self.student_columns,
+                                            fill_value=0).to_numpy() == 1
+        self.assigned = result_df.reindex(index=self.subjects, columns=self.student_columns,
+                                          fill_value=0).to_numpy() == 1
+        offered = set(result_df.index)
+        self.active = np.array([subject in offered for subject in self.subjects], dtype=bool)
+        self.counts = self.assigned.sum(axis=1)
+
+    def get_state(self):
+        """State of the last run or repair, for get_allocation_state"""
+        return {
+            'subjects': list(self.subjects),
+            'students': list(self.student_columns),
+            'selected': self.selected,
+            'priorities': self.initial_priorities,
+            'desired_counts': self.desired_counts,
+            'min_students': self.min_students,
+            'max_students': self.max_students,
+            'inserted': self.inserted,
+            'assigned': self.assigned,
+            'active': self.active,
+        }
+
+    def get_changed_students(self, state, previous_positions):
+        """Positions of the students who are new or whose priorities or desired count changed"""
+        previous = np.array([previous_positions.get(name, -1) for name in self.student_columns], dtype=np.int64)
+        known = np.flatnonzero(previous >= 0)
+        # Unselected subjects have priority 0 in both states
+        same = ((self.selected[:, known] == state['selected'][:, previous[known]]).all(axis=0)
+                & (self.initial_priorities[:, known] == state['priorities'][:, previous[known]]).all(axis=0)
+                & (self.desired_counts[known] == state['desired_counts'][previous[known]]))
+        return set(range(len(self.student_columns))) - set(known[same].tolist())
+
+    def repair(self, state):
+        """
+        Repair the allocation of a previous state for the current priorities, see the module docstring.
+        Returns the result_df, or None when a full run is needed.
+        """
+        self.reset()
+        self.cascade = 0
+        if (state is None or state['subjects'] != self.subjects
+                or not np.array_equal(state['min_students'], self.min_students)
+                or not np.array_equal(state['max_students'], self.max_students)):
+            return None
+
+        previous_positions = {student: j for j, student in enumerate(state['students'])}
+        changed = self.get_changed_students(state, previous_positions)
+        unchanged = [(student, previous_positions[name]) for student, name in enumerate(self.student_columns)
+                     if student not in changed]
+        previous_unchanged = [previous_student for _, previous_student in unchanged]
+        if previous_unchanged != sorted(previous_unchanged):
+            return None
+        # Positions in the previous state of the removed and edited students
+        previous_changed = sorted(set(range(len(state['students']))) - set(previous_unchanged))
+
+        moved = self.repair_insertion(state, unchanged, changed)
+        if moved is None:
+            return None
+        self.inserted = self.assigned.copy()
+        self.priorities = np.where(self.assigned, ASSIGNED_PRIORITY, self.initial_priorities)
+
+        moved = sorted(changed | moved)
+        previous_moved = sorted(set(previous_changed) | {previous_positions[self.student_columns[student]]
+                                                          for student in moved if student not in changed})
+        if self.is_elimination_unchanged(state, moved, previous_moved):
+            self.assigned = np.zeros_like(self.inserted)
+            self.assigned[:, [student for student, _ in unchanged]] = state['assigned'][:, previous_unchanged]
+            # Moved students never lose or gain a subject during this elimination
+            self.assigned[:, moved] = self.inserted[:, moved]
+            self.active = state['active'].copy()
+            self.counts = self.assigned.sum(axis=1)
+        else:
+            self.start_eliminating_from_bottom()
+        return self.get_result_df()
+
+    def repair_insertion(self, state, unchanged, changed):
+        """
+        Replay the insertion phase. Returns the unchanged students whose subjects changed,
+        or None when more students than the cascade limit had to be placed again.
+
+        Before the i-th unchanged student the counts of the previous run are the previous
+        subjects of every student before it, and the counts of this run are the previous
+        subjects of the unchanged students before it plus the difference made by the changed
+        and placed again students. That difference only changes at those students, so the
+        unchanged students in between are checked all at once.
+        """
+        previous_inserted = state['inserted'].astype(np.int64)
+        students = np.array([student for student, _ in unchanged], dtype=np.int64)
+        previous_students = np.array([previous_student for _, previous_student in unchanged], dtype=np.int64)
+        previous_counts = np.cumsum(previous_inserted, axis=1)
+        previous_counts = np.hstack([np.zeros((len(self.subjects), 1), dtype=np.int64), previous_counts])[
+            :, previous_students]
+        unchanged_counts = np.cumsum(previous_inserted[:, previous_students], axis=1)
+        unchanged_counts = np.hstack([np.zeros((len(self.subjects), 1), dtype=np.int64), unchanged_counts])
+        full_before = previous_counts >= self.max_students[:, None]
+        selected = self.selected[:, students]
+        self.assigned[:, students] = previous_inserted[:, previous_students] == 1
+
+        difference = np.zeros(len(self.subjects), dtype=np.int64)
+        moved = set()
+        position = 0
+        for changed_student in sorted(changed) + [len(self.student_columns)]:
+            end = int(np.searchsorted(students, changed_student))
+            while position < end:
+                counts = unchanged_counts[:, position:end] + difference[:, None]
+                differs = ((full_before[:, position:end] != (counts >= self.max_students[:, None]))
+                           & selected[:, position:end]).any(axis=0)
+                if not differs.any():
+                    break
+                position += int(differs.argmax())
+                self.cascade += 1
+                if self.cascade > self.cascade_limit:
+                    return None
+                student = students[position]
+                self.assigned[:, student] = False
+                self.counts = unchanged_counts[:, position] + difference
+                self.insert_student(student)
+                change = self.assigned[:, student].astype(np.int64) - previous_inserted[:, previous_students[position]]
+                if change.any():
+                    difference += change
+                    moved.add(int(student))
+                position += 1
+            position = end
+            if changed_student < len(self.student_columns):
+                self.counts = unchanged_counts[:, position] + difference
+                self.insert_student(changed_student)
+                difference += self.assigned[:, changed_student]
+        self.counts = unchanged_counts[:, -1] + difference
+        return moved
+
+    def is_elimination_unchanged(self, state, moved, previous_moved):
+        """
+        Whether elimination moves the same students as in the previous state: every subject
+        of a moved student is offered without elimination in both runs, and is either full
+        from the start or never fills up in both.
+        """
+        previous_inserted = state['inserted']
+        touched = self.inserted[:, moved].any(axis=1) | previous_inserted[:, previous_moved].any(axis=1)
+        previous_counts = previous_inserted.sum(axis=1)
+        counts = self.inserted.sum(axis=1)
+        # Students the previous elimination moved into each subject
+        received = state['assigned'].sum(axis=1) - previous_counts
+        minimum = np.maximum(self.min_students, 1)
+        safe = ((previous_counts >= minimum) & (counts >= minimum)
+                & (((previous_counts >= self.max_students) & (counts >= self.max_students))
+                   | ((previous_counts + received < self.max_students) & (counts + received < self.max_students))))
+        return bool(safe[touched].all())
@@ -0,0 +1,277 @@
+"""
+Allocation as a min-cost flow problem, an alternative to the greedy GenericAlgorithm.
+
+The flow network is
+
+    source -> student (capacity: desired number of subjects, cost 0)
+    student -> subject (capacity 1 for every selected subject, cost: the priority)
+    subject -> sink (capacity: max_students)
+
+and every unit of flow is one student getting one subject. Every unit also earns a bonus
+larger than any possible sum of priorities, so the minimum cost flow first gives as many
+subjects as possible, up to every student's desired number, and then the most preferred
+ones (the smallest sum of priorities).
+
+The flow is built by successive shortest paths. Students are many but subjects are few,
+so the residual graph is contracted to the subjects: an edge b -> c is the cheapest
+student who has b and could take c instead, computed for all pairs at once with NumPy,
+and shortest paths on the contracted graph come from a Bellman-Ford of O(subjects^3).
+
+Whether a subject is offered at all is not expressible as a flow, so min_students is
+enforced around it. After every solve the under-subscribed subject with the fewest
+students (the lowest in priority sum order on ties, like the greedy elimination from the
+bottom) is either kept, by giving every student it needs to reach its minimum a bonus
+outweighing everything else, or closed, releasing its students. Both are tried and the
+one giving more subjects, then the smaller sum of priorities, wins. This repeats until
+every offered subject has enough students. Both changes can leave negative cycles in the
+residual graph (a released student who should now replace someone), which are cancelled
+before the flow is re-optimised.
+
+The flow itself is optimal, but choosing the offered subjects one at a time is a heuristic:
+with minimums set, another choice of subjects can occasionally allocate better.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_STUDENTS = 24
+
+
+class MinCostFlowAllocationEngine:
+    def __init__(self, df_of_priorities, desired_number_of_subjects, min_students_per_subject,
+                 max_students_per_subject):
+        """
+        Same arguments as NumpyAllocationEngine
+        :param df_of_priorities: subjects x students priority frame, NaN where a subject was not selected
+        :param desired_number_of_subjects: callable returning the desired subject count of a student
+        :param min_students_per_subject: dict of subject name -> minimum students
+        :param max_students_per_subject: dict of subject name -> maximum students
+        """
+        self.student_columns = [col for col in df_of_priorities.columns
+                                if col not in ['number_of_students', 'priority_sum']
+                                and not str(col).startswith('Unnamed')]
+
+        values = df_of_priorities.to_numpy(dtype=float)
+        # Result rows and ties keep the greedy order: ascending sum of priorities
+        order = np.argsort(np.nansum(values, axis=1), kind='stable')
+        self.subjects = [df_of_priorities.index[i] for i in order]
+        column_positions = [df_of_priorities.columns.get_loc(col) for col in self.student_columns]
+        values = values[order][:, column_positions]
+
+        self.selected = ~np.isnan(values)
+        self.priorities = np.where(self.selected, values, np.inf)
+        self.assigned = np.zeros(values.shape, dtype=bool)
+        self.counts = np.zeros(len(self.subjects), dtype=np.int64)
+        self.loads = np.zeros(len(self.student_columns), dtype=np.int64)
+        self.offered = np.ones(len(self.subjects), dtype=bool)
+        # Offered subjects whose min_students are enforced by the flow
+        self.kept = np.zeros(len(self.subjects), dtype=bool)
+        self.min_students = np.array([min_students_per_subject.get(subject, 0) for subject in self.subjects],
+                                     dtype=np.int64)
+        self.max_students = np.array([max_students_per_subject.get(subject, DEFAULT_MAX_STUDENTS)
+                                      for subject in self.subjects], dtype=np.int64)
+        self.desired_counts = np.array([desired_number_of_subjects(student) for student in self.student_columns],
+                                       dtype=np.int64)
+
+        # One more subject given beats any change of the sum of priorities, and one more student
+        # towards the minimum of a kept subject beats any number of subjects given
+        max_priority = float(np.nanmax(values)) if self.selected.any() else 1.0
+        units = float(np.minimum(self.desired_counts, self.selected.sum(axis=0)).sum())
+        self.subject_bonus = units * max_priority + 1
+        self.minimum_bonus = units * (self.subject_bonus + max_priority) + 1
+        # Cost of the student -> subject arcs
+        self.costs = self.priorities - self.subject_bonus
+
+        subject_count = len(self.subjects)
+        self.source, self.sink = subject_count, subject_count + 1
+
+    def get_residual_graph(self):
+        """
+        Weights of the contracted residual graph on the nodes subject 0..n-1, source and sink,
+        and the student each subject edge goes through (-1 for the edges to or from the sink)
+        """
+        node_count = len(self.subjects) + 2
+        weights = np.full((node_count, node_count), np.inf)
+        students = np.full((node_count, node_count), -1, dtype=np.int64)
+        offered = np.flatnonzero(self.offered)
+        if not len(offered):
+            return weights, students
+
+        # Subjects a student could still be given, cost of giving them
+        can_take = self.selected & ~self.assigned
+        can_take[~self.offered] = False
+        take_costs = np.where(can_take, self.costs, np.inf)
+
+        # source -> c: a student with fewer subjects than desired takes c
+        spare_costs = np.where(self.loads < self.desired_counts, take_costs, np.inf)
+        cheapest = spare_costs.argmin(axis=1)
+        weights[self.source, :-2] = spare_costs[np.arange(len(self.subjects)), cheapest]
+        students[self.source, :-2] = cheapest
+
+        for subject in offered:
+            holders = np.flatnonzero(self.assigned[subject])
+            if not len(holders):
+                continue
+            # c -> source: a student gives c back
+            giving_back = holders[self.costs[subject, holders].argmax()]
+            weights[subject, self.source] = -self.costs[subject, giving_back]
+            students[subject, self.source] = giving_back
+            # subject -> c: a student swaps subject for c
+            swap_costs = take_costs[:, holders] - self.costs[subject, holders]
+            cheapest = swap_costs.argmin(axis=1)
+            weights[subject, :-2] = swap_costs[np.arange(len(self.subjects)), cheapest]
+            students[subject, :-2] = holders[cheapest]
+        np.fill_diagonal(weights[:-2, :-2], np.inf)
+
+        # c -> sink: one more student for c, sink -> c: one student less
+        counts, kept = self.counts[offered], self.kept[offered]
+        below_minimum = kept & (counts < self.min_students[offered])
+        has_room = counts < self.max_students[offered]
+        weights[offered, self.sink] = np.where(has_room, np.where(below_minimum, -self.minimum_bonus, 0), np.inf)
+        at_most_minimum = kept & (counts <= self.min_students[offered])
+        weights[self.sink, offered] = np.where(counts == 0, np.inf, np.where(at_most_minimum, self.minimum_bonus, 0))
+        return weights, students
+
+    @staticmethod
+    def find_shortest_paths(weights, start=None):
+        """
+        Bellman-Ford from start, or from every node at once when start is None (to find negative cycles).
+        Returns (distances, predecessors, node relaxed in the last round or None).
+        """
+        node_count = len(weights)
+        distances = np.zeros(node_count) if start is None else np.full(node_count, np.inf)
+        if start is not None:
+            distances[start] = 0
+        predecessors = np.full(node_count, -1, dtype=np.int64)
+        nodes = np.arange(node_count)
+        for _ in range(node_count):
+            candidates = distances[:, None] + weights
+            best = candidates.argmin(axis=0)
+            improved = candidates[best, nodes] < distances
+            if not improved.any():
+                return distances, predecessors, None
+            distances[improved] = candidates[best, nodes][improved]
+            predecessors[improved] = best[improved]
+        return distances, predecessors, int(np.flatnonzero(improved)[0])
+
+    def find_negative_cycle(self, weights):
+        """Nodes of a negative cycle of the residual graph in edge order, or None"""
+        _, predecessors, relaxed = self.find_shortest_paths(weights)
+        if relaxed is None:
+            return None
+        # Walking back len(weights) steps from a node relaxed last always ends on the cycle
+        node = relaxed
+        for _ in range(len(weights)):
+            node = predecessors[node]
+        cycle = [node]
+        while True:
+            node = predecessors[node]
+            if node == cycle[0]:
+                break
+            cycle.append(node)
+        # cycle lists the nodes backwards, from a node to its predecessors
+        return [cycle[0]] + cycle[:0:-1] + [cycle[0]]
+
+    def augment(self, nodes, students):
+        """Push one unit of flow along consecutive nodes of the contracted graph"""
+        for start, end in zip(nodes, nodes[1:]):
+            if start == self.sink or end == self.sink:
+                continue
+            student = students[start, end]
+            if start != self.source:
+                self.assigned[start, student] = False
+                self.counts[start] -= 1
+            else:
+                self.loads[student] += 1
+            if end != self.source:
+                self.assigned[end, student] = True
+                self.counts[end] += 1
+            else:
+                self.loads[student] -= 1
+
+    def cancel_negative_cycles(self):
+        while True:
+            weights, students = self.get_residual_graph()
+            cycle = self.find_negative_cycle(weights)
+            if cycle is None:
+                return
+            self.augment(cycle, students)
+
+    def solve(self):
+        """Successive shortest paths while a path still lowers the cost"""
+        while True:
+            weights, students = self.get_residual_graph()
+            distances, predecessors, _ = self.find_shortest_paths(weights, self.source)
+            if not distances[self.sink] < 0:
+                return
+            path = [self.sink]
+            while path[-1] != self.source:
+                path.append(predecessors[path[-1]])
+            self.augment(path[::-1], students)
+
+    def close_subject(self, subject):
+        """Stop offering a subject and release its students"""
+        holders = np.flatnonzero(self.assigned[subject])
+        self.assigned[subject] = False
+        self.loads[holders] -= 1
+        self.counts[subject] = 0
+        self.offered[subject] = False
+        self.kept[subject] = False
+
+    def get_state(self):
+        return tuple(array.copy() for array in (self.assigned, self.counts, self.loads, self.offered, self.kept))
+
+    def set_state(self, state):
+        self.assigned, self.counts, self.loads, self.offered, self.kept = (array.copy() for array in state)
+
+    def get_score(self):
+        """Smaller is better: the most subjects given, then the smallest sum of priorities"""
+        return -int(self.counts.sum()), float(self.priorities[self.assigned].sum())
+
+    def get_under_subscribed_subjects(self):
+        return np.flatnonzero(self.offered & ((self.counts == 0) | (self.counts < self.min_students)))
+
+    def keep_or_close(self, subject):
+        """Keep or close an under-subscribed subject, whichever allocates better, see the module docstring"""
+        initial_state = self.get_state()
+        kept_state = None
+        if not self.kept[subject]:
+            self.kept[subject] = True
+            self.cancel_negative_cycles()
+            self.solve()
+            if self.counts[subject] >= self.min_students[subject]:
+                kept_state, kept_score = self.get_state(), self.get_score()
+            self.set_state(initial_state)
+
+        self.close_subject(subject)
+        self.cancel_negative_cycles()
+        self.solve()
+        if kept_state is not None and kept_score <= self.get_score():
+            self.set_state(kept_state)
+
+    def run(self):
+        # Subjects selected by fewer students than their minimum, or whose minimum is above their
+        # maximum, can never be offered
+        unreachable = (self.selected.sum(axis=1) < np.maximum(self.min_students, 1)) | \
+            (self.min_students > self.max_students)
+        for subject in np.flatnonzero(unreachable):
+            self.close_subject(subject)
+        self.solve()
+        under_subscribed = self.get_under_subscribed_subjects()
+        while len(under_subscribed):
+            empty = under_subscribed[self.counts[under_subscribed] == 0]
+            if len(empty):
+                # Nobody is moved by closing an empty subject
+                for subject in empty:
+                    self.close_subject(subject)
+                self.solve()
+            else:
+                # The fewest students first, then the bottom of the priority sum order
+                self.keep_or_close(under_subscribed[np.lexsort((-under_subscribed,
+                                                                self.counts[under_subscribed]))[0]])
+            under_subscribed = self.get_under_subscribed_subjects()
+        return self.get_result_df()
+
+    def get_result_df(self):
+        rows = np.flatnonzero(self.offered)
+        return pd.DataFrame(self.assigned[rows].astype(int), index=[self.subjects[i] for i in rows],
+                            columns=self.student_columns)
@@ -0,0 +1,127 @@
+"""
+NumPy implementation of the GenericAlgorithm allocation.
+
+The priority matrix, the assignment bitmap and the per-subject counters are kept in
+NumPy arrays indexed by position, with index maps translating subject and student
+labels. Counters are updated incrementally on every assignment, so capacity checks
+are O(1), and a DataFrame is only built once the allocation has finished.
+
+The allocation rules are exactly the ones of GenericAlgorithm (see the module
+docstring of apps.algorithm), so both engines produce the same result_df.
+"""
+import heapq
+
+import numpy as np
+import pandas as pd
+
+# Priority given to a subject once it has been assigned, so it sorts last
+ASSIGNED_PRIORITY = 999
+DEFAULT_MAX_STUDENTS = 24
+
+
+class NumpyAllocationEngine:
+    def __init__(self, df_of_priorities, desired_number_of_subjects, min_students_per_subject,
+                 max_students_per_subject):
+        """
+        :param df_of_priorities: subjects x students priority frame, NaN where a subject was not selected
+        :param desired_number_of_subjects: callable returning the desired subject count of a student
+        :param min_students_per_subject: dict of subject name -> minimum students
+        :param max_students_per_subject: dict of subject name -> maximum students
+        """
+        self.student_columns = [col for col in df_of_priorities.columns
+                                if col not in ['number_of_students', 'priority_sum']
+                                and not str(col).startswith('Unnamed')]
+
+        values = df_of_priorities.to_numpy(dtype=float)
+        # Subjects are processed in ascending order of the sum of their priorities
+        order = np.argsort(np.nansum(values, axis=1), kind='stable')
+        self.subjects = [df_of_priorities.index[i] for i in order]
+        self.subject_index = {subject: i for i, subject in enumerate(self.subjects)}
+        self.student_index = {student: j for j, student in enumerate(self.student_columns)}
+
+        column_positions = [df_of_priorities.columns.get_loc(col) for col in self.student_columns]
+        values = values[order][:, column_positions]
+        self.selected = ~np.isnan(values)
+        self.priorities = np.where(self.selected, values, 0).astype(np.int64)
+        self.assigned = np.zeros(self.priorities.shape, dtype=bool)
+
+        self.counts = np.zeros(len(self.subjects), dtype=np.int64)
+        self.active = np.ones(len(self.subjects), dtype=bool)
+        self.min_students = np.array([min_students_per_subject.get(subject, 0) for subject in self.subjects],
+                                     dtype=np.int64)
+        self.max_students = np.array([max_students_per_subject.get(subject, DEFAULT_MAX_STUDENTS)
+                                      for subject in self.subjects], dtype=np.int64)
+        self.desired_counts = np.array([desired_number_of_subjects(student) for student in self.student_columns],
+                                       dtype=np.int64)
+
+    def subjects_in_priority_order(self, student):
+        """Positions of the subjects a student selected, most preferred first."""
+        rows = np.flatnonzero(self.selected[:, student])
+        return rows[np.argsort(self.priorities[rows, student], kind='stable')]
+
+    def is_subject_at_capacity(self, subject):
+        return self.counts[subject] >= self.max_students[subject]
+
+    def assign(self, subject, student):
+        if not self.assigned[subject, student]:
+            self.assigned[subject, student] = True
+            self.counts[subject] += 1
+        self.priorities[subject, student] = ASSIGNED_PRIORITY
+
+    def insert_student(self, student):
+        """Give a student their most preferred subjects that still have room"""
+        assigned_count = 0
+        for subject in self.subjects_in_priority_order(student):
+            if assigned_count >= self.desired_counts[student]:
+                break
+            if not self.is_subject_at_capacity(subject):
+                self.assign(subject, student)
+                assigned_count += 1
+
+    def insert_from_priority_to_result(self):
+        for student in range(len(self.student_columns)):
+            self.insert_student(student)
+
+    def arrange_priority_for_a_particular_student(self, student):
+        # Give the student the first surviving subject that still has room
+        for subject in self.subjects_in_priority_order(student):
+            if self.active[subject] and not self.is_subject_at_capacity(subject):
+                self.assign(subject, student)
+                break
+
+    def is_under_subscribed(self, subject):
+        current_count = self.counts[subject]
+        return current_count == 0 or current_count < self.min_students[subject]
+
+    def start_eliminating_from_bottom(self):
+        """
+        Event-driven elimination, see GenericAlgorithm.start_eliminating_from_bottom.
+        Under-subscribed subjects are popped bottom first from a heap and re-checked
+        against their live count.
+        """
+        under_subscribed = [-subject for subject in range(len(self.subjects)) if self.is_under_subscribed(subject)]
+        heapq.heapify(under_subscribed)
+
+        eliminated_any = False
+        while under_subscribed:
+            subject = -heapq.heappop(under_subscribed)
+            if not self.is_under_subscribed(subject):
+                continue
+            displaced_students = np.flatnonzero(self.assigned[subject])
+            self.active[subject] = False
+            self.assigned[subject] = False
+            self.counts[subject] = 0
+            eliminated_any = True
+            for student in displaced_students:
+                self.arrange_priority_for_a_particular_student(student)
+        return eliminated_any
+
+    def run(self):
+        self.insert_from_priority_to_result()
+        self.start_eliminating_from_bottom()
+        return self.get_result_df()
+
+    def get_result_df(self):
+        rows = np.flatnonzero(self.active)
+        return pd.DataFrame(self.assigned[rows].astype(int), index=[self.subjects[i] for i in rows],
+                            columns=self.student_columns)
@@ -0,0 +1,81 @@
+"""
+Compact binary form of an allocation result, used by the allocation cache.
+
+A result_df (subject names x student ids, 1 where a student got a subject) is stored as:
+
+    header         24 bytes, little endian: magic b'PMSA', format version (uint16), unused
+                   (uint16), subject count, student count and subject names length (uint32 each)
+    student ids    int64 per student, in result_df column order
+    assignments    one bitset per subject, ceil(students / 8) bytes each, the bit of the
+                   n-th student being bit n % 8 of byte n // 8
+    subject names  UTF-8 JSON list, in result_df row order
+
+PackedAllocation reads the ids and bitsets with numpy.frombuffer, without copying the
+data, and only unpacks the assignments or builds the result_df when they are used.
+"""
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'PMSA'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHIII4x')
+
+
+def pack_allocation(result_df):
+    """Bytes of a result_df in the format of the module docstring"""
+    subjects = [str(subject) for subject in result_df.index]
+    student_ids = np.asarray(result_df.columns, dtype='<i8')
+    assigned = result_df.to_numpy() == 1
+    bitsets = np.packbits(assigned.reshape(len(subjects), len(student_ids)), axis=1, bitorder='little')
+    subject_names = json.dumps(subjects).encode()
+    return b''.join([
+        HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(subjects), len(student_ids), len(subject_names)),
+        student_ids.tobytes(),
+        bitsets.tobytes(),
+        subject_names,
+    ])
+
+
+class PackedAllocation:
+    def __init__(self, data):
+        """
+        :param data: bytes (or any buffer) written by pack_allocation, read in place
+        """
+        magic, version, _, subject_count, student_count, names_length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('Not a packed allocation of format version %d' % FORMAT_VERSION)
+        self.data = data
+        self.subject_count = subject_count
+        self.student_count = student_count
+        self.row_bytes = (student_count + 7) // 8
+        offset = HEADER.size
+        self.student_ids = np.frombuffer(data, dtype='<i8', count=student_count, offset=offset)
+        offset += self.student_ids.nbytes
+        self.bitsets = np.frombuffer(data, dtype=np.uint8, count=subject_count * self.row_bytes,
+                                     offset=offset).reshape(subject_count, self.row_bytes)
+        self.names_offset = offset + self.bitsets.nbytes
+        self.names_length = names_length
+        self._subjects = None
+        self._assigned = None
+
+    @property
+    def subjects(self):
+        if self._subjects is None:
+            names = bytes(memoryview(self.data)[self.names_offset:self.names_offset + self.names_length])
+            self._subjects = json.loads(names)
+        return self._subjects
+
+    @property
+    def assigned(self):
+        """Boolean subjects x students matrix of the assignments"""
+        if self._assigned is None:
+            self._assigned = np.unpackbits(self.bitsets, axis=1, count=self.student_count,
+                                           bitorder='little').astype(bool)
+        return self._assigned
+
+    def to_result_df(self):
+        return pd.DataFrame(self.assigned.astype(int), index=self.subjects,
+                            columns=pd.Index(self.student_ids, dtype=np.int64))
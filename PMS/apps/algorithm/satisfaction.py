@@ -0,0 +1,45 @@
+"""
+Satisfaction metrics of an allocation, used to compare the allocation engines.
+"""
+import numpy as np
+
+
+def get_satisfaction_metrics(df_of_priorities, result_df, desired_number_of_subjects):
+    """
+    :param df_of_priorities: subjects x students priority frame the allocation was computed from
+        (a fresh one, GenericAlgorithm marks assigned subjects in its own copy)
+    :param result_df: the allocation, 1 where a student got a subject
+    :param desired_number_of_subjects: callable returning the desired subject count of a student
+    """
+    students = [col for col in df_of_priorities.columns if not str(col).startswith('Unnamed')]
+    if df_of_priorities.empty or not students:
+        return {'students': 0, 'subjects_offered': 0, 'subjects_closed': len(df_of_priorities.index), 'demand': 0,
+                'assignments': 0, 'unmet_demand': 0, 'fully_satisfied_students': 0, 'students_without_subject': 0,
+                'first_choice_share': 0.0, 'mean_priority': None, 'priority_sum': 0.0}
+    priorities = df_of_priorities[students].to_numpy(dtype=float)
+    selected = ~np.isnan(priorities)
+    if result_df is None or result_df.empty:
+        assigned = np.zeros(priorities.shape, dtype=bool)
+    else:
+        assigned = result_df.reindex(index=df_of_priorities.index, columns=students, fill_value=0).to_numpy() == 1
+
+    # A student can not get more subjects than they selected
+    demand = np.minimum([desired_number_of_subjects(student) for student in students], selected.sum(axis=0))
+    received = assigned.sum(axis=0)
+    assigned_priorities = priorities[assigned]
+    first_choices = np.where(selected, priorities, np.inf).argmin(axis=0)
+    got_first_choice = assigned[first_choices, np.arange(len(students))] & selected.any(axis=0)
+
+    return {
+        'students': len(students),
+        'subjects_offered': 0 if result_df is None else len(result_df.index),
+        'subjects_closed': len(df_of_priorities.index) - (0 if result_df is None else len(result_df.index)),
+        'demand': int(demand.sum()),
+        'assignments': int(received.sum()),
+        'unmet_demand': int(np.maximum(demand - received, 0).sum()),
+        'fully_satisfied_students': int((received >= demand).sum()),
+        'students_without_subject': int(((received == 0) & (demand > 0)).sum()),
+        'first_choice_share': float(got_first_choice.mean()) if len(students) else 0.0,
+        'mean_priority': float(assigned_priorities.mean()) if len(assigned_priorities) else None,
+        'priority_sum': float(assigned_priorities.sum()),
+    }
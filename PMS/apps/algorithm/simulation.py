@@ -0,0 +1,184 @@
+"""
+What-if simulation of subject capacities and thresholds.
+
+The priorities of a batch/semester/stream are loaded once into SimulationInputs (see
+apps.course.services.simulate_allocation), and the scenarios of a grid are allocated from
+that one matrix in a process pool. Each worker receives the matrix once, when it starts.
+A scenario overrides min_students and max_students of every subject or of single subjects:
+
+    {'min_students': 10, 'max_students': 30, 'subjects': {'Blockchain': {'max_students': 40}}}
+
+A grid lists the values to try for each of them and expands to every combination:
+
+    {'min_students': [5, 10, 15], 'max_students': [24, 30], 'subjects': {'Blockchain': {'max_students': [20, 40]}}}
+
+Nothing is saved. Every scenario reports the subjects that would run and the satisfaction
+metrics of apps.algorithm.satisfaction.
+"""
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from apps.algorithm.min_cost_flow import MinCostFlowAllocationEngine
+from apps.algorithm.numpy_engine import NumpyAllocationEngine
+from apps.algorithm.satisfaction import get_satisfaction_metrics
+
+# The pandas engine is simulated by the NumPy engine, which gives the same allocation faster
+SIMULATION_ENGINES = {
+    'pandas': NumpyAllocationEngine,
+    'numpy': NumpyAllocationEngine,
+    'min_cost_flow': MinCostFlowAllocationEngine,
+}
+LIMIT_NAMES = ('min_students', 'max_students')
+DEFAULT_MAX_SCENARIOS = 100
+
+
+class SimulationInputs:
+    def __init__(self, df_of_priorities, desired_counts, min_students_per_subject, max_students_per_subject,
+                 engine='pandas'):
+        """
+        :param df_of_priorities: subjects x students priority frame of GenericAlgorithm
+        :param desired_counts: dict of student id -> desired number of subjects
+        :param min_students_per_subject: dict of subject name -> current minimum students
+        :param max_students_per_subject: dict of subject name -> current maximum students
+        """
+        self.df_of_priorities = df_of_priorities
+        self.desired_counts = desired_counts
+        self.min_students_per_subject = min_students_per_subject
+        self.max_students_per_subject = max_students_per_subject
+        self.engine = engine
+
+
+def get_grid_values(values, name):
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    if not values:
+        raise ValueError('No values given for %s' % name)
+    for value in values:
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ValueError('%s must be whole numbers of at least 0, got %r' % (name, value))
+    return list(values)
+
+
+def expand_grid(grid, inputs, max_scenarios=DEFAULT_MAX_SCENARIOS):
+    """
+    Every scenario of a grid, see the module docstring. Raises ValueError for an invalid grid,
+    including one with a scenario whose maximum students of a subject is not above its minimum
+    :param inputs: SimulationInputs the scenarios are run on
+    """
+    if not isinstance(grid, dict):
+        raise ValueError('The grid must be an object')
+    unknown = set(grid) - set(LIMIT_NAMES) - {'subjects'}
+    if unknown:
+        raise ValueError('Unknown grid settings: %s' % ', '.join(sorted(map(str, unknown))))
+
+    subject_names = list(inputs.df_of_priorities.index)
+    # (subject name or None for every subject, limit name) -> values
+    axes = [((None, name), get_grid_values(grid[name], name)) for name in LIMIT_NAMES if name in grid]
+    subjects = grid.get('subjects') or {}
+    if not isinstance(subjects, dict):
+        raise ValueError('subjects must map subject names to their settings')
+    for subject, limits in subjects.items():
+        if subject not in subject_names:
+            raise ValueError('Unknown subject %r' % subject)
+        if not isinstance(limits, dict) or set(limits) - set(LIMIT_NAMES):
+            raise ValueError('The settings of %s can only be %s' % (subject, ' and '.join(LIMIT_NAMES)))
+        axes.extend(((subject, name), get_grid_values(values, '%s of %s' % (name, subject)))
+                    for name, values in limits.items())
+
+    scenario_count = 1
+    for _, values in axes:
+        scenario_count *= len(values)
+    if scenario_count > max_scenarios:
+        raise ValueError('The grid has %d scenarios, at most %d can be simulated at once'
+                         % (scenario_count, max_scenarios))
+
+    scenarios = []
+    for combination in itertools.product(*(values for _, values in axes)):
+        scenario = {}
+        for ((subject, name), _), value in zip(axes, combination):
+            if subject is None:
+                scenario[name] = value
+            else:
+                scenario.setdefault('subjects', {}).setdefault(subject, {})[name] = value
+        check_scenario_limits(inputs, scenario)
+        scenarios.append(scenario)
+    return scenarios
+
+
+def describe_scenario(scenario):
+    parts = ['%s %d' % (name.split('_')[0], scenario[name]) for name in LIMIT_NAMES if name in scenario]
+    for subject, limits in scenario.get('subjects', {}).items():
+        parts.extend('%s %s %d' % (subject, name.split('_')[0], value) for name, value in limits.items())
+    return ', '.join(parts) or 'Current settings'
+
+
+def get_scenario_limits(inputs, scenario):
+    """(min_students_per_subject, max_students_per_subject) of a scenario"""
+    subjects = list(inputs.df_of_priorities.index)
+    limits = []
+    for name, current in zip(LIMIT_NAMES, (inputs.min_students_per_subject, inputs.max_students_per_subject)):
+        values = {subject: scenario[name] for subject in subjects} if name in scenario else dict(current)
+        for subject, subject_limits in scenario.get('subjects', {}).items():
+            if name in subject_limits:
+                values[subject] = subject_limits[name]
+        limits.append(values)
+    return tuple(limits)
+
+
+def check_scenario_limits(inputs, scenario):
+    """Raise ValueError if a scenario lets max_students <= min_students, like ElectiveSubject.clean"""
+    min_students, max_students = get_scenario_limits(inputs, scenario)
+    invalid = [subject for subject in inputs.df_of_priorities.index
+               if subject in min_students and subject in max_students
+               and max_students[subject] <= min_students[subject]]
+    if invalid:
+        raise ValueError('%s: maximum students must be greater than minimum students for %s'
+                         % (describe_scenario(scenario), ', '.join(map(str, invalid))))
+
+
+def simulate_scenario(inputs, scenario):
+    """Allocate one scenario, returns a JSON serializable row of the comparison table"""
+    start = time.perf_counter()
+    min_students, max_students = get_scenario_limits(inputs, scenario)
+    engine = SIMULATION_ENGINES[inputs.engine](inputs.df_of_priorities, inputs.desired_counts.get, min_students,
+                                               max_students)
+    result_df = engine.run()
+    metrics = get_satisfaction_metrics(inputs.df_of_priorities, result_df, inputs.desired_counts.get)
+    return dict(metrics,
+                scenario=scenario,
+                label=describe_scenario(scenario),
+                subjects=[{'name': subject, 'students': int(count)}
+                          for subject, count in (result_df == 1).sum(axis=1).items()],
+                milliseconds=(time.perf_counter() - start) * 1000)
+
+
+# Inputs of a pool worker, sent once by initialize_worker
+worker_inputs = None
+
+
+def initialize_worker(inputs):
+    global worker_inputs
+    worker_inputs = inputs
+
+
+def simulate_worker_scenario(scenario):
+    return simulate_scenario(worker_inputs, scenario)
+
+
+def run_simulation(inputs, scenarios, workers=None):
+    """
+    Simulate scenarios in a pool of worker processes (os.cpu_count() by default), in order.
+    A single scenario or worker runs in this process.
+
+    Workers are started fresh rather than forked, since this runs inside a web server thread
+    whose locks and database connections a fork would copy. They only need the inputs.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(scenarios))
+    if workers <= 1:
+        return [simulate_scenario(inputs, scenario) for scenario in scenarios]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=initialize_worker, initargs=(inputs,)) as executor:
+        return list(executor.map(simulate_worker_scenario, scenarios))
@@ -0,0 +1,269 @@
+import os
+from glob import glob
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.algorithm.allocation_cache import get_allocation_cache
+from apps.algorithm.generic_algorithm import GenericAlgorithm
+from apps.algorithm.incremental import IncrementalAllocationEngine
+from apps.algorithm.min_cost_flow import MinCostFlowAllocationEngine
+from apps.algorithm.numpy_engine import NumpyAllocationEngine
+from apps.algorithm.packed_allocation import PackedAllocation, pack_allocation
+from apps.algorithm.simulation import SimulationInputs, expand_grid
+from benchmarks import RESOURCES_DIR, load_excel_fixture
+
+# (min_students, max_students) settings the fixtures of resources/files are allocated with
+CAPACITY_SETTINGS = ((10, 24), (3, 8))
+
+
+@override_settings(INCREMENTAL_ALLOCATION_ENABLED=False)
+class FixtureAllocationTestCase(TestCase):
+    """Allocates every fixture of resources/files from scratch, without cached or repaired results"""
+
+    def setUp(self):
+        get_allocation_cache().clear()
+
+    def run_engine(self, batch, semester, stream, engine):
+        get_allocation_cache().clear()
+        algorithm = GenericAlgorithm(batch, semester, stream, engine=engine)
+        algorithm.run()
+        return algorithm
+
+    def for_each_fixture(self, check):
+        """Call check(batch, semester, stream) on each fixture and capacity setting, in a rolled back transaction"""
+        paths = sorted(glob(os.path.join(RESOURCES_DIR, '*.xlsx')))
+        self.assertTrue(paths)
+        for path in paths:
+            file_name = os.path.basename(path)
+            for min_students, max_students in CAPACITY_SETTINGS:
+                with self.subTest(fixture=file_name, min_students=min_students, max_students=max_students), \
+                        transaction.atomic():
+                    check(*load_excel_fixture(file_name, min_students=min_students, max_students=max_students))
+                    transaction.set_rollback(True)
+
+    def assert_same_allocation(self, expected_df, result_df):
+        self.assertEqual(list(expected_df.index), list(result_df.index))
+        self.assertEqual(list(expected_df.columns), list(result_df.columns))
+        self.assertTrue((expected_df.astype(int).values == result_df.astype(int).values).all())
+
+
+class NumpyEngineTests(FixtureAllocationTestCase):
+    def test_same_allocation_as_pandas_engine(self):
+        def check(batch, semester, stream):
+            pandas_result = self.run_engine(batch, semester, stream, 'pandas').result_df
+            numpy_result = self.run_engine(batch, semester, stream, 'numpy').result_df
+            self.assert_same_allocation(pandas_result, numpy_result)
+
+        self.for_each_fixture(check)
+
+    def test_same_elimination_as_pandas_engine(self):
+        def check(batch, semester, stream):
+            algorithm = GenericAlgorithm(batch, semester, stream)
+            if algorithm.df_of_priorities.empty:
+                return
+            engine = NumpyAllocationEngine(algorithm.df_of_priorities,
+                                           algorithm.get_desired_number_of_subjects_for_student,
+                                           algorithm.min_students_per_subject, algorithm.max_students_per_subject)
+            algorithm.insert_from_priority_to_result()
+            engine.insert_from_priority_to_result()
+            self.assertEqual(algorithm.start_eliminating_from_bottom(), engine.start_eliminating_from_bottom())
+            self.assertEqual(algorithm.eliminated_subjects,
+                             {engine.subjects[subject] for subject in np.flatnonzero(~engine.active)})
+            self.assert_same_allocation(algorithm.result_df, engine.get_result_df())
+
+        self.for_each_fixture(check)
+
+
+def make_priorities(selections):
+    """Subjects x students priority frame from {student id: [subjects in priority order]}"""
+    subjects = sorted({subject for chosen in selections.values() for subject in chosen})
+    df = pd.DataFrame(np.nan, index=subjects, columns=pd.Index(list(selections), dtype=np.int64))
+    for student, chosen in selections.items():
+        for priority, subject in enumerate(chosen, 1):
+            df.loc[subject, student] = priority
+    return df
+
+
+def make_random_priorities(rng, subject_count, student_count):
+    return make_priorities({student: ['S%d' % subject for subject in rng.permutation(subject_count)[
+        :rng.integers(1, subject_count + 1)]] for student in range(1, student_count + 1)})
+
+
+def choose_popular_subjects(rng, subject_count):
+    """Random priorities of one student, the first subjects being far more popular than the last ones"""
+    popularity = 0.6 ** np.arange(subject_count)
+    chosen = rng.choice(subject_count, size=int(rng.integers(2, 5)), replace=False, p=popularity / popularity.sum())
+    return ['S%d' % subject for subject in chosen]
+
+
+class MinCostFlowEngineTests(SimpleTestCase):
+    def allocate(self, df, desired_counts, min_students, max_students):
+        engine = MinCostFlowAllocationEngine(df, desired_counts.get, min_students, max_students)
+        return engine.run()
+
+    def assert_within_limits(self, df, result_df, desired_counts, min_students, max_students):
+        counts = result_df.sum(axis=1)
+        for subject in result_df.index:
+            self.assertLessEqual(counts[subject], max_students[subject], subject)
+            self.assertGreaterEqual(counts[subject], max(min_students[subject], 1), subject)
+        for student in result_df.columns:
+            self.assertLessEqual(result_df[student].sum(), desired_counts[student], student)
+        # Only selected subjects are given
+        self.assertFalse(((result_df.values == 1) & df.loc[result_df.index, result_df.columns].isna().values).any())
+
+    def test_minimum_equal_to_maximum_fills_subject_exactly(self):
+        df = make_priorities({student: ['A', 'B'] for student in range(1, 6)})
+        desired_counts = dict.fromkeys(df.columns, 1)
+        min_students, max_students = {'A': 3, 'B': 2}, {'A': 3, 'B': 2}
+        result_df = self.allocate(df, desired_counts, min_students, max_students)
+        self.assertEqual(result_df.sum(axis=1).to_dict(), {'A': 3, 'B': 2})
+        self.assert_within_limits(df, result_df, desired_counts, min_students, max_students)
+
+    def test_subject_with_minimum_above_maximum_is_not_offered(self):
+        df = make_priorities({student: ['A', 'B'] for student in range(1, 6)})
+        desired_counts = dict.fromkeys(df.columns, 1)
+        min_students, max_students = {'A': 4, 'B': 1}, {'A': 3, 'B': 5}
+        result_df = self.allocate(df, desired_counts, min_students, max_students)
+        self.assertEqual(list(result_df.index), ['B'])
+        self.assert_within_limits(df, result_df, desired_counts, min_students, max_students)
+
+    def test_random_cohorts_respect_capacities_and_desired_counts(self):
+        rng = np.random.default_rng(0)
+        for case in range(300):
+            df = make_random_priorities(rng, int(rng.integers(2, 6)), int(rng.integers(1, 12)))
+            desired_counts = {student: int(rng.integers(1, 3)) for student in df.columns}
+            min_students = {subject: int(rng.integers(0, 5)) for subject in df.index}
+            max_students = {subject: int(rng.integers(1, 6)) for subject in df.index}
+            with self.subTest(case=case):
+                result_df = self.allocate(df, desired_counts, min_students, max_students)
+                self.assert_within_limits(df, result_df, desired_counts, min_students, max_students)
+
+
+class SimulationGridTests(SimpleTestCase):
+    def setUp(self):
+        df = make_priorities({1: ['Blockchain', 'Networking'], 2: ['Networking', 'Blockchain']})
+        self.inputs = SimulationInputs(df, dict.fromkeys(df.columns, 1), {'Blockchain': 10, 'Networking': 10},
+                                       {'Blockchain': 24, 'Networking': 24})
+
+    def test_grid_expands_to_every_combination(self):
+        scenarios = expand_grid({'min_students': [5, 10], 'subjects': {'Blockchain': {'max_students': [20, 40]}}},
+                                self.inputs)
+        self.assertEqual(len(scenarios), 4)
+        self.assertIn({'min_students': 10, 'subjects': {'Blockchain': {'max_students': 40}}}, scenarios)
+
+    def test_minimum_not_below_current_maximum_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'min 30: maximum students must be greater than minimum'):
+            expand_grid({'min_students': [10, 30]}, self.inputs)
+
+    def test_maximum_equal_to_minimum_of_one_subject_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'for Networking'):
+            expand_grid({'subjects': {'Networking': {'max_students': [10]}}}, self.inputs)
+
+
+class IncrementalAllocationTests(SimpleTestCase):
+    subject_count = 8
+    min_students = dict.fromkeys(['S%d' % subject for subject in range(subject_count)], 5)
+    max_students = dict.fromkeys(['S%d' % subject for subject in range(subject_count)], 15)
+
+    def make_engine(self, selections, desired_counts, cascade_limit=1000):
+        return IncrementalAllocationEngine(make_priorities(selections), desired_counts.get, self.min_students,
+                                           self.max_students, cascade_limit=cascade_limit)
+
+    def allocate_in_full(self, selections, desired_counts):
+        return NumpyAllocationEngine(make_priorities(selections), desired_counts.get, self.min_students,
+                                     self.max_students).run()
+
+    def get_state(self, selections, desired_counts):
+        engine = self.make_engine(selections, desired_counts)
+        engine.run()
+        return engine.get_state()
+
+    def test_repair_matches_full_run(self):
+        rng = np.random.default_rng(0)
+        repaired_count = 0
+        for case in range(60):
+            selections = {student: choose_popular_subjects(rng, self.subject_count) for student in range(1, 81)}
+            desired_counts = {student: int(rng.integers(1, 3)) for student in selections}
+            state = self.get_state(selections, desired_counts)
+
+            students = list(selections)
+            for student in rng.choice(students, size=int(rng.integers(0, 4)), replace=False):
+                del selections[student]
+            for student in rng.choice(list(selections), size=int(rng.integers(0, 4)), replace=False):
+                selections[student] = choose_popular_subjects(rng, self.subject_count)
+                desired_counts[student] = int(rng.integers(1, 3))
+            for student in range(81, 81 + int(rng.integers(0, 4))):
+                selections[student] = choose_popular_subjects(rng, self.subject_count)
+                desired_counts[student] = int(rng.integers(1, 3))
+
+            with self.subTest(case=case):
+                engine = self.make_engine(selections, desired_counts)
+                result_df = engine.repair(state)
+                if result_df is None:
+                    # Only a new order of the subjects, by their sum of priorities, needs a full run
+                    self.assertNotEqual(engine.subjects, state['subjects'])
+                    continue
+                repaired_count += 1
+                self.assertTrue(result_df.equals(self.allocate_in_full(selections, desired_counts)))
+        self.assertGreater(repaired_count, 30)
+
+    def test_unchanged_priorities_are_repaired_without_cascade(self):
+        rng = np.random.default_rng(1)
+        selections = {student: choose_popular_subjects(rng, self.subject_count) for student in range(1, 81)}
+        desired_counts = dict.fromkeys(selections, 1)
+        engine = self.make_engine(selections, desired_counts, cascade_limit=0)
+        result_df = engine.repair(self.get_state(selections, desired_counts))
+        self.assertTrue(result_df.equals(self.allocate_in_full(selections, desired_counts)))
+        self.assertEqual(engine.cascade, 0)
+
+    def test_cascade_above_limit_needs_full_run(self):
+        # S0 fills up with the first 15 students, the next ones get S1
+        selections = {student: ['S0', 'S1'] for student in range(1, 31)}
+        desired_counts = dict.fromkeys(selections, 1)
+        state = self.get_state(selections, desired_counts)
+        # The first student leaves S0, which the 16th student then gets
+        selections[1] = ['S1', 'S0']
+
+        engine = self.make_engine(selections, desired_counts, cascade_limit=1)
+        result_df = engine.repair(state)
+        self.assertEqual(engine.cascade, 1)
+        self.assertTrue(result_df.equals(self.allocate_in_full(selections, desired_counts)))
+        self.assertIsNone(self.make_engine(selections, desired_counts, cascade_limit=0).repair(state))
+
+
+class PackedAllocationTests(SimpleTestCase):
+    def assert_round_trip(self, result_df):
+        packed = PackedAllocation(pack_allocation(result_df))
+        unpacked_df = packed.to_result_df()
+        self.assertEqual(list(unpacked_df.index), list(result_df.index))
+        self.assertEqual(list(unpacked_df.columns), list(result_df.columns))
+        self.assertEqual(unpacked_df.columns.dtype, np.int64)
+        self.assertTrue((unpacked_df.values == result_df.values).all())
+        return packed
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+        # 13 students do not fill the last byte of the bitsets
+        result_df = pd.DataFrame(rng.integers(0, 2, (4, 13)), index=['Blockchain', 'Réseaux', 'AI', 'Big Data'],
+                                 columns=pd.Index(rng.choice(10 ** 6, 13, replace=False), dtype=np.int64))
+        self.assert_round_trip(result_df)
+
+    def test_empty_result(self):
+        packed = self.assert_round_trip(pd.DataFrame())
+        self.assertEqual((packed.subject_count, packed.student_count), (0, 0))
+
+    def test_subjects_without_students(self):
+        self.assert_round_trip(pd.DataFrame(np.zeros((2, 0), dtype=int), index=['Blockchain', 'AI'],
+                                            columns=pd.Index([], dtype=np.int64)))
+
+    def test_single_subject(self):
+        packed = self.assert_round_trip(pd.DataFrame([[1, 0, 1]], index=['Blockchain'],
+                                                     columns=pd.Index([7, 3, 11], dtype=np.int64)))
+        self.assertEqual(packed.subjects, ['Blockchain'])
+
+    def test_other_data_is_rejected(self):
+        with self.assertRaises(ValueError):
+            PackedAllocation(b'PMSB' + pack_allocation(pd.DataFrame())[4:])
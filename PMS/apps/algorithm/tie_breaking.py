@@ -0,0 +1,45 @@
+"""
+Order in which the allocation engines serve students.
+
+The greedy engines fill subjects student by student, so when a subject runs out of seats
+the students served first keep it. The min-cost flow engine picks the first student among
+equally good candidates. In both cases the students' column order in df_of_priorities is
+the tie-breaker, and it is set here from ElectiveSession.tie_breaking:
+
+    submission   the order of the students' first priority records (the upload order)
+    roll_number  ascending roll number
+    lottery      a random order drawn from the semester and its lottery_seed, the same on
+                 every run and every database, and different for every seed
+
+The order only depends on the students and the semester settings, never on the order in
+which a database returns rows, so identical inputs always give identical allocations.
+"""
+import hashlib
+
+TIE_BREAKING_ORDERS = ('submission', 'roll_number', 'lottery')
+
+
+def get_lottery_ticket(session_id, seed, roll_number):
+    """Position key of a student in the lottery of a semester"""
+    return hashlib.sha256(('%s:%s:%s' % (session_id, seed, roll_number)).encode()).hexdigest()
+
+
+def order_students(student_ids, student_metadata, tie_breaking='submission', session_id=None, seed=0):
+    """
+    Return student_ids (in submission order) sorted for the given tie_breaking
+    :param student_metadata: student id -> dict with the roll_number, see GenericAlgorithm.load_student_metadata
+    """
+    if tie_breaking not in TIE_BREAKING_ORDERS:
+        raise ValueError('Unknown tie-breaking order %r, expected one of %s'
+                         % (tie_breaking, ', '.join(TIE_BREAKING_ORDERS)))
+    if tie_breaking == 'submission':
+        return list(student_ids)
+
+    def get_roll_number(student_id):
+        metadata = student_metadata.get(student_id) or {}
+        return str(metadata.get('roll_number') or '').lower()
+
+    if tie_breaking == 'roll_number':
+        return sorted(student_ids, key=lambda student_id: (get_roll_number(student_id), student_id))
+    return sorted(student_ids, key=lambda student_id: (
+        get_lottery_ticket(session_id, seed, get_roll_number(student_id)), student_id))
@@ -1,5 +1,6 @@
 from django.contrib import admin
 # Register your models here.
+from django.contrib import messages
 from django.template.response import TemplateResponse
 from django.urls import path, reverse
 from django.utils.html import format_html
@@ -7,6 +8,7 @@ from django.utils.html import format_html
 from apps.authuser.models import StudentProxyModel
 from apps.course.forms import StreamForm
 from apps.course.models import ElectiveSubject, Stream, Batch, ElectiveSession, AcademicLevel
+from apps.system.jobs import enqueue_job
 from apps.utils import normalize_result
 
 
@@ -81,7 +83,15 @@ class LevelAdmin(admin.ModelAdmin):
 
 
 class ElectiveSessionAdmin(admin.ModelAdmin):
-    pass
+    actions = ['allocate_all_cohorts']
+
+    @admin.action(description='Allocate every batch and stream of the selected semesters')
+    def allocate_all_cohorts(self, request, queryset):
+        job = enqueue_job('allocate_cohorts', {'session_ids': list(queryset.values_list('pk', flat=True))},
+                          user=request.user)
+        self.message_user(request, format_html(
+            'Queued <a href="{}">{}</a>, the run_jobs worker allocates every cohort and saves the results.',
+            reverse('admin:system_job_change', args=[job.pk]), job), messages.SUCCESS)
 
 
 admin.site.register(ElectiveSubject, ElectiveSubjectAdmin)
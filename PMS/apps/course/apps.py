@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CourseConfig(AppConfig):
     name = 'apps.course'
     verbose_name = 'Institutional information'
+
+    def ready(self):
+        import apps.course.signals
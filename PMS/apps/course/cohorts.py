@@ -0,0 +1,163 @@
+"""
+Allocation of every cohort (batch and stream) of one or more semesters in one go.
+
+load_cohorts finds the cohorts with priorities and reads the priorities, subject limits
+and students of all of them in three queries, building each GenericAlgorithm from those
+inputs so its input_hash is the one a report would compute. allocate_cohorts runs the
+allocations in a process pool using every core, and saves each result as a new
+AllocationSnapshot, which the report and the downloads then read. A cohort whose latest
+snapshot was computed from the same inputs is skipped unless force is set, so manual
+edits are kept.
+"""
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+
+from apps.algorithm.generic_algorithm import GenericAlgorithm, CohortInputs, build_student_metadata
+from apps.course.models import AllocationSnapshot, Batch, ElectiveSession, ElectiveSubject, Stream
+from apps.course.snapshots import save_allocation_snapshot
+from apps.student.models import ElectivePriority
+from apps.utils import build_priority_dataframe
+
+
+def load_cohorts(sessions):
+    """
+    GenericAlgorithm of every (batch, semester, stream) with priorities in the given
+    semesters, in the order of batch, semester and stream ids
+    """
+    session_ids = [session.pk for session in sessions]
+    sessions = {session.pk: session for session in sessions}
+    priority_rows = defaultdict(list)
+    for session_id, batch_id, stream_id, *row in ElectivePriority.objects.filter(
+            session_id__in=session_ids, student__batch__isnull=False, student__stream__isnull=False
+    ).order_by('pk').values_list('session_id', 'student__batch_id', 'student__stream_id', 'student_id',
+                                 'subject__subject_name', 'priority', 'student__name', 'student__roll_number',
+                                 'student__level__name', 'desired_number_of_subjects'):
+        priority_rows[batch_id, session_id, stream_id].append(row)
+
+    subjects = defaultdict(list)
+    for session_id, stream_id, *limits in ElectiveSubject.objects.filter(elective_for_id__in=session_ids).order_by(
+            'pk').values_list('elective_for_id', 'stream_id', 'subject_name', 'min_students', 'max_students'):
+        subjects[session_id, stream_id].append(tuple(limits))
+
+    batches = Batch.objects.in_bulk({batch_id for batch_id, _, _ in priority_rows})
+    streams = Stream.objects.in_bulk({stream_id for _, _, stream_id in priority_rows})
+    algorithms = []
+    for (batch_id, session_id, stream_id), rows in sorted(priority_rows.items()):
+        subject_limits = subjects[session_id, stream_id]
+        inputs = CohortInputs(
+            build_priority_dataframe([name for name, _, _ in subject_limits], [row[:3] for row in rows]),
+            subject_limits,
+            build_student_metadata([(row[0],) + tuple(row[3:]) for row in rows]),
+        )
+        session = sessions[session_id]
+        algorithms.append(GenericAlgorithm(batches[batch_id], session, streams[stream_id],
+                                           engine=session.allocation_engine, inputs=inputs))
+    return algorithms
+
+
+def get_current_input_hashes(sessions):
+    """(batch id, session id, stream id) -> input_hash of the latest snapshot, for all cohorts in one query"""
+    input_hashes = {}
+    for batch_id, session_id, stream_id, input_hash in AllocationSnapshot.objects.filter(
+            session__in=sessions).order_by('version').values_list('batch_id', 'session_id', 'stream_id',
+                                                                  'input_hash'):
+        input_hashes[batch_id, session_id, stream_id] = input_hash
+    return input_hashes
+
+
+def run_cohort_allocation(algorithm):
+    """Allocate one cohort in a pool worker, without reading or writing any cache or the database"""
+    start = time.perf_counter()
+    if algorithm.engine == 'min_cost_flow':
+        result_df = algorithm.run_min_cost_flow_engine()
+    else:
+        # The NumPy engine gives the allocation of the pandas engine
+        result_df = algorithm.run_numpy_engine()
+    return result_df, time.perf_counter() - start
+
+
+def get_cohort_summary(algorithm, status, seconds=None):
+    result_df = algorithm.result_df
+    allocated = result_df is not None and not result_df.empty
+    return {
+        'batch': str(algorithm.batch),
+        'semester': str(algorithm.semester),
+        'stream': str(algorithm.stream),
+        'engine': algorithm.engine,
+        'status': status,
+        'students': len(algorithm.student_metadata),
+        'subjects': len(result_df.index) if allocated else 0,
+        'assignments': int((result_df.to_numpy() == 1).sum()) if allocated else 0,
+        'allocation_seconds': seconds,
+    }
+
+
+def allocate_cohorts(sessions=None, workers=None, force=False, progress=None):
+    """
+    Allocate every cohort with priorities in the given semesters (all semesters by default)
+    and save the results as snapshots. Returns a JSON serializable summary with the timings.
+
+    :param workers: processes of the pool, settings.COHORT_ALLOCATION_WORKERS or one per CPU by default
+    :param force: allocate and save cohorts whose latest snapshot has the same inputs too,
+        replacing any manual edit
+    :param progress: optional callable(done, total, message) called after every cohort
+    """
+    start = time.perf_counter()
+    sessions = list(ElectiveSession.objects.all() if sessions is None else sessions)
+    algorithms = load_cohorts(sessions)
+    input_hashes = {} if force else get_current_input_hashes(sessions)
+    summaries = {}
+    pending = []
+    for algorithm in algorithms:
+        key = (algorithm.batch.pk, algorithm.semester.pk, algorithm.stream.pk)
+        if algorithm.df_of_priorities.empty:
+            summaries[key] = get_cohort_summary(algorithm, 'no subjects')
+        elif input_hashes.get(key) == algorithm.input_hash:
+            summaries[key] = get_cohort_summary(algorithm, 'unchanged')
+        else:
+            pending.append(algorithm)
+    load_seconds = time.perf_counter() - start
+
+    workers = min(workers or getattr(settings, 'COHORT_ALLOCATION_WORKERS', None) or os.cpu_count() or 1,
+                  len(pending)) or 1
+    start = time.perf_counter()
+    save_seconds = 0
+    if workers == 1:
+        results = map(run_cohort_allocation, pending)
+        executor = None
+    else:
+        # Started fresh rather than forked: this often runs in a thread of run_jobs, and a fork
+        # would copy the locks and database connections of the other threads. Workers never
+        # query the database, Django is only set up to unpickle the model instances.
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=django.setup)
+        results = executor.map(run_cohort_allocation, pending)
+    try:
+        for done, (algorithm, (result_df, seconds)) in enumerate(zip(pending, results), 1):
+            save_start = time.perf_counter()
+            algorithm.result_df = result_df
+            save_allocation_snapshot(algorithm.batch, algorithm.semester, algorithm.stream, result_df,
+                                     algorithm.input_hash)
+            save_seconds += time.perf_counter() - save_start
+            summaries[algorithm.batch.pk, algorithm.semester.pk, algorithm.stream.pk] = get_cohort_summary(
+                algorithm, 'allocated', seconds)
+            if progress:
+                progress(done, len(pending), '%s %s %s' % (algorithm.batch, algorithm.stream, algorithm.semester))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return {
+        'cohorts': [summaries[key] for key in sorted(summaries)],
+        'workers': workers,
+        'load_seconds': load_seconds,
+        'allocation_seconds': time.perf_counter() - start - save_seconds,
+        'save_seconds': save_seconds,
+        'total_seconds': load_seconds + time.perf_counter() - start,
+    }
@@ -7,7 +7,35 @@ class StreamForm(forms.Form):
     batch = forms.ModelChoiceField(queryset=Batch.objects.all())
     level = forms.ModelChoiceField(queryset=AcademicLevel.objects.all())
     stream = forms.ModelChoiceField(queryset=Stream.objects.all())
-    semester = forms.ModelChoiceField(queryset=ElectiveSession.objects.all())
+    # The level is part of every semester label
+    semester = forms.ModelChoiceField(queryset=ElectiveSession.objects.select_related('level'))
+
+
+def parse_whole_numbers(text):
+    """Comma separated whole numbers of a form field, blank for none"""
+    try:
+        return [int(value) for value in text.replace(' ', '').split(',') if value]
+    except ValueError:
+        raise forms.ValidationError('Enter whole numbers separated by commas.')
+
+
+class SimulationForm(StreamForm):
+    min_students = forms.CharField(required=False, label='Minimum students per subject',
+                                   help_text='Comma separated values to try, e.g. 5, 10, 15. '
+                                             'Blank keeps the minimum of each subject.')
+    max_students = forms.CharField(required=False, label='Maximum students per subject',
+                                   help_text='Comma separated values to try, e.g. 24, 30. '
+                                             'Blank keeps the maximum of each subject.')
+
+    def clean_min_students(self):
+        return parse_whole_numbers(self.cleaned_data['min_students'])
+
+    def clean_max_students(self):
+        return parse_whole_numbers(self.cleaned_data['max_students'])
+
+    def get_grid(self):
+        return {name: self.cleaned_data[name] for name in ('min_students', 'max_students')
+                if self.cleaned_data[name]}
 
 
 class PriorityEntryDetailFormset(forms.Form):
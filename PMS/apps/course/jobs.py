@@ -0,0 +1,93 @@
+"""
+Background job handlers for allocation runs and exports, see apps.system.jobs.
+
+Every handler takes the session_id, batch_id and stream_id job parameters and produces
+the same file as the matching download view in apps.course.views.
+"""
+from apps.course.cohorts import allocate_cohorts
+from apps.course.models import ElectiveSession, Batch, Stream
+from apps.course.services import get_allocation
+from apps.excel_generator import (
+    create_allocation_result_excel,
+    create_master_excel_with_all_subjects,
+    get_semester_label,
+    iter_subject_assignments,
+    iter_subject_wise_excel_files,
+    stream_zip_of_subject_files,
+)
+from apps.system.jobs import Artifact, update_job_progress
+
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def get_job_allocation(job):
+    """Return (batch, session, stream, algorithm) of a job after running the allocation"""
+    parameters = job.parameters
+    session = ElectiveSession.objects.get(pk=parameters['session_id'])
+    batch = Batch.objects.get(pk=parameters['batch_id'])
+    stream = Stream.objects.get(pk=parameters['stream_id'])
+    update_job_progress(job, 10, 'Running the allocation')
+    algorithm = get_allocation(batch, session, stream)
+    if algorithm.result_df is None or algorithm.result_df.empty:
+        raise ValueError('No allocation data available')
+    return batch, session, stream, algorithm
+
+
+def run_allocation(job):
+    batch, session, stream, algorithm = get_job_allocation(job)
+    result_df = algorithm.result_df
+    return {
+        'subjects': len(result_df.index),
+        'students': len(result_df.columns),
+        'assignments': int((result_df.to_numpy() == 1).sum()),
+    }, None
+
+
+def export_allocation_result(job):
+    batch, session, stream, algorithm = get_job_allocation(job)
+    update_job_progress(job, 50, 'Writing the Excel file')
+    return {}, Artifact(f'allocation_results_{batch.name}_{stream.stream_name}_sem{session.semester}.xlsx',
+                        EXCEL_CONTENT_TYPE, create_allocation_result_excel(algorithm.result_df))
+
+
+def export_master_excel_with_subjects(job):
+    batch, session, stream, algorithm = get_job_allocation(job)
+    update_job_progress(job, 50, 'Writing the Excel file')
+    excel_data = create_master_excel_with_all_subjects(batch, session, stream, algorithm.result_df)
+    if excel_data is None:
+        raise ValueError('No subjects with allocated students found')
+    return {}, Artifact(f'master_allocation_{batch.name}_{stream.stream_name}_sem{session.semester}.xlsx',
+                        EXCEL_CONTENT_TYPE, excel_data)
+
+
+def export_subject_wise_excel_files(job):
+    batch, session, stream, algorithm = get_job_allocation(job)
+    result_df = algorithm.result_df
+    subject_count = sum(1 for _, assigned_students in iter_subject_assignments(result_df) if assigned_students)
+    if not subject_count:
+        raise ValueError('No subjects with allocated students found')
+
+    def report_subject_files():
+        for written, (subject_name, write) in enumerate(
+                iter_subject_wise_excel_files(batch, session, stream, result_df)):
+            update_job_progress(job, 20 + 75 * written // subject_count,
+                                f'Writing {subject_name} ({written + 1} of {subject_count})')
+            yield subject_name, write
+
+    zip_data = b''.join(stream_zip_of_subject_files(report_subject_files(), batch.name, stream.stream_name,
+                                                    get_semester_label(session)))
+    return {'subjects': subject_count}, Artifact(
+        f'subject_wise_allocations_{batch.name}_{stream.stream_name}_sem{session.semester}.zip',
+        'application/zip', zip_data)
+
+
+def allocate_all_cohorts(job):
+    """Allocate every cohort of the session_ids job parameter (every semester when missing), see apps.course.cohorts"""
+    session_ids = job.parameters.get('session_ids')
+    sessions = None if session_ids is None else ElectiveSession.objects.filter(pk__in=session_ids)
+    update_job_progress(job, 5, 'Loading the priorities of every cohort')
+
+    def report_progress(done, total, cohort):
+        update_job_progress(job, 10 + 85 * done // total, f'Allocated {cohort} ({done} of {total})')
+
+    return allocate_cohorts(sessions, force=job.parameters.get('force', False), progress=report_progress), None
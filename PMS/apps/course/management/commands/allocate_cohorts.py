@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.course.cohorts import allocate_cohorts
+from apps.course.models import ElectiveSession
+
+
+class Command(BaseCommand):
+    help = 'Allocate every batch and stream with priorities in a process pool and save the results as snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semester', type=int, action='append', dest='semesters',
+                            help='Id of a semester to allocate, can be repeated (default: every semester)')
+        parser.add_argument('--workers', type=int, help='Number of processes (default: one per CPU)')
+        parser.add_argument('--force', action='store_true',
+                            help='Also allocate cohorts whose saved allocation has the same inputs, '
+                                 'replacing manual edits')
+        parser.add_argument('--output', help='Write the summary to this JSON file')
+
+    def handle(self, *args, **options):
+        sessions = None
+        if options['semesters']:
+            sessions = list(ElectiveSession.objects.filter(pk__in=options['semesters']))
+            missing = set(options['semesters']) - {session.pk for session in sessions}
+            if missing:
+                raise CommandError('Unknown semester ids: %s' % ', '.join(map(str, sorted(missing))))
+
+        summary = allocate_cohorts(sessions, workers=options['workers'], force=options['force'])
+
+        self.stdout.write('%-16s %-24s %-30s %-12s %8s %8s %11s %8s' % (
+            'batch', 'stream', 'semester', 'status', 'students', 'subjects', 'assignments', 'ms'))
+        for cohort in summary['cohorts']:
+            self.stdout.write('%-16s %-24s %-30s %-12s %8d %8d %11d %8s' % (
+                cohort['batch'][:16], cohort['stream'][:24], cohort['semester'][:30], cohort['status'],
+                cohort['students'], cohort['subjects'], cohort['assignments'],
+                '-' if cohort['allocation_seconds'] is None else '%.1f' % (cohort['allocation_seconds'] * 1000)))
+        self.stdout.write('%d cohorts with %d workers: loaded in %.2fs, allocated in %.2fs, saved in %.2fs, '
+                          'total %.2fs' % (len(summary['cohorts']), summary['workers'], summary['load_seconds'],
+                                           summary['allocation_seconds'], summary['save_seconds'],
+                                           summary['total_seconds']))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(summary, output, indent=2)
+            self.stdout.write('Summary written to %s' % options['output'])
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('course', '0005_electivesubject_max_students_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('subject_order', models.JSONField(default=list)),
+                ('student_order', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='course.batch')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='course.electivesession', verbose_name='Semester')),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='course.stream')),
+            ],
+            options={
+                'verbose_name': 'Allocation snapshot',
+                'verbose_name_plural': 'Allocation snapshots',
+                'unique_together': {('batch', 'session', 'stream', 'version')},
+            },
+        ),
+        migrations.CreateModel(
+            name='AllocationAssignment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to='course.allocationsnapshot')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='course.electivesubject')),
+            ],
+            options={
+                'verbose_name': 'Allocated subject',
+                'verbose_name_plural': 'Allocated subjects',
+                'unique_together': {('snapshot', 'student', 'subject')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0006_allocationsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='allocationsnapshot',
+            name='input_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0007_allocationsnapshot_input_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electivesession',
+            name='allocation_engine',
+            field=models.CharField(choices=[('pandas', 'Greedy (priority sum order)'), ('numpy', 'Greedy, NumPy implementation'), ('min_cost_flow', 'Optimal (min-cost flow)')], default='pandas', help_text='The greedy engines fill subjects in the order of their priority sum. The optimal engine gives as many subjects as possible with the smallest sum of priorities.', max_length=20),
+        ),
+    ]
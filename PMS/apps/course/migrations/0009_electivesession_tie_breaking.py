@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0008_electivesession_allocation_engine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electivesession',
+            name='lottery_seed',
+            field=models.PositiveIntegerField(default=0, help_text='Draws a different lottery order, only used by the seeded lottery.'),
+        ),
+        migrations.AddField(
+            model_name='electivesession',
+            name='tie_breaking',
+            field=models.CharField(choices=[('submission', 'Submission order'), ('roll_number', 'Roll number'), ('lottery', 'Seeded lottery')], default='submission', help_text='Decides who keeps a subject when it runs out of seats.', max_length=20, verbose_name='Students served first'),
+        ),
+    ]
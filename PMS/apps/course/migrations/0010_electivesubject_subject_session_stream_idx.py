@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0009_electivesession_tie_breaking'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='electivesubject',
+            index=models.Index(fields=['elective_for', 'stream'], name='subject_session_stream_idx'),
+        ),
+    ]
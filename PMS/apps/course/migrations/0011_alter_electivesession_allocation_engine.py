@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0010_electivesubject_subject_session_stream_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='electivesession',
+            name='allocation_engine',
+            field=models.CharField(choices=[('pandas', 'Greedy (priority sum order)'), ('numpy', 'Greedy, NumPy implementation'), ('min_cost_flow', 'Min-cost flow (heuristic with minimums)')], default='pandas', help_text='The greedy engines fill subjects in the order of their priority sum. The min-cost flow engine gives as many subjects as possible with the smallest sum of priorities, but picks the subjects meeting their minimum heuristically.', max_length=20),
+        ),
+    ]
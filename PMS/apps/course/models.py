@@ -1,8 +1,23 @@
+from django.conf import settings
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 # Create your models here.
 
+# Engines of apps.algorithm.generic_algorithm.GenericAlgorithm a semester can be allocated with
+ALLOCATION_ENGINE_CHOICES = (
+    ('pandas', 'Greedy (priority sum order)'),
+    ('numpy', 'Greedy, NumPy implementation'),
+    ('min_cost_flow', 'Min-cost flow (heuristic with minimums)'),
+)
+
+# Order students are served in when seats run out, see apps.algorithm.tie_breaking
+TIE_BREAKING_CHOICES = (
+    ('submission', 'Submission order'),
+    ('roll_number', 'Roll number'),
+    ('lottery', 'Seeded lottery'),
+)
+
 
 class Batch(models.Model):
     name = models.CharField(max_length=50)
@@ -27,6 +42,17 @@ class ElectiveSession(models.Model):
     semester = models.IntegerField()
     min_student = models.IntegerField(verbose_name='Minimum student for a subject')
     subjects_provided = models.IntegerField(verbose_name='Subject provided to each student', )
+    allocation_engine = models.CharField(choices=ALLOCATION_ENGINE_CHOICES, max_length=20, default='pandas',
+                                         help_text='The greedy engines fill subjects in the order of their '
+                                                   'priority sum. The min-cost flow engine gives as many subjects '
+                                                   'as possible with the smallest sum of priorities, but picks the '
+                                                   'subjects meeting their minimum heuristically.')
+    tie_breaking = models.CharField(choices=TIE_BREAKING_CHOICES, max_length=20, default='submission',
+                                    verbose_name='Students served first',
+                                    help_text='Decides who keeps a subject when it runs out of seats.')
+    lottery_seed = models.PositiveIntegerField(default=0,
+                                               help_text='Draws a different lottery order, only used by the '
+                                                         'seeded lottery.')
 
     def __str__(self):
         return '%sth semester  of %s' % (self.semester, self.level)
@@ -66,3 +92,48 @@ class ElectiveSubject(models.Model):
 
     def __str__(self):
         return self.subject_name
+
+    class Meta:
+        indexes = [
+            # Subjects of a semester and stream, read by every allocation run
+            models.Index(fields=['elective_for', 'stream'], name='subject_session_stream_idx'),
+        ]
+
+
+class AllocationSnapshot(models.Model):
+    """
+    A saved allocation result for a batch, semester and stream. A new version is saved by the
+    first manual edit of an allocation computed from the current inputs, and by
+    apps.course.cohorts.allocate_cohorts; manual edits update the assignments of the latest version.
+    Allocations are not saved otherwise, the allocation cache keeps them.
+    """
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE)
+    session = models.ForeignKey(ElectiveSession, verbose_name='Semester', on_delete=models.CASCADE)
+    stream = models.ForeignKey(Stream, on_delete=models.CASCADE)
+    version = models.PositiveIntegerField(default=1)
+    # Row and column order of the allocation result, as subject and student ids
+    subject_order = models.JSONField(default=list)
+    student_order = models.JSONField(default=list)
+    # Hash of the allocation inputs, the snapshot is only used while they are unchanged
+    input_hash = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '%s %s %s (v%d)' % (self.batch, self.stream, self.session, self.version)
+
+    class Meta:
+        # Also serves as the index for looking up the latest version
+        unique_together = ('batch', 'session', 'stream', 'version')
+        verbose_name = 'Allocation snapshot'
+        verbose_name_plural = 'Allocation snapshots'
+
+
+class AllocationAssignment(models.Model):
+    snapshot = models.ForeignKey(AllocationSnapshot, related_name='assignments', on_delete=models.CASCADE)
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    subject = models.ForeignKey(ElectiveSubject, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('snapshot', 'student', 'subject')
+        verbose_name = 'Allocated subject'
+        verbose_name_plural = 'Allocated subjects'
@@ -0,0 +1,55 @@
+"""
+Allocation service shared by the report page and every download/edit view.
+"""
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+
+from apps.algorithm.generic_algorithm import GenericAlgorithm
+from apps.algorithm.simulation import SimulationInputs, DEFAULT_MAX_SCENARIOS, expand_grid, run_simulation
+from apps.course.models import Batch, Stream
+from apps.system.instrumentation import timed_stage
+
+
+def get_allocation(batch, semester, stream):
+    """
+    Return the GenericAlgorithm of a batch/semester/stream after running it.
+
+    The result is memoized per (batch, semester, stream, input version): it comes from the
+    edited snapshot or the allocation cache while the inputs are unchanged, so a report page
+    followed by any number of downloads runs the allocation once.
+    """
+    with timed_stage('db_load'):
+        algorithm = GenericAlgorithm(batch, semester, stream, engine=semester.allocation_engine)
+    with timed_stage('allocation'):
+        algorithm.run()
+    return algorithm
+
+
+def simulate_allocation(batch, semester, stream, grid):
+    """
+    Allocate every scenario of a capacity/threshold grid without saving anything, see
+    apps.algorithm.simulation. The priorities are loaded once, and the first row of the
+    returned comparison table is the current settings. Raises ValueError for an invalid grid.
+    """
+    algorithm = GenericAlgorithm(batch, semester, stream, engine=semester.allocation_engine)
+    if algorithm.df_of_priorities.empty:
+        return []
+    df_of_priorities = algorithm.df_of_priorities
+    inputs = SimulationInputs(
+        df_of_priorities,
+        {student: algorithm.get_desired_number_of_subjects_for_student(student) for student in df_of_priorities},
+        algorithm.min_students_per_subject,
+        algorithm.max_students_per_subject,
+        semester.allocation_engine,
+    )
+    scenarios = [{}] + expand_grid(grid, inputs, getattr(settings, 'SIMULATION_MAX_SCENARIOS', DEFAULT_MAX_SCENARIOS))
+    return run_simulation(inputs, scenarios, getattr(settings, 'SIMULATION_WORKERS', None))
+
+
+def get_batch_and_stream_from_request(request):
+    """Read the batch and stream of a download link, returns (None, None) if one is missing"""
+    batch_id = request.GET.get('batch')
+    stream_id = request.GET.get('stream')
+    if not batch_id or not stream_id:
+        return None, None
+    return get_object_or_404(Batch, pk=batch_id), get_object_or_404(Stream, pk=stream_id)
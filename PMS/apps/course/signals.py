@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.algorithm.allocation_cache import invalidate_allocation_cache
+from apps.course.models import ElectiveSubject, ElectiveSession
+
+
+@receiver(post_save, sender=ElectiveSubject)
+@receiver(post_delete, sender=ElectiveSubject)
+def invalidate_allocation_on_subject_change(sender, instance, *args, **kwargs):
+    invalidate_allocation_cache(instance.elective_for_id)
+
+
+@receiver(post_save, sender=ElectiveSession)
+@receiver(post_delete, sender=ElectiveSession)
+def invalidate_allocation_on_session_change(sender, instance, *args, **kwargs):
+    invalidate_allocation_cache(instance.pk)
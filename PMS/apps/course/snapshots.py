@@ -0,0 +1,110 @@
+"""
+Database-backed storage of allocation results.
+
+An allocation result_df (subjects x students, 1 where a student got a subject) is saved
+as an AllocationSnapshot with one AllocationAssignment row per assigned subject, so
+every worker reads the same state and manual edits are single-row updates.
+"""
+import numpy as np
+import pandas as pd
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max
+
+from apps.course.models import AllocationSnapshot, AllocationAssignment, ElectiveSubject
+
+User = get_user_model()
+
+
+def get_current_snapshot(batch_id, session_id, stream_id):
+    """Return the latest allocation snapshot for a batch, semester and stream, or None."""
+    return AllocationSnapshot.objects.filter(batch_id=batch_id, session_id=session_id,
+                                             stream_id=stream_id).order_by('-version').first()
+
+
+def get_outdated_snapshot(batch_id, session_id, stream_id, input_hash):
+    """
+    Return the latest snapshot if it was computed from other inputs than input_hash, or None.
+    Such a snapshot (and any manual edit of it) is no longer used by the allocation.
+    """
+    snapshot = get_current_snapshot(batch_id, session_id, stream_id)
+    if snapshot is not None and snapshot.input_hash != input_hash:
+        return snapshot
+    return None
+
+
+def save_allocation_snapshot(batch, session, stream, result_df, input_hash=''):
+    """
+    Save result_df (subject names x student ids) as a new snapshot version.
+
+    :param input_hash: GenericAlgorithm.input_hash of the inputs result_df was computed from
+    """
+    subject_ids = dict(ElectiveSubject.objects.filter(elective_for=session, stream=stream).values_list(
+        'subject_name', 'id'))
+    subjects = [subject for subject in result_df.index if subject in subject_ids]
+    students = [int(student) for student in result_df.columns]
+    assigned = result_df.loc[subjects].to_numpy() == 1
+
+    with transaction.atomic():
+        latest_version = AllocationSnapshot.objects.filter(batch=batch, session=session, stream=stream).aggregate(
+            Max('version'))['version__max']
+        snapshot = AllocationSnapshot.objects.create(
+            batch=batch,
+            session=session,
+            stream=stream,
+            version=(latest_version or 0) + 1,
+            subject_order=[subject_ids[subject] for subject in subjects],
+            student_order=students,
+            input_hash=input_hash,
+        )
+        rows, columns = np.nonzero(assigned)
+        AllocationAssignment.objects.bulk_create([
+            AllocationAssignment(snapshot=snapshot, subject_id=subject_ids[subjects[row]],
+                                 student_id=students[column])
+            for row, column in zip(rows, columns)
+        ])
+    return snapshot
+
+
+def load_result_df(snapshot):
+    """Rebuild the result_df of a snapshot, with subject names and student ids as labels."""
+    subject_names = dict(ElectiveSubject.objects.filter(pk__in=snapshot.subject_order).values_list('id',
+                                                                                                  'subject_name'))
+    existing_students = set(User.objects.filter(pk__in=snapshot.student_order).values_list('id', flat=True))
+    # Subjects or students deleted since the snapshot was taken are left out
+    subject_order = [subject_id for subject_id in snapshot.subject_order if subject_id in subject_names]
+    student_order = [student_id for student_id in snapshot.student_order if student_id in existing_students]
+    subject_positions = {subject_id: i for i, subject_id in enumerate(subject_order)}
+    student_positions = {student_id: j for j, student_id in enumerate(student_order)}
+
+    matrix = np.zeros((len(subject_order), len(student_order)), dtype=int)
+    for student_id, subject_id in snapshot.assignments.values_list('student_id', 'subject_id'):
+        if subject_id in subject_positions and student_id in student_positions:
+            matrix[subject_positions[subject_id], student_positions[student_id]] = 1
+
+    return pd.DataFrame(matrix, index=[subject_names[subject_id] for subject_id in subject_order],
+                        columns=pd.Index(student_order, dtype=np.int64))
+
+
+def _get_snapshot_subject_id(snapshot, subject_name):
+    return ElectiveSubject.objects.filter(pk__in=snapshot.subject_order, subject_name=subject_name).values_list(
+        'id', flat=True).first()
+
+
+def move_assignment(snapshot, student_id, from_subject, to_subject):
+    """Move a student of the snapshot from one subject to another. Returns True if a row changed."""
+    from_subject_id = _get_snapshot_subject_id(snapshot, from_subject)
+    to_subject_id = _get_snapshot_subject_id(snapshot, to_subject)
+    assignments = AllocationAssignment.objects.filter(snapshot=snapshot, student_id=student_id)
+
+    if assignments.filter(subject_id=to_subject_id).exists():
+        # Already attending the target subject, so moving just drops the old one
+        return assignments.filter(subject_id=from_subject_id).delete()[0] > 0
+    return assignments.filter(subject_id=from_subject_id).update(subject_id=to_subject_id) > 0
+
+
+def remove_assignment(snapshot, student_id, from_subject):
+    """Remove a student of the snapshot from a subject. Returns True if a row was deleted."""
+    subject_id = _get_snapshot_subject_id(snapshot, from_subject)
+    return AllocationAssignment.objects.filter(snapshot=snapshot, student_id=student_id,
+                                               subject_id=subject_id).delete()[0] > 0
@@ -1,3 +1,109 @@
+import re
+
+from django.db import connection
 from django.test import TestCase
 
-# Create your tests here.
+from apps.algorithm.generic_algorithm import GenericAlgorithm
+from apps.authuser.models import User
+from apps.course.cohorts import load_cohorts
+from apps.course.models import AcademicLevel, Batch, ElectiveSession, ElectiveSubject, Stream
+from apps.course.snapshots import get_outdated_snapshot, save_allocation_snapshot
+from apps.student.models import ElectivePriority
+
+
+class CohortTestCase(TestCase):
+    """One batch, stream and semester of 4 students choosing 2 of 3 subjects"""
+
+    @classmethod
+    def setUpTestData(cls):
+        level = AcademicLevel.objects.create(name='Bachelors')
+        cls.batch = Batch.objects.create(name='2078')
+        cls.stream = Stream.objects.create(stream_name='Computer', level=level)
+        cls.semester = ElectiveSession.objects.create(level=level, semester=7, min_student=5, subjects_provided=2)
+        subjects = [ElectiveSubject.objects.create(subject_name=name, elective_for=cls.semester, stream=cls.stream,
+                                                   min_students=5, max_students=24)
+                    for name in ('Blockchain', 'Machine Learning', 'Networking')]
+        for number in range(4):
+            student = User.objects.create(username='078BCT%03d' % number, name='Student %d' % number,
+                                          roll_number='078BCT%03d' % number, user_type='Student',
+                                          batch=cls.batch, stream=cls.stream, level=level,
+                                          current_semester=cls.semester)
+            for priority, subject in enumerate(subjects, 1):
+                ElectivePriority.objects.create(subject=subject, priority=priority, student=student,
+                                                session=cls.semester, desired_number_of_subjects=2)
+
+
+class AllocationLoaderQueryPlanTests(CohortTestCase):
+    """
+    The queries loading the inputs of an allocation must be served by indexes, not table scans,
+    and the subjects of a semester and stream by subject_session_stream_idx
+    """
+
+    def capture_queries(self, function):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            function()
+        return queries
+
+    def get_query_plan(self, sql, params):
+        """Lines of the EXPLAIN output of a query"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                return [row[-1] for row in cursor.fetchall()]
+            # Tiny test tables are always read sequentially unless told otherwise
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_table_scans(self, plan):
+        if connection.vendor == 'sqlite':
+            return [line for line in plan if re.match(r'SCAN (?!CONSTANT ROW)', line) and 'INDEX' not in line]
+        return [line for line in plan if 'Seq Scan' in line]
+
+    def get_query_plans(self, function):
+        """(sql, query plan) of every query function runs"""
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('Query plans are only checked on SQLite and PostgreSQL')
+        queries = self.capture_queries(function)
+        self.assertTrue(queries)
+        return [(sql, self.get_query_plan(sql, params)) for sql, params in queries]
+
+    def assert_no_table_scans(self, query_plans):
+        for sql, plan in query_plans:
+            self.assertEqual(self.get_table_scans(plan), [], sql)
+
+    def assert_uses_index(self, query_plans, table, index_name):
+        """Every query reading table must be served by index_name"""
+        table_queries = [(sql, plan) for sql, plan in query_plans if 'FROM "%s"' % table in sql]
+        self.assertTrue(table_queries, table)
+        for sql, plan in table_queries:
+            self.assertTrue(any(index_name in line for line in plan), '%s\n%s' % (sql, '\n'.join(plan)))
+
+    def test_allocation_loader_uses_indexes(self):
+        query_plans = self.get_query_plans(lambda: GenericAlgorithm(self.batch, self.semester, self.stream))
+        self.assert_no_table_scans(query_plans)
+        self.assert_uses_index(query_plans, 'course_electivesubject', 'subject_session_stream_idx')
+
+    def test_cohort_loader_uses_indexes(self):
+        self.assert_no_table_scans(self.get_query_plans(lambda: load_cohorts([self.semester])))
+
+
+
+class OutdatedSnapshotTests(CohortTestCase):
+    def test_snapshot_of_earlier_inputs_is_reported(self):
+        algorithm = GenericAlgorithm(self.batch, self.semester, self.stream)
+        snapshot = save_allocation_snapshot(self.batch, self.semester, self.stream, algorithm.run(),
+                                            algorithm.input_hash)
+        self.assertIsNone(get_outdated_snapshot(self.batch.pk, self.semester.pk, self.stream.pk,
+                                                algorithm.input_hash))
+
+        ElectivePriority.objects.filter(priority=1).update(desired_number_of_subjects=1)
+        algorithm = GenericAlgorithm(self.batch, self.semester, self.stream)
+        self.assertEqual(get_outdated_snapshot(self.batch.pk, self.semester.pk, self.stream.pk,
+                                               algorithm.input_hash), snapshot)
@@ -1,3 +1,4 @@
+from django.contrib import admin
 from django.urls import path
 from . import views
 
@@ -16,6 +17,10 @@ urlpatterns = [
     # Download individual subject Excel file
     path('session/<int:session_id>/download-subject/<str:subject_name>/', views.download_individual_subject_excel, name='download_individual_subject_excel'),
 
+    # Queue an allocation run or an export as a background job
+    path('session/<int:session_id>/enqueue/<str:kind>/', admin.site.admin_view(views.enqueue_session_job),
+         name='enqueue_session_job'),
+
     # Student editing functionality
     path('move-student/', views.move_student, name='move_student'),
     path('delete-student/', views.delete_student, name='delete_student'),
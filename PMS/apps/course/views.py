@@ -1,58 +1,52 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+import itertools
 import pandas as pd
 from io import BytesIO
 from .models import ElectiveSession, Batch, Stream
-from apps.algorithm.generic_algorithm import GenericAlgorithm
-from apps.utils import prepare_pandas_dataframe_from_database
+from apps.authuser.models import StudentProxyModel
+from .snapshots import get_current_snapshot, save_allocation_snapshot, load_result_df, move_assignment, \
+    remove_assignment
+from .services import get_allocation, get_batch_and_stream_from_request
+from apps.system.instrumentation import timed_stage, timed_chunks
+from apps.system.jobs import enqueue_job
 from apps.excel_generator import (
-    create_subject_wise_excel_files, 
+    create_allocation_result_excel,
+    create_subject_excel_file,
     generate_all_subject_excel_files,
     create_master_excel_with_all_subjects,
-    create_zip_of_subject_files
+    iter_subject_wise_excel_files,
+    stream_zip_of_subject_files
 )
 import zipfile
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 import json
-import os
-import pickle
 
 def download_allocation_result(request, session_id):
     session = get_object_or_404(ElectiveSession, pk=session_id)
     
     try:
         # Get batch and stream from URL parameters
-        batch_id = request.GET.get('batch')
-        stream_id = request.GET.get('stream')
+        batch, stream = get_batch_and_stream_from_request(request)
         
-        if not batch_id or not stream_id:
+        if batch is None:
             return HttpResponse("Missing batch or stream parameter", status=400)
         
-        batch = get_object_or_404(Batch, pk=batch_id)
-        stream = get_object_or_404(Stream, pk=stream_id)
-        
-        # CRITICAL: Prepare the dataframe first (this was missing!)
-        prepare_pandas_dataframe_from_database(batch, session, stream)
-        
-        # Run the algorithm with the correct parameters
-        algorithm = GenericAlgorithm(batch, session, stream)
-        result_df = algorithm.run()
+        # Get the allocation shared with the report page and the other downloads
+        algorithm = get_allocation(batch, session, stream)
+        result_df = algorithm.result_df
         
         # Check if result_df has data
         if result_df is None or result_df.empty:
             return HttpResponse("No allocation data available for the selected parameters", status=400)
         
         # Create Excel file with the actual results
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # Write the main allocation results
-            result_df.to_excel(writer, sheet_name='Student Allocations', index=True)
-        
-        output.seek(0)
-        
+        with timed_stage('excel'):
+            excel_data = create_allocation_result_excel(result_df)
         response = HttpResponse(
-            output.getvalue(),
+            excel_data,
             content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
         response['Content-Disposition'] = f'attachment; filename="allocation_results_{batch.name}_{stream.stream_name}_sem{session.semester}.xlsx"'
@@ -68,38 +62,35 @@ def download_subject_wise_excel_files(request, session_id):
     
     try:
         # Get batch and stream from URL parameters
-        batch_id = request.GET.get('batch')
-        stream_id = request.GET.get('stream')
+        batch, stream = get_batch_and_stream_from_request(request)
         
-        if not batch_id or not stream_id:
+        if batch is None:
             return HttpResponse("Missing batch or stream parameter", status=400)
         
-        batch = get_object_or_404(Batch, pk=batch_id)
-        stream = get_object_or_404(Stream, pk=stream_id)
-        
-        # Run the algorithm
-        algorithm = GenericAlgorithm(batch, session, stream)
-        result_df = algorithm.run()
+        # Get the allocation shared with the report page and the other downloads
+        algorithm = get_allocation(batch, session, stream)
+        result_df = algorithm.result_df
         
         if result_df is None or result_df.empty:
             return HttpResponse("No allocation data available", status=400)
         
-        # Generate Excel files for each subject
-        excel_files = create_subject_wise_excel_files(batch, session, stream, result_df)
+        # Excel files for each subject, each one only built when it is written into the ZIP
+        subject_files = iter_subject_wise_excel_files(batch, session, stream, result_df)
+        first_subject_file = next(subject_files, None)
         
-        if not excel_files:
+        if first_subject_file is None:
             return HttpResponse("No subjects with allocated students found", status=400)
         
-        # Create ZIP file with all subject Excel files
-        zip_data = create_zip_of_subject_files(
-            excel_files, 
+        # Stream the ZIP file one subject Excel file at a time
+        zip_chunks = stream_zip_of_subject_files(
+            itertools.chain([first_subject_file], subject_files),
             batch.name, 
             stream.stream_name,
             f"{session.semester}th semester of {session.level}"
         )
         
-        response = HttpResponse(
-            zip_data,
+        response = StreamingHttpResponse(
+            timed_chunks('zip', zip_chunks),
             content_type='application/zip'
         )
         response['Content-Disposition'] = f'attachment; filename="subject_wise_allocations_{batch.name}_{stream.stream_name}_sem{session.semester}.zip"'
@@ -116,24 +107,21 @@ def download_master_excel_with_subjects(request, session_id):
     
     try:
         # Get batch and stream from URL parameters
-        batch_id = request.GET.get('batch')
-        stream_id = request.GET.get('stream')
+        batch, stream = get_batch_and_stream_from_request(request)
         
-        if not batch_id or not stream_id:
+        if batch is None:
             return HttpResponse("Missing batch or stream parameter", status=400)
         
-        batch = get_object_or_404(Batch, pk=batch_id)
-        stream = get_object_or_404(Stream, pk=stream_id)
-        
-        # Run the algorithm
-        algorithm = GenericAlgorithm(batch, session, stream)
-        result_df = algorithm.run()
+        # Get the allocation shared with the report page and the other downloads
+        algorithm = get_allocation(batch, session, stream)
+        result_df = algorithm.result_df
         
         if result_df is None or result_df.empty:
             return HttpResponse("No allocation data available", status=400)
         
         # Generate master Excel file with all subjects
-        excel_data = create_master_excel_with_all_subjects(batch, session, stream, result_df)
+        with timed_stage('excel'):
+            excel_data = create_master_excel_with_all_subjects(batch, session, stream, result_df)
         
         if excel_data is None:
             return HttpResponse("No subjects with allocated students found", status=400)
@@ -156,18 +144,14 @@ def download_individual_subject_excel(request, session_id, subject_name):
     
     try:
         # Get batch and stream from URL parameters
-        batch_id = request.GET.get('batch')
-        stream_id = request.GET.get('stream')
+        batch, stream = get_batch_and_stream_from_request(request)
         
-        if not batch_id or not stream_id:
+        if batch is None:
             return HttpResponse("Missing batch or stream parameter", status=400)
         
-        batch = get_object_or_404(Batch, pk=batch_id)
-        stream = get_object_or_404(Stream, pk=stream_id)
-        
-        # Run the algorithm
-        algorithm = GenericAlgorithm(batch, session, stream)
-        result_df = algorithm.run()
+        # Get the allocation shared with the report page and the other downloads
+        algorithm = get_allocation(batch, session, stream)
+        result_df = algorithm.result_df
         
         if result_df is None or result_df.empty:
             return HttpResponse("No allocation data available", status=400)
@@ -176,14 +160,13 @@ def download_individual_subject_excel(request, session_id, subject_name):
         if subject_name not in result_df.index:
             return HttpResponse(f"Subject '{subject_name}' not found in allocation results", status=404)
         
-        # Generate Excel files for all subjects and get the specific one
-        excel_files = create_subject_wise_excel_files(batch, session, stream, result_df)
+        # Generate the Excel file of the requested subject only
+        with timed_stage('excel'):
+            excel_data = create_subject_excel_file(batch, session, stream, result_df, subject_name)
         
-        if subject_name not in excel_files:
+        if excel_data is None:
             return HttpResponse(f"No students allocated to subject '{subject_name}'", status=404)
         
-        excel_data = excel_files[subject_name]
-        
         # Create safe filename
         safe_filename = f"{subject_name}_{batch.name}_{stream.stream_name}_sem{session.semester}.xlsx"
         safe_filename = safe_filename.replace('/', '-').replace('\\', '-').replace('?', '').replace('*', '').replace('<', '').replace('>', '').replace('|', '')
@@ -199,6 +182,33 @@ def download_individual_subject_excel(request, session_id, subject_name):
     except Exception as e:
         return HttpResponse(f"Error generating Excel file for subject '{subject_name}': {str(e)}", status=500)
 
+# Background jobs that can be queued for a batch, semester and stream, see apps.system.jobs
+SESSION_JOB_KINDS = ('allocate', 'export_allocation', 'export_subject_zip', 'export_master')
+
+
+@require_http_methods(["POST"])
+def enqueue_session_job(request, session_id, kind):
+    """
+    Queue an allocation run or an export of a batch, semester and stream as a background job
+    Returns the job id and the URL to poll its progress
+    """
+    session = get_object_or_404(ElectiveSession, pk=session_id)
+    if kind not in SESSION_JOB_KINDS:
+        return JsonResponse({'success': False, 'error': f'Unknown job {kind}'}, status=404)
+
+    batch, stream = get_batch_and_stream_from_request(request)
+    if batch is None:
+        return JsonResponse({'success': False, 'error': 'Missing batch or stream parameter'}, status=400)
+
+    job = enqueue_job(kind, {'session_id': session.pk, 'batch_id': batch.pk, 'stream_id': stream.pk},
+                      user=request.user)
+    return JsonResponse({
+        'success': True,
+        'job_id': job.pk,
+        'status_url': reverse('job_status', args=[job.pk]),
+    }, status=202)
+
+
 @require_http_methods(["POST"])
 def move_student(request):
     """
@@ -206,31 +216,32 @@ def move_student(request):
     """
     try:
         data = json.loads(request.body)
-        student_name = data.get('student_name')
+        student_id = data.get('student_id')
         from_subject = data.get('from_subject')
         to_subject = data.get('to_subject')
         session_id = data.get('session_id')
         batch_id = data.get('batch_id')
         stream_id = data.get('stream_id')
         
-        if not all([student_name, from_subject, to_subject, session_id, batch_id, stream_id]):
+        if not all([student_id, from_subject, to_subject, session_id, batch_id, stream_id]):
             return JsonResponse({'success': False, 'error': 'Missing required parameters'})
         
         # Get the objects
         session = get_object_or_404(ElectiveSession, pk=session_id)
         batch = get_object_or_404(Batch, pk=batch_id)
         stream = get_object_or_404(Stream, pk=stream_id)
+        student = get_object_or_404(StudentProxyModel, pk=student_id)
         
         # Load the current allocation data
-        algorithm = GenericAlgorithm(batch, session, stream)
-        result_df = algorithm.run()
+        algorithm = get_allocation(batch, session, stream)
+        result_df = algorithm.result_df
         
         if result_df is None or result_df.empty:
             return JsonResponse({'success': False, 'error': 'No allocation data found'})
         
         # Check if the student exists and is currently assigned to from_subject
-        if student_name not in result_df.columns:
-            return JsonResponse({'success': False, 'error': f'Student {student_name} not found in allocation data'})
+        if student.pk not in result_df.columns:
+            return JsonResponse({'success': False, 'error': f'Student {student.name} not found in allocation data'})
         
         if from_subject not in result_df.index:
             return JsonResponse({'success': False, 'error': f'Subject {from_subject} not found'})
@@ -239,30 +250,16 @@ def move_student(request):
             return JsonResponse({'success': False, 'error': f'Subject {to_subject} not found'})
         
         # Check if student is actually assigned to from_subject
-        if result_df.at[from_subject, student_name] != 1:
-            return JsonResponse({'success': False, 'error': f'Student {student_name} is not currently assigned to {from_subject}'})
-        
-        # Perform the move
-        result_df.at[from_subject, student_name] = 0  # Remove from old subject
-        result_df.at[to_subject, student_name] = 1    # Add to new subject
-        
-        # Save the updated allocation (we'll create a simple cache mechanism)
-        cache_key = f"allocation_{batch_id}_{session_id}_{stream_id}"
-        cache_data = {
-            'result_df': result_df,
-            'timestamp': pd.Timestamp.now()
-        }
-        
-        # Store in a simple file-based cache (you might want to use Redis or database in production)
-        cache_dir = "/tmp/elective_cache"
-        os.makedirs(cache_dir, exist_ok=True)
+        if result_df.at[from_subject, student.pk] != 1:
+            return JsonResponse({'success': False, 'error': f'Student {student.name} is not currently assigned to {from_subject}'})
         
-        with open(f"{cache_dir}/{cache_key}.pkl", 'wb') as f:
-            pickle.dump(cache_data, f)
+        # Perform the move on the saved allocation shared by all workers
+        snapshot = get_or_create_snapshot(algorithm, result_df)
+        move_assignment(snapshot, student.pk, from_subject, to_subject)
         
         return JsonResponse({
             'success': True, 
-            'message': f'Successfully moved {student_name} from {from_subject} to {to_subject}'
+            'message': f'Successfully moved {student.name} from {from_subject} to {to_subject}'
         })
         
     except Exception as e:
@@ -276,80 +273,70 @@ def delete_student(request):
     """
     try:
         data = json.loads(request.body)
-        student_name = data.get('student_name')
+        student_id = data.get('student_id')
         from_subject = data.get('from_subject')
         session_id = data.get('session_id')
         batch_id = data.get('batch_id')
         stream_id = data.get('stream_id')
         
-        if not all([student_name, from_subject, session_id, batch_id, stream_id]):
+        if not all([student_id, from_subject, session_id, batch_id, stream_id]):
             return JsonResponse({'success': False, 'error': 'Missing required parameters'})
         
         # Get the objects
         session = get_object_or_404(ElectiveSession, pk=session_id)
         batch = get_object_or_404(Batch, pk=batch_id)
         stream = get_object_or_404(Stream, pk=stream_id)
+        student = get_object_or_404(StudentProxyModel, pk=student_id)
         
         # Load the current allocation data
-        algorithm = GenericAlgorithm(batch, session, stream)
-        result_df = algorithm.run()
+        algorithm = get_allocation(batch, session, stream)
+        result_df = algorithm.result_df
         
         if result_df is None or result_df.empty:
             return JsonResponse({'success': False, 'error': 'No allocation data found'})
         
         # Check if the student exists and is currently assigned to from_subject
-        if student_name not in result_df.columns:
-            return JsonResponse({'success': False, 'error': f'Student {student_name} not found in allocation data'})
+        if student.pk not in result_df.columns:
+            return JsonResponse({'success': False, 'error': f'Student {student.name} not found in allocation data'})
         
         if from_subject not in result_df.index:
             return JsonResponse({'success': False, 'error': f'Subject {from_subject} not found'})
         
         # Check if student is actually assigned to from_subject
-        if result_df.at[from_subject, student_name] != 1:
-            return JsonResponse({'success': False, 'error': f'Student {student_name} is not currently assigned to {from_subject}'})
+        if result_df.at[from_subject, student.pk] != 1:
+            return JsonResponse({'success': False, 'error': f'Student {student.name} is not currently assigned to {from_subject}'})
         
-        # Remove the student
-        result_df.at[from_subject, student_name] = 0
-        
-        # Save the updated allocation
-        cache_key = f"allocation_{batch_id}_{session_id}_{stream_id}"
-        cache_data = {
-            'result_df': result_df,
-            'timestamp': pd.Timestamp.now()
-        }
-        
-        # Store in cache
-        cache_dir = "/tmp/elective_cache"
-        os.makedirs(cache_dir, exist_ok=True)
-        
-        with open(f"{cache_dir}/{cache_key}.pkl", 'wb') as f:
-            pickle.dump(cache_data, f)
+        # Remove the student from the saved allocation
+        snapshot = get_or_create_snapshot(algorithm, result_df)
+        remove_assignment(snapshot, student.pk, from_subject)
         
         return JsonResponse({
             'success': True, 
-            'message': f'Successfully removed {student_name} from {from_subject}'
+            'message': f'Successfully removed {student.name} from {from_subject}'
         })
         
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
 
-def get_cached_allocation(batch_id, session_id, stream_id):
+def get_or_create_snapshot(algorithm, result_df):
     """
-    Get cached allocation data if it exists and is recent
+    Get the saved allocation to edit, saving the freshly computed result_df first
+    if this batch/semester/stream has not been edited before
     """
-    cache_key = f"allocation_{batch_id}_{session_id}_{stream_id}"
-    cache_file = f"/tmp/elective_cache/{cache_key}.pkl"
-    
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, 'rb') as f:
-                cache_data = pickle.load(f)
-            
-            # Check if cache is less than 1 hour old
-            if (pd.Timestamp.now() - cache_data['timestamp']).total_seconds() < 3600:
-                return cache_data['result_df']
-        except:
-            pass
-    
-    return None
\ No newline at end of file
+    snapshot = get_current_snapshot(algorithm.batch.pk, algorithm.semester.pk, algorithm.stream.pk)
+    if snapshot is None or snapshot.input_hash != algorithm.input_hash:
+        snapshot = save_allocation_snapshot(algorithm.batch, algorithm.semester, algorithm.stream, result_df,
+                                            algorithm.input_hash)
+    return snapshot
+
+
+def get_cached_allocation(batch_id, session_id, stream_id, input_hash):
+    """
+    Get the saved (possibly edited) allocation data if it exists and was
+    computed from the current inputs
+    """
+    snapshot = get_current_snapshot(batch_id, session_id, stream_id)
+    if snapshot is not None and snapshot.input_hash == input_hash:
+        return load_result_df(snapshot)
+    return None
@@ -2,16 +2,138 @@
 Excel file generation utilities for elective subject allocation
 Creates separate Excel files for each subject with student lists
 """
+import io
+import logging
+import zipfile
+from datetime import datetime
+import numpy as np
 import pandas as pd
 from io import BytesIO
 import os
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from apps.course.models import ElectiveSubject, ElectiveSession, Batch, Stream
 from apps.authuser.models import StudentProxyModel
-from apps.algorithm.generic_algorithm import GenericAlgorithm
+from apps.course.services import get_allocation
 from apps.utils import get_normalized_result_from_dataframe
 
+HEADER_FONT = Font(bold=True)
+
+logger = logging.getLogger(__name__)
+
+
+def get_students_by_column(result_df):
+    """
+    Resolve every assigned student of result_df to its student record with a single query.
+    Returns a dictionary with result_df columns (student ids) as keys and students as values
+    """
+    columns = result_df.columns[(result_df == 1).any(axis=0)]
+    return StudentProxyModel.objects.in_bulk(columns.tolist())
+
+
+def write_workbook(sheets, output=None):
+    """
+    Write an Excel workbook using openpyxl write-only mode
+    sheets is an iterable of (sheet name, header, rows) where rows can be a generator;
+    rows are streamed into the file as they are produced instead of being collected in DataFrames.
+    Saves into output (a file-like object) when given, otherwise returns the workbook as bytes
+    """
+    workbook = Workbook(write_only=True)
+    for sheet_name, header, rows in sheets:
+        worksheet = workbook.create_sheet(title=sheet_name)
+        header_cells = []
+        for value in header:
+            cell = WriteOnlyCell(worksheet, value=value)
+            cell.font = HEADER_FONT
+            header_cells.append(cell)
+        worksheet.append(header_cells)
+        for row in rows:
+            worksheet.append(row)
+
+    if output is not None:
+        workbook.save(output)
+        return None
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def iter_subject_assignments(result_df):
+    """
+    Yield (subject name, list of assigned student columns) for every subject of result_df
+    """
+    assigned = result_df.to_numpy() == 1
+    columns = result_df.columns
+    for row, subject_name in enumerate(result_df.index):
+        yield subject_name, [columns[column] for column in np.flatnonzero(assigned[row])]
+
+
+def get_semester_label(semester):
+    return f"{semester.semester}th semester of {semester.level}"
+
+
+def get_subject_sheets(batch, semester, stream, subject_name, assigned_students, students):
+    """
+    Sheets of the workbook of a single subject, see write_workbook
+    """
+    semester_label = get_semester_label(semester)
+    # (S.N., roll number, name, email, phone) of every assigned student
+    student_rows = []
+    for index, student_id in enumerate(assigned_students, 1):
+        student = students.get(student_id)
+        if student is not None:
+            student_rows.append((index, student.roll_number, student.name, getattr(student, 'email', ''),
+                                 getattr(student, 'phone', '')))
+        else:
+            # If student not found, still include the id
+            logger.warning('Student #%s not found in database', student_id)
+            student_rows.append((index, 'N/A', student_id, 'N/A', 'N/A'))
+
+    # Create main student list sheet (most important)
+    yield 'Students', ['S.N.', 'Roll Number', 'Student Name', 'Email', 'Phone'], student_rows
+
+    # Write summary information sheet
+    yield 'Subject Info', ['Information', 'Details'], [
+        ['Subject Name', subject_name],
+        ['Total Students', len(assigned_students)],
+        ['Batch', batch.name],
+        ['Stream', stream.stream_name],
+        ['Semester', semester_label],
+        ['Generated On', pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')]
+    ]
+
+    # Create attendance tracking sheet
+    yield 'Attendance', ['S.N.', 'Roll Number', 'Student Name', 'Class 1', 'Class 2', 'Class 3', 'Class 4',
+                         'Class 5', 'Total Present', 'Remarks'], (
+        (serial, roll_number, name) for serial, roll_number, name, email, phone in student_rows)
+
+    # Create detailed information sheet
+    yield 'Detailed Info', ['S.N.', 'Roll Number', 'Student Name', 'Batch', 'Stream', 'Subject', 'Email', 'Phone',
+                            'Semester'], (
+        (serial, roll_number, name, batch.name, stream.stream_name, subject_name, email, phone, semester_label)
+        for serial, roll_number, name, email, phone in student_rows)
+
+
+def iter_subject_wise_excel_files(batch, semester, stream, result_df):
+    """
+    Yield (subject name, write function) for every subject with assigned students, where
+    write function(output=None) writes that subject's workbook, see write_workbook
+    Workbooks are only built when written, one at a time
+    """
+    if result_df is None or result_df.empty:
+        return
+
+    # Look up every assigned student once for all the files
+    students = get_students_by_column(result_df)
+
+    for subject_name, assigned_students in iter_subject_assignments(result_df):
+        if assigned_students:
+            sheets = get_subject_sheets(batch, semester, stream, subject_name, assigned_students, students)
+            yield subject_name, lambda output=None, sheets=sheets: write_workbook(sheets, output)
+
 
 def create_subject_wise_excel_files(batch, semester, stream, result_df):
     """
@@ -19,122 +141,35 @@ def create_subject_wise_excel_files(batch, semester, stream, result_df):
     Returns a dictionary with subject names as keys and Excel file data as values
     """
     excel_files = {}
-    
-    if result_df is None or result_df.empty:
-        return excel_files
-    
-    # Get all subjects (rows in the result_df)
-    for subject_name in result_df.index:
-        # Get students assigned to this subject
-        assigned_students = []
-        for student_name in result_df.columns:
-            if result_df.at[subject_name, student_name] == 1:
-                assigned_students.append(student_name)
-        
-        # Create a DataFrame for this subject
-        if assigned_students:
-            print(f"Processing subject '{subject_name}' with {len(assigned_students)} students: {assigned_students}")
-            
-            # Get detailed student information
-            student_details = []
-            for index, student_name in enumerate(assigned_students, 1):
-                try:
-                    student = StudentProxyModel.objects.get(name=student_name, batch=batch, stream=stream)
-                    student_details.append({
-                        'S.N.': index,
-                        'Roll Number': student.roll_number,
-                        'Student Name': student.name,
-                        'Batch': batch.name,
-                        'Stream': stream.stream_name,
-                        'Subject': subject_name,
-                        'Email': getattr(student, 'email', ''),
-                        'Phone': getattr(student, 'phone', ''),
-                        'Semester': f"{semester.semester}th semester of {semester.level}"
-                    })
-                except StudentProxyModel.DoesNotExist:
-                    # If student not found, still include the name
-                    print(f"Warning: Student '{student_name}' not found in database")
-                    student_details.append({
-                        'S.N.': index,
-                        'Roll Number': 'N/A',
-                        'Student Name': student_name,
-                        'Batch': batch.name,
-                        'Stream': stream.stream_name,
-                        'Subject': subject_name,
-                        'Email': 'N/A',
-                        'Phone': 'N/A',
-                        'Semester': f"{semester.semester}th semester of {semester.level}"
-                    })
-            
-            # Create DataFrame
-            subject_df = pd.DataFrame(student_details)
-            
-            # Add summary information
-            summary_data = {
-                'Summary': ['Subject Name', 'Total Students', 'Batch', 'Stream', 'Semester'],
-                'Details': [
-                    subject_name,
-                    len(assigned_students),
-                    batch.name,
-                    stream.stream_name,
-                    f"{semester.semester}th semester of {semester.level}"
-                ]
-            }
-            summary_df = pd.DataFrame(summary_data)
-            
-            # Create Excel file in memory
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                
-                # Create main student list sheet (most important)
-                main_student_df = pd.DataFrame([
-                    {
-                        'S.N.': detail['S.N.'],
-                        'Roll Number': detail['Roll Number'],
-                        'Student Name': detail['Student Name'],
-                        'Email': detail['Email'],
-                        'Phone': detail['Phone']
-                    } for detail in student_details
-                ])
-                main_student_df.to_excel(writer, sheet_name='Students', index=False)
-                
-                # Write summary information sheet
-                summary_df = pd.DataFrame([
-                    ['Subject Name', subject_name],
-                    ['Total Students', len(assigned_students)],
-                    ['Batch', batch.name],
-                    ['Stream', stream.stream_name],
-                    ['Semester', f"{semester.semester}th semester of {semester.level}"],
-                    ['Generated On', pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')]
-                ], columns=['Information', 'Details'])
-                summary_df.to_excel(writer, sheet_name='Subject Info', index=False)
-                
-                # Create attendance tracking sheet
-                attendance_df = pd.DataFrame({
-                    'S.N.': [detail['S.N.'] for detail in student_details],
-                    'Roll Number': [detail['Roll Number'] for detail in student_details],
-                    'Student Name': [detail['Student Name'] for detail in student_details],
-                    'Class 1': [''] * len(student_details),
-                    'Class 2': [''] * len(student_details),
-                    'Class 3': [''] * len(student_details),
-                    'Class 4': [''] * len(student_details),
-                    'Class 5': [''] * len(student_details),
-                    'Total Present': [''] * len(student_details),
-                    'Remarks': [''] * len(student_details)
-                })
-                attendance_df.to_excel(writer, sheet_name='Attendance', index=False)
-                
-                # Create detailed information sheet
-                detailed_df = pd.DataFrame(student_details)
-                detailed_df.to_excel(writer, sheet_name='Detailed Info', index=False)
-            
-            output.seek(0)
-            excel_files[subject_name] = output.getvalue()
-            print(f"✅ Created Excel file for '{subject_name}' with {len(assigned_students)} students")
-    
+    for subject_name, write in iter_subject_wise_excel_files(batch, semester, stream, result_df):
+        excel_files[subject_name] = write()
+        logger.debug("Created Excel file for '%s'", subject_name)
     return excel_files
 
 
+def create_subject_excel_file(batch, semester, stream, result_df, subject_name):
+    """
+    Create the Excel file of a single subject of result_df, without building the others
+    Returns the file data, or None if no student was assigned to the subject
+    """
+    for _, write in iter_subject_wise_excel_files(batch, semester, stream, result_df.loc[[subject_name]]):
+        return write()
+    return None
+
+
+def create_allocation_result_excel(result_df):
+    """
+    Create the combined results Excel file: the whole allocation in one sheet,
+    with a column per student headed by their name
+    """
+    names = dict(StudentProxyModel.objects.filter(pk__in=result_df.columns.tolist()).values_list('id', 'name'))
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        # Write the main allocation results
+        result_df.rename(columns=names).to_excel(writer, sheet_name='Student Allocations', index=True)
+    return output.getvalue()
+
+
 def generate_all_subject_excel_files(session_id, batch_id, stream_id):
     """
     Generate Excel files for all subjects and return them as a zip file or individual files
@@ -144,18 +179,9 @@ def generate_all_subject_excel_files(session_id, batch_id, stream_id):
         batch = get_object_or_404(Batch, pk=batch_id)
         stream = get_object_or_404(Stream, pk=stream_id)
         
-        # First check if we have cached data (from user edits)
-        from apps.course.views import get_cached_allocation
-        cached_result = get_cached_allocation(batch_id, session_id, stream_id)
-        
-        if cached_result is not None:
-            print("Using cached/edited allocation data for Excel generation")
-            result_df = cached_result
-        else:
-            # Run the algorithm if no cached data
-            print("Running fresh algorithm for Excel generation")
-            algorithm = GenericAlgorithm(batch, session, stream)
-            result_df = algorithm.run()
+        # Uses the edited or cached allocation when the inputs are unchanged
+        algorithm = get_allocation(batch, session, stream)
+        result_df = algorithm.result_df
         
         if result_df is None or result_df.empty:
             return None, "No allocation data available"
@@ -176,78 +202,80 @@ def create_master_excel_with_all_subjects(batch, semester, stream, result_df):
     if result_df is None or result_df.empty:
         return None
     
-    output = BytesIO()
-    
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+    # Look up every assigned student once for all the sheets
+    students = get_students_by_column(result_df)
+    semester_label = get_semester_label(semester)
+    assignments = list(iter_subject_assignments(result_df))
+
+    def get_sheets():
         # Create overview sheet
-        overview_data = []
-        for subject_name in result_df.index:
-            student_count = sum(result_df.loc[subject_name])
-            overview_data.append({
-                'Subject Name': subject_name,
-                'Number of Students': student_count,
-                'Batch': batch.name,
-                'Stream': stream.stream_name,
-                'Semester': f"{semester.semester}th semester of {semester.level}"
-            })
-        
-        overview_df = pd.DataFrame(overview_data)
-        overview_df.to_excel(writer, sheet_name='Overview', index=False)
-        
+        yield 'Overview', ['Subject Name', 'Number of Students', 'Batch', 'Stream', 'Semester'], (
+            (subject_name, len(assigned_students), batch.name, stream.stream_name, semester_label)
+            for subject_name, assigned_students in assignments)
+
         # Create a sheet for each subject
-        for subject_name in result_df.index:
-            assigned_students = []
-            for student_name in result_df.columns:
-                if result_df.at[subject_name, student_name] == 1:
-                    assigned_students.append(student_name)
-            
+        for subject_name, assigned_students in assignments:
             if assigned_students:
-                # Get detailed student information
-                student_details = []
-                for student_name in assigned_students:
-                    try:
-                        student = StudentProxyModel.objects.get(name=student_name, batch=batch, stream=stream)
-                        student_details.append({
-                            'Roll Number': student.roll_number,
-                            'Student Name': student.name,
-                            'Email': getattr(student, 'email', 'N/A'),
-                            'Phone': getattr(student, 'phone', 'N/A')
-                        })
-                    except StudentProxyModel.DoesNotExist:
-                        student_details.append({
-                            'Roll Number': 'N/A',
-                            'Student Name': student_name,
-                            'Email': 'N/A',
-                            'Phone': 'N/A'
-                        })
-                
-                subject_df = pd.DataFrame(student_details)
-                
                 # Create safe sheet name (Excel sheet names have limitations)
                 safe_sheet_name = subject_name[:30].replace('/', '-').replace('\\', '-').replace('?', '').replace('*', '').replace('[', '').replace(']', '')
-                subject_df.to_excel(writer, sheet_name=safe_sheet_name, index=False)
-    
-    output.seek(0)
-    return output.getvalue()
+                yield safe_sheet_name, ['Roll Number', 'Student Name', 'Email', 'Phone'], (
+                    get_master_student_row(students.get(student_id), student_id)
+                    for student_id in assigned_students)
 
+    return write_workbook(get_sheets())
 
-def create_zip_of_subject_files(excel_files, batch_name, stream_name, semester_info):
+
+def get_master_student_row(student, student_id):
+    if student is None:
+        return 'N/A', student_id, 'N/A', 'N/A'
+    return student.roll_number, student.name, getattr(student, 'email', 'N/A'), getattr(student, 'phone', 'N/A')
+
+
+class ZipStreamBuffer(io.RawIOBase):
     """
-    Create a ZIP file containing all individual subject Excel files
+    Unseekable file object zipfile writes into, collecting the bytes until they are taken
     """
-    import zipfile
-    from datetime import datetime
-    
-    zip_buffer = BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for subject_name, excel_data in excel_files.items():
-            # Create safe filename
-            safe_filename = f"{subject_name}_{batch_name}_{stream_name}.xlsx"
-            safe_filename = safe_filename.replace('/', '-').replace('\\', '-').replace('?', '').replace('*', '').replace('<', '').replace('>', '').replace('|', '')
-            
-            zip_file.writestr(safe_filename, excel_data)
-        
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def get_subject_file_name(subject_name, batch_name, stream_name):
+    # Create safe filename
+    safe_filename = f"{subject_name}_{batch_name}_{stream_name}.xlsx"
+    return safe_filename.replace('/', '-').replace('\\', '-').replace('?', '').replace('*', '').replace('<', '').replace('>', '').replace('|', '')
+
+
+def stream_zip_of_subject_files(subject_files, batch_name, stream_name, semester_info):
+    """
+    Generate a ZIP file of subject Excel files chunk by chunk
+    subject_files is an iterable of (subject name, write function) as yielded by
+    iter_subject_wise_excel_files; each workbook is written straight into the archive and
+    its compressed bytes are yielded before the next one is built
+    """
+    buffer = ZipStreamBuffer()
+    subject_names = []
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for subject_name, write in subject_files:
+            with zip_file.open(get_subject_file_name(subject_name, batch_name, stream_name), 'w') as zip_entry:
+                write(zip_entry)
+            subject_names.append(subject_name)
+            yield buffer.take()
+
         # Add a README file
         readme_content = f"""
 Elective Subject Allocation Results
@@ -265,9 +293,17 @@ Each Excel file contains:
 - Attendance Sheet template
 
 Files included:
-{chr(10).join([f"- {subject_name}_{batch_name}_{stream_name}.xlsx" for subject_name in excel_files.keys()])}
+{chr(10).join([f"- {subject_name}_{batch_name}_{stream_name}.xlsx" for subject_name in subject_names])}
         """
         zip_file.writestr("README.txt", readme_content)
-    
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+
+    yield buffer.take()
+
+
+def create_zip_of_subject_files(excel_files, batch_name, stream_name, semester_info):
+    """
+    Create a ZIP file containing all individual subject Excel files
+    """
+    subject_files = ((subject_name, lambda output, excel_data=excel_data: output.write(excel_data))
+                     for subject_name, excel_data in excel_files.items())
+    return b''.join(stream_zip_of_subject_files(subject_files, batch_name, stream_name, semester_info))
@@ -0,0 +1,22 @@
+"""
+Background job handler for priority uploads, see apps.system.jobs.
+"""
+from io import BytesIO
+
+from apps.course.models import ElectiveSession, Batch, Stream
+from apps.student.views import extract_student_pref
+from apps.system.jobs import update_job_progress
+
+
+def import_priorities(job):
+    """Import the uploaded Excel file of the job for its semester_id, stream_id and batch_id parameters"""
+    parameters = job.parameters
+    semester = ElectiveSession.objects.get(pk=parameters['semester_id'])
+    stream = Stream.objects.get(pk=parameters['stream_id'])
+    batch = Batch.objects.get(pk=parameters['batch_id'])
+
+    update_job_progress(job, 10, f'Importing {job.input_file_name}')
+    result = extract_student_pref(BytesIO(bytes(job.input_file)), semester, stream, batch)
+    if not result['success']:
+        raise ValueError(result['error'])
+    return result, None
@@ -1,8 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 
+from apps.algorithm.allocation_cache import invalidate_allocation_cache
 from apps.student.models import StudentProxyModel, ElectivePriority
 
 User = get_user_model()
@@ -24,3 +25,9 @@ def create_student_account(sender, instance, created, *args, **kwargs):
 def manage_priority_sememter(sender, instance, *args, **kwargs):
     if instance.student.current_semester is not  None:
         instance.session = instance.student.current_semester
+
+
+@receiver(post_save, sender=ElectivePriority)
+@receiver(post_delete, sender=ElectivePriority)
+def invalidate_allocation_on_priority_change(sender, instance, *args, **kwargs):
+    invalidate_allocation_cache(instance.session_id)
@@ -0,0 +1,125 @@
+"""
+Matching of the free-text subject names of an uploaded priority file to ElectiveSubject names.
+
+A SubjectMatcher is built once per import from the available subject names. It keeps
+the normalised keys of every subject and a trigram index over them, so a cell is
+answered by looking at the few subjects sharing trigrams with it instead of scanning
+every subject. Resolutions are cached by cell text, as Google Forms exports repeat the
+same answers for every student.
+"""
+import re
+from collections import defaultdict
+
+# Confidence of a match on the normalised name, with or without the instructor
+EXACT_CONFIDENCE = 1.0
+# Confidence of a match once spaces and punctuation are ignored, e.g. "Cyber Security"
+COMPACT_CONFIDENCE = 0.95
+# Smallest trigram similarity accepted for a name that neither equals nor contains a subject
+FUZZY_THRESHOLD = 0.6
+# A match is ambiguous when the runner-up scores within this margin of it
+AMBIGUITY_MARGIN = 0.1
+
+
+def normalize_text(value):
+    text = '' if value is None else str(value)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def normalize_key(value):
+    return normalize_text(value).lower()
+
+
+def normalize_subject(value):
+    # Handles entries like: "Quantum Computing (Dr. ... )"
+    text = normalize_text(value)
+    text = re.sub(r'\([^)]*\)', '', text)
+    text = re.sub(r'\s+', ' ', text).strip().lower()
+    return text
+
+
+def compact_key(value):
+    return re.sub(r'[^0-9a-z]', '', normalize_subject(value))
+
+
+def get_trigrams(key):
+    padded = '  %s ' % key
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def get_similarity(trigrams, other_trigrams):
+    """Dice coefficient of two trigram sets."""
+    if not trigrams or not other_trigrams:
+        return 0.0
+    return 2.0 * len(trigrams & other_trigrams) / (len(trigrams) + len(other_trigrams))
+
+
+class SubjectMatcher:
+    def __init__(self, subject_names):
+        """
+        :param subject_names: available subject names; on equal keys the last one wins
+        """
+        self.subject_names = list(subject_names)
+        self.exact_lookup = {}
+        self.compact_lookup = {}
+        # position of subject -> (normalised key, key without the instructor, trigrams)
+        self.keys = []
+        self.trigram_index = defaultdict(set)
+        self.resolutions = {}
+
+        for position, subject_name in enumerate(self.subject_names):
+            key, subject_key = normalize_key(subject_name), normalize_subject(subject_name)
+            self.exact_lookup[key] = subject_name
+            self.exact_lookup[subject_key] = subject_name
+            self.compact_lookup[compact_key(subject_name)] = subject_name
+
+            trigrams = get_trigrams(subject_key)
+            self.keys.append((key, subject_key, trigrams))
+            for trigram in trigrams:
+                self.trigram_index[trigram].add(position)
+
+    def match(self, text):
+        """
+        Return (subject name, confidence between 0 and 1) for a cell, or (None, 0.0) when no
+        subject matches it or several subjects match it about equally well
+        """
+        if text not in self.resolutions:
+            self.resolutions[text] = self.resolve(text)
+        return self.resolutions[text]
+
+    def resolve(self, text):
+        key, subject_key = normalize_key(text), normalize_subject(text)
+        exact_match = self.exact_lookup.get(key) or self.exact_lookup.get(subject_key)
+        if exact_match is not None:
+            return exact_match, EXACT_CONFIDENCE
+        compact_match = self.compact_lookup.get(compact_key(text))
+        if compact_match is not None:
+            return compact_match, COMPACT_CONFIDENCE
+
+        trigrams = get_trigrams(subject_key)
+        candidates = set()
+        for trigram in trigrams:
+            candidates |= self.trigram_index.get(trigram, set())
+
+        containing, similar = [], []
+        for position in candidates:
+            db_key, db_subject_key, db_trigrams = self.keys[position]
+            similarity = get_similarity(trigrams, db_trigrams)
+            if (
+                key in db_key or db_key in key or
+                subject_key in db_subject_key or db_subject_key in subject_key
+            ):
+                containing.append((similarity, position))
+            elif similarity >= FUZZY_THRESHOLD:
+                similar.append((similarity, position))
+
+        # One name containing the other beats any similarity without containment
+        for matches in (containing, similar):
+            if matches:
+                matches.sort(reverse=True)
+                if len(matches) > 1 and matches[0][0] - matches[1][0] < AMBIGUITY_MARGIN:
+                    # Ambiguous, e.g. "Computing" in both "Social Computing" and "Quantum Computing"
+                    return None, 0.0
+                similarity, position = matches[0]
+                return self.subject_names[position], similarity
+        return None, 0.0
@@ -1,3 +1,291 @@
-from django.test import TestCase
+import io
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from apps.authuser.models import User
+from apps.course.models import AcademicLevel, Batch, ElectiveSession, ElectiveSubject, Stream
+from apps.student.models import ElectivePriority
+
+from apps.student.subject_matcher import (
+    COMPACT_CONFIDENCE, EXACT_CONFIDENCE, FUZZY_THRESHOLD, SubjectMatcher, get_similarity, get_trigrams,
+    normalize_subject
+)
+from apps.student.views import extract_student_pref, is_priority_file_column, parse_priority_rows
+
+
+def get_subject_similarity(text, subject_name):
+    return get_similarity(get_trigrams(normalize_subject(text)), get_trigrams(normalize_subject(subject_name)))
+
+
+def write_sheet(sheet):
+    """Excel file of a DataFrame, as uploaded"""
+    file = io.BytesIO()
+    sheet.to_excel(file, index=False)
+    file.seek(0)
+    return file
+
+
+class SubjectMatcherTests(SimpleTestCase):
+    def test_exact_match_ignores_case_spaces_and_instructor(self):
+        matcher = SubjectMatcher(['Machine Learning', 'Quantum Computing'])
+        self.assertEqual(matcher.match('machine   LEARNING '), ('Machine Learning', EXACT_CONFIDENCE))
+        self.assertEqual(matcher.match('Quantum Computing (Dr. Sharma)'), ('Quantum Computing', EXACT_CONFIDENCE))
+
+    def test_exact_match_beats_containment(self):
+        # "Computing" is also contained in "Social Computing"
+        matcher = SubjectMatcher(['Social Computing', 'Computing'])
+        self.assertEqual(matcher.match('Computing'), ('Computing', EXACT_CONFIDENCE))
+
+    def test_compact_match_ignores_spaces_and_punctuation(self):
+        matcher = SubjectMatcher(['Cyber Security', 'Machine Learning'])
+        self.assertEqual(matcher.match('CyberSecurity'), ('Cyber Security', COMPACT_CONFIDENCE))
+        self.assertEqual(matcher.match('Machine-Learning'), ('Machine Learning', COMPACT_CONFIDENCE))
+
+    def test_fuzzy_match_above_threshold(self):
+        matcher = SubjectMatcher(['Advanced Computer Networks'])
+        similarity = get_subject_similarity('Adv Comp Networks', 'Advanced Computer Networks')
+        self.assertGreaterEqual(similarity, FUZZY_THRESHOLD)
+        self.assertEqual(matcher.match('Adv Comp Networks'), ('Advanced Computer Networks', similarity))
+
+    def test_fuzzy_match_below_threshold_is_rejected(self):
+        matcher = SubjectMatcher(['Advanced Computer Graphics'])
+        similarity = get_subject_similarity('Advanced Computr Netwrks', 'Advanced Computer Graphics')
+        self.assertGreater(similarity, 0.5)
+        self.assertLess(similarity, FUZZY_THRESHOLD)
+        self.assertEqual(matcher.match('Advanced Computr Netwrks'), (None, 0.0))
+
+    def test_subjects_differing_by_one_word(self):
+        matcher = SubjectMatcher(['Advanced Computer Networks', 'Advanced Computer Graphics'])
+        self.assertEqual(matcher.match('Advanced Computer Networks')[0], 'Advanced Computer Networks')
+        self.assertEqual(matcher.match('Advanced Computer Network')[0], 'Advanced Computer Networks')
+        self.assertEqual(matcher.match('Advnced Compter Grafics')[0], 'Advanced Computer Graphics')
+        self.assertEqual(matcher.match('Advanced Computr Netwrks')[0], 'Advanced Computer Networks')
+        # The words both names share are as close to one subject as to the other
+        self.assertEqual(matcher.match('Advanced Computer'), (None, 0.0))
+        self.assertEqual(matcher.match('Advanced Compter'), (None, 0.0))
+
+    def test_near_tie_is_ambiguous(self):
+        matcher = SubjectMatcher(['Social Computing', 'Quantum Computing'])
+        self.assertEqual(matcher.match('Computing'), (None, 0.0))
+
+    def test_clear_winner_beyond_ambiguity_margin(self):
+        # "Data Minin" is contained in both names, but much closer to the first one
+        matcher = SubjectMatcher(['Data Mining', 'Advanced Data Mining Techniques'])
+        self.assertEqual(matcher.match('Data Minin')[0], 'Data Mining')
+
+    def test_no_match(self):
+        matcher = SubjectMatcher(['Machine Learning', 'Cyber Security'])
+        self.assertEqual(matcher.match('Cryptography'), (None, 0.0))
+        self.assertEqual(matcher.match('Machn Lrnng'), (None, 0.0))
+        self.assertEqual(SubjectMatcher([]).match('Machine Learning'), (None, 0.0))
+
+
+class ParsePriorityRowsTests(SimpleTestCase):
+    """
+    parse_priority_rows validates a sheet column by column and must keep the rows and messages
+    of the former row by row loop of extract_student_pref
+    """
+    desired_column = 'How many electives do you want to register?'
+
+    def parse(self, sheet, roll_number_column, priority_columns, desired_elective_column):
+        df = pd.read_excel(write_sheet(sheet), usecols=is_priority_file_column)
+        return parse_priority_rows(df, roll_number_column, priority_columns, desired_elective_column,
+                                   SubjectMatcher(['Blockchain', 'Machine Learning', 'Networking']))
+
+    def test_fixture_sheet(self):
+        sheet = pd.DataFrame({
+            'Timestamp': ['2024-11-01'] * 10,
+            'Roll Number': ['078BCT001', None, '078BC', '078BCT004', '078BCT005', '078BCT006', ' 078BCT007 ',
+                            78123456, '078BCT009', '078BCT001'],
+            'Priority 2': ['Blockchain', 'Blockchain', 'Blockchain', None, 'machine learning', 'Networking', None,
+                           'Networking', 'Networking', 'Networking'],
+            'Priority 1': ['Machine Learning', 'Machine Learning', 'Networking', None, 'Machine Learning',
+                           'Cryptography', 'Machine Learning', 'Blockchain', 'Blockchain (Dr. Rai)', 'Blockchain'],
+            'Priority 3': [None, None, None, None, None, 'Astrology', 'Networking', None, 'Machine Learnin',
+                           'Machine Learning'],
+            self.desired_column: [2.0, np.nan, 2, 2, 2, 2, np.nan, 3.7, 0, 1],
+            'Remarks': ['', 'late', '', '', '', '', '', '', '', ''],
+        })
+        rows, errors_by_row = self.parse(sheet, 'Roll Number', ['Priority 1', 'Priority 2', 'Priority 3'],
+                                         self.desired_column)
+
+        self.assertEqual(rows, [
+            (0, '078BCT001', ['Machine Learning', 'Blockchain'], 2),
+            # Blank cells between priorities are skipped
+            (6, '078BCT007', ['Machine Learning', 'Networking'], None),
+            # Desired numbers stored as floats are truncated
+            (7, '78123456', ['Blockchain', 'Networking'], 3),
+            (8, '078BCT009', ['Blockchain', 'Networking', 'Machine Learning'], None),
+            # A later row of the same student is kept as well, extract_student_pref saves the last one
+            (9, '078BCT001', ['Blockchain', 'Networking', 'Machine Learning'], 1),
+        ])
+        self.assertEqual(errors_by_row, {
+            1: 'Row 3: Roll Number is empty',
+            2: 'Row 4: Invalid roll number format. Expected format: 079bct007',
+            3: 'Row 5: No priorities provided',
+            4: 'Row 6: Duplicate subjects found. Each subject should appear only once.',
+            5: 'Row 7: Invalid subject names: Cryptography, Astrology',
+        })
+
+    def test_numbers_stored_as_floats(self):
+        # A roll number column of numbers with a blank cell is read as floats
+        sheet = pd.DataFrame({
+            'Roll No': [78123456, None, 78123458],
+            'Priority 1': ['Blockchain', 'Blockchain', 'Networking'],
+            'Priority 2': ['Networking', 'Networking', 'Blockchain'],
+            'No of electives': ['2', 'two', None],
+        })
+        rows, errors_by_row = self.parse(sheet, 'Roll No', ['Priority 1', 'Priority 2'], 'No of electives')
+
+        self.assertEqual(rows, [
+            (0, '78123456.0', ['Blockchain', 'Networking'], 2),
+            (2, '78123458.0', ['Networking', 'Blockchain'], None),
+        ])
+        self.assertEqual(errors_by_row, {1: 'Row 3: Roll Number is empty'})
+
+    def test_extra_columns_are_not_read(self):
+        sheet = pd.DataFrame({
+            'Timestamp': ['2024-11-01'], 'Email Address': ['student@example.com'], 'Roll Number': ['078BCT001'],
+            'Priority 1': ['Blockchain'], 'Comments': ['none'], self.desired_column: [1],
+        })
+        df = pd.read_excel(write_sheet(sheet), usecols=is_priority_file_column)
+        self.assertEqual(list(df.columns), ['Roll Number', 'Priority 1', self.desired_column])
+
+
+class ImportPrioritiesTests(TestCase):
+    """extract_student_pref and the Excel upload of enter_priority_in_bulk"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.level = AcademicLevel.objects.create(name='Bachelors')
+        cls.batch = Batch.objects.create(name='2078')
+        cls.stream = Stream.objects.create(stream_name='Computer', level=cls.level)
+        cls.semester = ElectiveSession.objects.create(level=cls.level, semester=7, min_student=5, subjects_provided=2)
+        for name in ('Blockchain', 'Machine Learning', 'Networking'):
+            ElectiveSubject.objects.create(subject_name=name, elective_for=cls.semester, stream=cls.stream,
+                                           min_students=5, max_students=24)
+        for number in range(3):
+            User.objects.create(username='078BCT%03d' % number, name='Student %d' % number,
+                                roll_number='078BCT%03d' % number, user_type='Student', batch=cls.batch,
+                                stream=cls.stream, level=cls.level, current_semester=cls.semester)
+
+    def make_sheet(self, *rows):
+        """Sheet of (roll number, priority 1, priority 2, priority 3) rows"""
+        return write_sheet(pd.DataFrame(
+            rows, columns=['Roll Number', 'Priority 1', 'Priority 2', 'Priority 3']))
+
+    def import_sheet(self, *rows):
+        return extract_student_pref(self.make_sheet(*rows), self.semester, self.stream, self.batch)
+
+    def get_priorities(self):
+        """(roll number, subject name, priority, desired number of subjects) of every saved priority"""
+        return sorted(ElectivePriority.objects.filter(session=self.semester).values_list(
+            'student__roll_number', 'subject__subject_name', 'priority', 'desired_number_of_subjects'))
+
+    def test_valid_sheet(self):
+        result = self.import_sheet(('078BCT000', 'Blockchain', 'Networking', None),
+                                   ('078BCT001', 'Machine Learning', 'Blockchain', 'Networking'))
+
+        self.assertEqual(result, {'success': True, 'count': 2, 'error': None})
+        self.assertEqual(self.get_priorities(), [
+            ('078BCT000', 'Blockchain', 1, 2),
+            ('078BCT000', 'Networking', 2, 2),
+            ('078BCT001', 'Blockchain', 2, 2),
+            ('078BCT001', 'Machine Learning', 1, 2),
+            ('078BCT001', 'Networking', 3, 2),
+        ])
+
+    def test_unknown_subject(self):
+        result = self.import_sheet(('078BCT000', 'Blockchain', 'Networking', None),
+                                   ('078BCT001', 'Machine Learning', 'Cryptography', None))
+
+        self.assertEqual(result, {
+            'success': True, 'count': 1,
+            'error': 'Processed 1 students successfully. Errors: Row 3: Invalid subject names: Cryptography',
+        })
+        self.assertEqual(self.get_priorities(), [
+            ('078BCT000', 'Blockchain', 1, 2),
+            ('078BCT000', 'Networking', 2, 2),
+        ])
+
+    def test_invalid_rows(self):
+        result = self.import_sheet(('078BCT000', 'Blockchain', 'Networking', None),
+                                   ('078BC', 'Blockchain', 'Networking', None),
+                                   ('078BCT099', 'Blockchain', 'Networking', None),
+                                   (None, 'Blockchain', 'Networking', None),
+                                   ('078BCT001', 'Blockchain', 'blockchain', None))
+
+        self.assertEqual(result, {
+            'success': True, 'count': 1,
+            'error': 'Processed 1 students successfully. Errors: '
+                     'Row 3: Invalid roll number format. Expected format: 079bct007; '
+                     'Row 4: Student with roll number "078BCT099" not found in database; '
+                     'Row 5: Roll Number is empty and 1 more errors.',
+        })
+        self.assertEqual(self.get_priorities(), [
+            ('078BCT000', 'Blockchain', 1, 2),
+            ('078BCT000', 'Networking', 2, 2),
+        ])
+
+    def test_import_replaces_priorities(self):
+        self.import_sheet(('078BCT000', 'Blockchain', 'Networking', 'Machine Learning'),
+                          ('078BCT001', 'Blockchain', 'Networking', None))
+        result = self.import_sheet(('078BCT000', 'Networking', 'Blockchain', None))
+
+        self.assertEqual(result, {'success': True, 'count': 1, 'error': None})
+        self.assertEqual(self.get_priorities(), [
+            ('078BCT000', 'Blockchain', 2, 2),
+            ('078BCT000', 'Networking', 1, 2),
+            ('078BCT001', 'Blockchain', 1, 2),
+            ('078BCT001', 'Networking', 2, 2),
+        ])
+
+    def test_failed_save_is_rolled_back(self):
+        self.import_sheet(('078BCT000', 'Blockchain', 'Networking', None))
+        with mock.patch.object(ElectivePriority.objects, 'bulk_create', side_effect=DatabaseError('disk full')):
+            result = self.import_sheet(('078BCT000', 'Networking', 'Machine Learning', None),
+                                       ('078BCT001', 'Blockchain', 'Networking', None))
+
+        self.assertEqual(result, {
+            'success': False, 'error': 'Failed to save priorities, nothing was imported: disk full'
+        })
+        # The priorities deleted before bulk_create are back
+        self.assertEqual(self.get_priorities(), [
+            ('078BCT000', 'Blockchain', 1, 2),
+            ('078BCT000', 'Networking', 2, 2),
+        ])
+
+    def test_import_invalidates_allocation_cache(self):
+        with mock.patch('apps.student.views.invalidate_allocation_cache') as invalidate_allocation_cache:
+            self.import_sheet(('078BCT000', 'Blockchain', 'Networking', None))
+        invalidate_allocation_cache.assert_called_once_with(self.semester.pk)
+
+        with mock.patch('apps.student.views.invalidate_allocation_cache') as invalidate_allocation_cache:
+            self.import_sheet(('078BCT000', 'Blockchain', 'Cryptography', None))
+        invalidate_allocation_cache.assert_not_called()
+
+    def test_upload_messages(self):
+        data = {'batch': self.batch.pk, 'level': self.level.pk, 'stream': self.stream.pk,
+                'semester': self.semester.pk, '_upload_excel': 'Upload'}
+
+        excel_file = self.make_sheet(('078BCT000', 'Blockchain', 'Networking', None))
+        excel_file.name = 'priorities.xlsx'
+        response = self.client.post(reverse('enter_priorities'), dict(data, excel_file=excel_file))
+        self.assertEqual(response.context['message'],
+                         'Excel file "priorities.xlsx" uploaded successfully! 1 students processed.')
+
+        excel_file = self.make_sheet(('078BCT001', 'Blockchain', 'Cryptography', None))
+        excel_file.name = 'priorities.xlsx'
+        response = self.client.post(reverse('enter_priorities'), dict(data, excel_file=excel_file))
+        self.assertEqual(response.context['message'],
+                         'Excel file processed with warnings: Processed 0 students successfully. '
+                         'Errors: Row 2: Invalid subject names: Cryptography')
+        self.assertEqual(self.get_priorities(), [
+            ('078BCT000', 'Blockchain', 1, 2),
+            ('078BCT000', 'Networking', 2, 2),
+        ])
@@ -1,12 +1,37 @@
 from django.template.response import TemplateResponse
+import numpy as np
 import pandas as pd
 import re
+from django.db import transaction
+from django.urls import reverse
+from apps.algorithm.allocation_cache import invalidate_allocation_cache
 from apps.authuser.models import StudentProxyModel
 from apps.course.forms import PriorityEntryDetailFormset
 from apps.course.models import ElectiveSubject
 from apps.student.formsets import PriorityFormset
+from apps.student.models import ElectivePriority
+from apps.student.subject_matcher import SubjectMatcher, normalize_key
+from apps.system.jobs import enqueue_job
 from apps.system.views import get_admin_context
 
+ROLL_NUMBER_COLUMN_ALIASES = ['Roll Number', 'Roll No', 'Roll No.', 'Roll', 'Symbol Number', 'Student ID']
+DESIRED_ELECTIVE_COLUMN_ALIASES = [
+    'How many electives do you want to register?',
+    'How many electives do you want to take?',
+    'No of electives',
+    'Number of electives',
+    'Desired Number of Subjects',
+    'Desired number of subjects'
+]
+PRIORITY_COLUMN_PATTERN = r'^priority\s*(\d+)$'
+PRIORITY_FILE_COLUMN_KEYS = {normalize_key(alias) for alias in ROLL_NUMBER_COLUMN_ALIASES + DESIRED_ELECTIVE_COLUMN_ALIASES}
+
+
+def is_priority_file_column(column):
+    """Whether extract_student_pref can use a column of an uploaded file, given its header"""
+    key = normalize_key(column)
+    return key in PRIORITY_FILE_COLUMN_KEYS or re.match(PRIORITY_COLUMN_PATTERN, key) is not None
+
 
 def enter_priority_in_bulk(request, *args, **kwargs):
     context = get_admin_context()
@@ -14,7 +39,7 @@ def enter_priority_in_bulk(request, *args, **kwargs):
     
     if request.method == 'GET':
         form = PriorityEntryDetailFormset    
-    elif '_upload_excel' in request.POST:
+    elif '_upload_excel' in request.POST or '_upload_excel_in_background' in request.POST:
         form = PriorityEntryDetailFormset(request.POST)
         excel_file = request.FILES.get('excel_file')
         
@@ -25,17 +50,27 @@ def enter_priority_in_bulk(request, *args, **kwargs):
                 stream = form.cleaned_data.get('stream', None)
                 batch = form.cleaned_data.get('batch', None)
                 
-                try:
-                    result = extract_student_pref(excel_file, semester, stream, batch)
-                    if result['success']:
-                        if result['error']:
-                            context['message'] = f'Excel file processed with warnings: {result["error"]}'
+                if '_upload_excel_in_background' in request.POST and not request.user.is_staff:
+                    context['message'] = 'Log in as staff to import an Excel file in the background.'
+                elif '_upload_excel_in_background' in request.POST:
+                    # Import outside the request, the page polls the job until it has finished
+                    job = enqueue_job('import_priorities', {
+                        'semester_id': semester.pk, 'stream_id': stream.pk, 'batch_id': batch.pk
+                    }, excel_file, user=request.user)
+                    context['message'] = f'Excel file "{excel_file.name}" queued for import as job #{job.pk}.'
+                    context['job_status_url'] = reverse('job_status', args=[job.pk])
+                else:
+                    try:
+                        result = extract_student_pref(excel_file, semester, stream, batch)
+                        if result['success']:
+                            if result['error']:
+                                context['message'] = f'Excel file processed with warnings: {result["error"]}'
+                            else:
+                                context['message'] = f'Excel file "{excel_file.name}" uploaded successfully! {result["count"]} students processed.'
                         else:
-                            context['message'] = f'Excel file "{excel_file.name}" uploaded successfully! {result["count"]} students processed.'
-                    else:
-                        context['message'] = f'Error: {result["error"]}'
-                except Exception as e:
-                    context['message'] = f'Error processing Excel file: {str(e)}'
+                            context['message'] = f'Error: {result["error"]}'
+                    except Exception as e:
+                        context['message'] = f'Error processing Excel file: {str(e)}'
             else:
                 context['message'] = 'Please select Batch, Level, Stream, and Semester before uploading Excel file.'
         else:
@@ -82,55 +117,32 @@ def extract_student_pref(file, semester, stream, batch):
     For non-masters students, default remains 2.
     """
     try:
-        def _normalize_text(value):
-            text = '' if value is None else str(value)
-            text = re.sub(r'\s+', ' ', text).strip()
-            return text
-
-        def _normalize_key(value):
-            return _normalize_text(value).lower()
-
-        def _normalize_subject(value):
-            # Handles entries like: "Quantum Computing (Dr. ... )"
-            text = _normalize_text(value)
-            text = re.sub(r'\([^)]*\)', '', text)
-            text = re.sub(r'\s+', ' ', text).strip().lower()
-            return text
-
         def _find_column(df_columns, aliases):
-            normalized = {_normalize_key(col): col for col in df_columns}
+            normalized = {normalize_key(col): col for col in df_columns}
             for alias in aliases:
-                alias_key = _normalize_key(alias)
+                alias_key = normalize_key(alias)
                 if alias_key in normalized:
                     return normalized[alias_key]
             return None
 
-        # Read Excel file
-        df = pd.read_excel(file)
+        # Read Excel file, skipping columns that are never used
+        df = pd.read_excel(file, usecols=is_priority_file_column)
+        columns = df.columns
 
         # Detect columns in a flexible way
-        roll_number_column = _find_column(df.columns, [
-            'Roll Number', 'Roll No', 'Roll No.', 'Roll', 'Symbol Number', 'Student ID'
-        ])
+        roll_number_column = _find_column(columns, ROLL_NUMBER_COLUMN_ALIASES)
         if not roll_number_column:
             return {
                 'success': False,
                 'error': 'Could not find a roll number column. Supported headers: Roll Number / Roll No / Roll.'
             }
 
-        desired_elective_column = _find_column(df.columns, [
-            'How many electives do you want to register?',
-            'How many electives do you want to take?',
-            'No of electives',
-            'Number of electives',
-            'Desired Number of Subjects',
-            'Desired number of subjects'
-        ])
+        desired_elective_column = _find_column(columns, DESIRED_ELECTIVE_COLUMN_ALIASES)
 
         priority_columns = []
-        for col in df.columns:
-            key = _normalize_key(col)
-            match = re.match(r'^priority\s*(\d+)$', key)
+        for col in columns:
+            key = normalize_key(col)
+            match = re.match(PRIORITY_COLUMN_PATTERN, key)
             if match:
                 priority_columns.append((int(match.group(1)), col))
 
@@ -149,136 +161,68 @@ def extract_student_pref(file, semester, stream, batch):
             }
         
         # Get available subjects from database for the specified semester and stream
-        available_subjects = list(ElectiveSubject.objects.filter(
+        subject_ids = {}
+        for subject_name, subject_id in ElectiveSubject.objects.filter(
             elective_for=semester, 
             stream=stream
-        ).values_list('subject_name', flat=True))
+        ).values_list('subject_name', 'id'):
+            subject_ids.setdefault(subject_name, subject_id)
+        available_subjects = list(subject_ids)
 
-        # Build normalized lookup for robust matching
-        normalized_subject_lookup = {}
-        for subject_name in available_subjects:
-            normalized_subject_lookup[_normalize_key(subject_name)] = subject_name
-            normalized_subject_lookup[_normalize_subject(subject_name)] = subject_name
+        # Index the subjects once for matching every priority cell of the file
+        subject_matcher = SubjectMatcher(available_subjects)
+
+        # Validate every row column by column
+        rows, errors_by_row = parse_priority_rows(df, roll_number_column, priority_columns, desired_elective_column,
+                                                  subject_matcher)
+
+        # Resolve every student of the file with a single query
+        students_by_roll_number = {}
+        for student in StudentProxyModel.objects.filter(
+                roll_number__in={roll_number for _, roll_number, _, _ in rows}).select_related('level'):
+            students_by_roll_number.setdefault(student.roll_number, []).append(student)
         
-        # Process each row
         processed_count = 0
-        errors = []
+        # student id -> (student, resolved priorities, desired number of subjects) of the last valid row
+        valid_priorities = {}
         
-        for index, row in df.iterrows():
+        for index, roll_number, resolved_priorities, desired_count in rows:
             try:
-                # Extract data
-                roll_number = _normalize_text(row.get(roll_number_column))
-                
-                # Validate roll number
-                if not roll_number or roll_number.lower() == 'nan':
-                    errors.append(f'Row {index + 2}: Roll Number is empty')
+                # Find student by roll number
+                students = students_by_roll_number.get(roll_number, [])
+                if not students:
+                    errors_by_row[index] = f'Row {index + 2}: Student with roll number "{roll_number}" not found in database'
                     continue
-                if len(roll_number) < 6:  # Minimum length check
-                    errors.append(f'Row {index + 2}: Invalid roll number format. Expected format: 079bct007')
+                if len(students) > 1:
+                    errors_by_row[index] = f'Row {index + 2}: Error processing row - {len(students)} students have roll number "{roll_number}"'
                     continue
-                # Collect all priorities from Priority 1..N
-                priorities = [_normalize_text(row.get(col)) for col in priority_columns]
-                
-                # Remove empty/nan values
-                priorities = [p for p in priorities if p and p.lower() != 'nan']
+                student = students[0]
 
-                if not priorities:
-                    errors.append(f'Row {index + 2}: No priorities provided')
-                    continue
+                # Determine desired number of subjects
+                is_masters_student = bool(student.level and 'masters' in student.level.name.lower())
+                default_desired_count = 3 if is_masters_student else 2
+                desired_number_of_subjects = desired_count or default_desired_count
 
-                  # Validate that subjects exist in database (flexible matching)
-                invalid_subjects = []
-                matched_subjects = {}  # Store mapping of input to actual database subject
-                
-                for priority in priorities:
-                    priority_key = _normalize_key(priority)
-                    priority_subject_key = _normalize_subject(priority)
-
-                    exact_match = normalized_subject_lookup.get(priority_key) or normalized_subject_lookup.get(priority_subject_key)
-
-                    if exact_match is not None:
-                        matched_subjects[priority] = exact_match
-                    else:
-                        # Try partial match in both directions
-                        partial_match = None
-                        for db_subject in available_subjects:
-                            db_key = _normalize_key(db_subject)
-                            db_subject_key = _normalize_subject(db_subject)
-                            if (
-                                priority_key in db_key or db_key in priority_key or
-                                priority_subject_key in db_subject_key or db_subject_key in priority_subject_key
-                            ):
-                                partial_match = db_subject
-                                break
-                        
-                        if partial_match:
-                            matched_subjects[priority] = partial_match
-                        else:
-                            invalid_subjects.append(priority)
-                
-                if invalid_subjects:
-                    errors.append(f'Row {index + 2}: Invalid subject names: {", ".join(invalid_subjects)}')
-                    continue
-                
-                # Check for duplicate subjects (after matching with DB names)
-                resolved_priorities = [matched_subjects[p] for p in priorities]
-                if len(set(resolved_priorities)) != len(resolved_priorities):
-                    errors.append(f'Row {index + 2}: Duplicate subjects found. Each subject should appear only once.')
-                    continue
-                  # TODO: Save to database
-                # Find student by roll number and save priorities
-                try:
-                    student = StudentProxyModel.objects.get(roll_number=roll_number)
-
-                    # Determine desired number of subjects
-                    is_masters_student = bool(student.level and 'masters' in student.level.name.lower())
-                    default_desired_count = 3 if is_masters_student else 2
-                    desired_number_of_subjects = default_desired_count
-
-                    if desired_elective_column:
-                        desired_raw = row.get(desired_elective_column)
-                        if pd.notna(desired_raw):
-                            desired_text = _normalize_text(desired_raw)
-                            try:
-                                parsed_value = int(float(desired_text))
-                                if parsed_value > 0:
-                                    desired_number_of_subjects = parsed_value
-                            except (TypeError, ValueError):
-                                pass
-
-                    # Cannot request more subjects than priorities provided
-                    desired_number_of_subjects = min(desired_number_of_subjects, len(resolved_priorities))
-                    
-                    # Save priorities to database
-                    from apps.student.models import ElectivePriority
-                      # Clear existing priorities for this student for this session
-                    ElectivePriority.objects.filter(student=student, session=semester).delete()
-                      # Save new priorities
-                    for priority_index, actual_subject_name in enumerate(resolved_priorities, 1):
-                        subject = ElectiveSubject.objects.get(
-                            subject_name=actual_subject_name,
-                            elective_for=semester,
-                            stream=stream,
-                        )
-                        ElectivePriority.objects.create(
-                            student=student,
-                            subject=subject,
-                            priority=priority_index,
-                            session=semester,  # Set the session/semester
-                            desired_number_of_subjects=desired_number_of_subjects
-                        )
-                    
-                except StudentProxyModel.DoesNotExist:
-                    errors.append(f'Row {index + 2}: Student with roll number "{roll_number}" not found in database')
-                    continue
-                except ElectiveSubject.DoesNotExist as e:
-                    errors.append(f'Row {index + 2}: Subject not found in database - {str(e)}')
-                    continue
-                
+                # Cannot request more subjects than priorities provided
+                desired_number_of_subjects = min(desired_number_of_subjects, len(resolved_priorities))
+
+                # A later row of the same student replaces the earlier one and is saved in its place
+                valid_priorities.pop(student.id, None)
+                valid_priorities[student.id] = (student, resolved_priorities, desired_number_of_subjects)
                 processed_count += 1
                 
             except Exception as e:
-                errors.append(f'Row {index + 2}: Error processing row - {str(e)}')
+                errors_by_row[index] = f'Row {index + 2}: Error processing row - {str(e)}'
+        errors = [errors_by_row[index] for index in sorted(errors_by_row)]
+
+        # Replace the priorities of every valid student at once, so a failure leaves nothing half imported
+        try:
+            save_priorities(semester, subject_ids, valid_priorities.values())
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Failed to save priorities, nothing was imported: {str(e)}'
+            }
         
         # Return results
         if errors:
@@ -302,3 +246,109 @@ def extract_student_pref(file, semester, stream, batch):
             'success': False,
             'error': f'Failed to read Excel file: {str(e)}'
         }
+
+
+def normalize_column(column):
+    """normalize_text for a whole column, with empty cells as ''"""
+    text = column.astype(str).str.replace(r'\s+', ' ', regex=True).str.strip()
+    return text.where(column.notna(), '')
+
+
+def is_empty_text(text):
+    return (text == '') | (text.str.lower() == 'nan')
+
+
+def parse_priority_rows(df, roll_number_column, priority_columns, desired_elective_column, subject_matcher):
+    """
+    Validate the rows of an uploaded priority sheet with vectorised masks
+    Every distinct subject cell is matched once through subject_matcher.
+    Returns (rows, errors_by_row): rows is a list of (row index, roll number, subject names in priority
+    order, desired number of subjects or None) of the valid rows, and errors_by_row maps the index of
+    each invalid row to its error message
+    """
+    roll_numbers = normalize_column(df[roll_number_column])
+    roll_number_empty = is_empty_text(roll_numbers).to_numpy()
+    roll_number_too_short = (roll_numbers.str.len() < 6).to_numpy()  # Minimum length check
+
+    # Priority 1..N cells, without empty/nan values, normalised as a single block
+    priority_cells = normalize_column(pd.Series(df[priority_columns].to_numpy(dtype=object).ravel(), dtype=object))
+    filled = ~is_empty_text(priority_cells).to_numpy().reshape(len(df), len(priority_columns))
+    priority_texts = priority_cells.to_numpy(dtype=object).reshape(filled.shape)
+
+    # Validate that subjects exist in database (flexible matching), once per distinct text
+    subject_positions = {subject_name: position for position, subject_name in enumerate(subject_matcher.subject_names)}
+    subject_by_text = {text: subject_matcher.match(text)[0] for text in pd.unique(priority_texts[filled])}
+    # Position of the matched subject of every cell, -1 for subjects not found
+    subject_codes = np.full(priority_texts.shape, -1, dtype=np.int64)
+    subject_codes[filled] = pd.Series(priority_texts[filled], dtype=object).map(
+        lambda text: subject_positions.get(subject_by_text[text], -1)).to_numpy(dtype=np.int64)
+    invalid = filled & (subject_codes < 0)
+
+    # Check for duplicate subjects (after matching with DB names): empty cells get distinct negative codes
+    unique_fillers = -2 - np.arange(subject_codes.size, dtype=np.int64).reshape(subject_codes.shape)
+    sorted_codes = np.sort(np.where(filled & ~invalid, subject_codes, unique_fillers), axis=1)
+    has_duplicates = (sorted_codes[:, 1:] == sorted_codes[:, :-1]).any(axis=1)
+
+    desired_counts = np.full(len(df), 0, dtype=np.int64)
+    if desired_elective_column:
+        desired_values = np.trunc(pd.to_numeric(normalize_column(df[desired_elective_column]),
+                                                errors='coerce').to_numpy(dtype=float))
+        positive = np.isfinite(desired_values) & (desired_values > 0)
+        desired_counts[positive] = desired_values[positive]
+
+    # First failing check of every row
+    checks = [
+        (roll_number_empty, lambda index, row: f'Row {index + 2}: Roll Number is empty'),
+        (roll_number_too_short, lambda index, row: f'Row {index + 2}: Invalid roll number format. Expected format: 079bct007'),
+        (~filled.any(axis=1), lambda index, row: f'Row {index + 2}: No priorities provided'),
+        (invalid.any(axis=1), lambda index, row: f'Row {index + 2}: Invalid subject names: {", ".join(priority_texts[row][invalid[row]])}'),
+        (has_duplicates, lambda index, row: f'Row {index + 2}: Duplicate subjects found. Each subject should appear only once.'),
+    ]
+    failed = np.zeros(len(df), dtype=bool)
+    errors_by_row = {}
+    for mask, get_message in checks:
+        for row in np.flatnonzero(mask & ~failed):
+            errors_by_row[df.index[row]] = get_message(df.index[row], row)
+        failed |= mask
+
+    rows = []
+    subject_names = subject_matcher.subject_names
+    roll_numbers = roll_numbers.to_numpy(dtype=object)
+    for row in np.flatnonzero(~failed):
+        rows.append((df.index[row], roll_numbers[row],
+                     [subject_names[code] for code in subject_codes[row][filled[row]]],
+                     int(desired_counts[row]) or None))
+    return rows, errors_by_row
+
+
+def save_priorities(semester, subject_ids, student_priorities):
+    """
+    Replace the priorities of students for a semester inside a single transaction
+    :param subject_ids: dict of subject name -> subject id
+    :param student_priorities: iterable of (student, subject names in priority order, desired number of subjects)
+    """
+    student_priorities = list(student_priorities)
+    if not student_priorities:
+        return
+    priorities = []
+    for student, subject_names, desired_number_of_subjects in student_priorities:
+        # Priorities belong to the current semester of the student when it has one, see manage_priority_sememter
+        session_id = student.current_semester_id if student.current_semester_id is not None else semester.id
+        for priority_index, subject_name in enumerate(subject_names, 1):
+            priorities.append(ElectivePriority(
+                student=student,
+                subject_id=subject_ids[subject_name],
+                priority=priority_index,
+                session_id=session_id,
+                desired_number_of_subjects=desired_number_of_subjects
+            ))
+
+    with transaction.atomic():
+        # Clear existing priorities of these students for this session
+        ElectivePriority.objects.filter(student__in=[student for student, _, _ in student_priorities],
+                                        session=semester).delete()
+        ElectivePriority.objects.bulk_create(priorities)
+
+    # bulk_create sends no post_save signals, so drop the cached allocations here
+    for session_id in {priority.session_id for priority in priorities}:
+        invalidate_allocation_cache(session_id)
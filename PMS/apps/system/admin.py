@@ -1,3 +1,20 @@
 from django.contrib import admin
 
+from apps.system.models import Job
+
 # Register your models here.
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress', 'message', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('kind', 'status', 'parameters', 'input_file_name', 'progress', 'message', 'result',
+                       'artifact_name', 'error', 'worker', 'created_by', 'created_at', 'started_at',
+                       'updated_at', 'finished_at')
+    exclude = ('input_file', 'artifact', 'artifact_content_type')
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(Job, JobAdmin)
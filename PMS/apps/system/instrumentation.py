@@ -0,0 +1,287 @@
+"""
+Opt-in per-request instrumentation of the report and download views.
+
+With settings.REQUEST_TIMING_ENABLED, RequestTimingMiddleware records for every request
+under one of settings.REQUEST_TIMING_PATHS the wall time of each named stage (see
+timed_stage), the number and total time of SQL queries and the peak memory. The numbers
+are sent in a Server-Timing header and written as one JSON line to the
+'pms.request_timing' logger, which by default writes to a rotating file that the
+request timings admin page aggregates.
+
+Streamed responses (the subject-wise ZIP) are built while they are sent, so their
+Server-Timing header only covers the work done before the first chunk; the log line is
+written once the last chunk was produced and includes the whole build.
+
+The peak memory of settings.REQUEST_TIMING_TRACE_MEMORY is the peak of the whole process:
+tracemalloc has a single peak, which every instrumented request resets when it starts. It is
+only meaningful while one request is served at a time, e.g. a single threaded runserver or
+one sync worker with one thread; with concurrent requests a peak includes the allocations of
+the others and a request starting meanwhile resets it.
+"""
+import json
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils import timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger('pms.request_timing')
+
+current_profile = ContextVar('current_request_profile', default=None)
+
+DEFAULT_PATHS = ('/report/', '/download-allocation/', '/course/session/')
+DEFAULT_LOG_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_LOG_BACKUP_COUNT = 5
+
+
+def get_log_file():
+    return getattr(settings, 'REQUEST_TIMING_LOG_FILE', os.path.join(settings.BASE_DIR, 'logs', 'request_timing.log'))
+
+
+def get_peak_rss_kib():
+    """High-water mark of the resident memory of this process, None where it cannot be read"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class RequestProfile:
+    """Stage timings, query count and query time of one request"""
+
+    def __init__(self, request):
+        self.method = request.method
+        self.path = request.path
+        self.started_at = timezone.now()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.peak_traced_kib = None
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - start
+
+    @contextmanager
+    def activate(self):
+        """Make this the current profile and count the queries run meanwhile"""
+        token = current_profile.set(self)
+        try:
+            with connection.execute_wrapper(self.record_query):
+                yield self
+        finally:
+            current_profile.reset(token)
+
+    def get_server_timing(self):
+        metrics = ['%s;dur=%.1f' % (name, seconds * 1000) for name, seconds in self.stages.items()]
+        metrics.append('db;dur=%.1f;desc="%d queries"' % (self.query_seconds * 1000, self.queries))
+        if self.peak_traced_kib is not None:
+            metrics.append('mem;desc="peak %.1f MiB"' % (self.peak_traced_kib / 1024))
+        elif get_peak_rss_kib() is not None:
+            metrics.append('rss;desc="process peak %.1f MiB"' % (get_peak_rss_kib() / 1024))
+        metrics.append('total;dur=%.1f' % ((time.perf_counter() - self.start) * 1000))
+        return ', '.join(metrics)
+
+    def get_record(self, endpoint, status_code, streamed):
+        return {
+            'time': self.started_at.isoformat(),
+            'method': self.method,
+            'path': self.path,
+            'endpoint': endpoint,
+            'status': status_code,
+            'streamed': streamed,
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 2),
+            'stages_ms': {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            'queries': self.queries,
+            'query_ms': round(self.query_seconds * 1000, 2),
+            'peak_traced_kib': self.peak_traced_kib,
+            'peak_rss_kib': get_peak_rss_kib(),
+        }
+
+
+@contextmanager
+def timed_stage(name):
+    """Add the wall time of the enclosed block to the stage name of the current request, if it is instrumented"""
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_stage(name, time.perf_counter() - start)
+
+
+def timed_chunks(name, chunks):
+    """Yield from chunks, adding the time spent producing them to the stage name"""
+    chunks = iter(chunks)
+    while True:
+        with timed_stage(name):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def add_file_handler():
+    """Write the timing log to a rotating file, unless settings.LOGGING already configured a handler"""
+    if logger.handlers:
+        return
+    log_file = get_log_file()
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    handler = RotatingFileHandler(
+        log_file,
+        maxBytes=getattr(settings, 'REQUEST_TIMING_LOG_MAX_BYTES', DEFAULT_LOG_MAX_BYTES),
+        backupCount=getattr(settings, 'REQUEST_TIMING_LOG_BACKUP_COUNT', DEFAULT_LOG_BACKUP_COUNT),
+        encoding='utf-8',
+    )
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class RequestTimingMiddleware:
+    """
+    Instrument the requests under settings.REQUEST_TIMING_PATHS, see the module docstring.
+    Only loaded when settings.REQUEST_TIMING_ENABLED is set.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_TIMING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.paths = tuple(getattr(settings, 'REQUEST_TIMING_PATHS', DEFAULT_PATHS))
+        # tracemalloc slows allocation-heavy code down noticeably, so it is a separate switch
+        self.trace_memory = getattr(settings, 'REQUEST_TIMING_TRACE_MEMORY', False)
+        add_file_handler()
+
+    def __call__(self, request):
+        if not request.path.startswith(self.paths):
+            return self.get_response(request)
+
+        profile = RequestProfile(request)
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # Process-wide: resets the peak of any other request being served, see the module docstring
+            tracemalloc.reset_peak()
+        with profile.activate():
+            response = self.get_response(request)
+        if self.trace_memory and not response.streaming:
+            profile.peak_traced_kib = tracemalloc.get_traced_memory()[1] // 1024
+
+        response['Server-Timing'] = profile.get_server_timing()
+        match = request.resolver_match
+        endpoint = match.route if match else request.path
+        if response.streaming:
+            response.streaming_content = self.stream(profile, response.streaming_content, endpoint,
+                                                     response.status_code)
+        else:
+            self.log(profile, endpoint, response.status_code, streamed=False)
+        return response
+
+    def process_template_response(self, request, response):
+        profile = current_profile.get()
+        if profile is not None:
+            start = time.perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: profile.add_stage('render', time.perf_counter() - start))
+        return response
+
+    def stream(self, profile, chunks, endpoint, status_code):
+        """Keep instrumenting while the server iterates a streamed response, log it at the end"""
+        chunks = iter(chunks)
+        try:
+            while True:
+                with profile.activate():
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            if self.trace_memory:
+                profile.peak_traced_kib = tracemalloc.get_traced_memory()[1] // 1024
+            self.log(profile, endpoint, status_code, streamed=True)
+
+    def log(self, profile, endpoint, status_code, streamed):
+        logger.info(json.dumps(profile.get_record(endpoint, status_code, streamed)))
+
+
+def read_timing_records(log_file=None):
+    """Parse the JSON lines of the timing log and its rotated backups, oldest first"""
+    log_file = log_file or get_log_file()
+    backup_count = getattr(settings, 'REQUEST_TIMING_LOG_BACKUP_COUNT', DEFAULT_LOG_BACKUP_COUNT)
+    paths = ['%s.%d' % (log_file, number) for number in range(backup_count, 0, -1)] + [log_file]
+    records = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as lines:
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+def summarize_timing_records(records):
+    """
+    p50/p95 of the total time, query count, query time, peak memory and every stage per endpoint,
+    sorted by the p95 total time, slowest first
+    """
+    by_endpoint = {}
+    for record in records:
+        by_endpoint.setdefault((record.get('method'), record.get('endpoint')), []).append(record)
+
+    def percentiles(values):
+        values = [value for value in values if value is not None]
+        if not values:
+            return None, None
+        p50, p95 = np.percentile(values, [50, 95])
+        return round(float(p50), 1), round(float(p95), 1)
+
+    summary = []
+    for (method, endpoint), endpoint_records in by_endpoint.items():
+        stage_names = []
+        for record in endpoint_records:
+            stage_names.extend(name for name in record.get('stages_ms', {}) if name not in stage_names)
+        summary.append({
+            'method': method,
+            'endpoint': endpoint,
+            'count': len(endpoint_records),
+            'errors': sum(1 for record in endpoint_records if record.get('status', 200) >= 500),
+            'total_ms': percentiles(record.get('total_ms') for record in endpoint_records),
+            'queries': percentiles(record.get('queries') for record in endpoint_records),
+            'query_ms': percentiles(record.get('query_ms') for record in endpoint_records),
+            'peak_traced_kib': percentiles(record.get('peak_traced_kib') for record in endpoint_records),
+            'peak_rss_kib': percentiles(record.get('peak_rss_kib') for record in endpoint_records),
+            # A request without a stage spent no time in it
+            'stages_ms': [(name, percentiles(record.get('stages_ms', {}).get(name, 0.0)
+                                             for record in endpoint_records)) for name in stage_names],
+            'last_seen': max(record.get('time', '') for record in endpoint_records),
+        })
+    summary.sort(key=lambda row: row['total_ms'][1] or 0, reverse=True)
+    return summary
@@ -0,0 +1,139 @@
+"""
+Database-backed background jobs.
+
+Long uploads, allocation runs and exports are stored as Job rows by enqueue_job and
+executed outside the request by the run_jobs management command, which claims queued
+jobs and runs them in a thread or process pool. No broker is needed: the job table is
+the queue, and a job is claimed with a conditional UPDATE so two workers never run it
+twice.
+
+A handler is a function taking the Job and returning (result, artifact), where result is
+a JSON-serializable dict and artifact is None or an Artifact (the file offered for
+download). It can report its progress with update_job_progress.
+"""
+import os
+import socket
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.system.models import Job
+
+JOB_HANDLERS = {
+    'import_priorities': 'apps.student.jobs.import_priorities',
+    'allocate': 'apps.course.jobs.run_allocation',
+    'export_allocation': 'apps.course.jobs.export_allocation_result',
+    'export_subject_zip': 'apps.course.jobs.export_subject_wise_excel_files',
+    'export_master': 'apps.course.jobs.export_master_excel_with_subjects',
+    'allocate_cohorts': 'apps.course.jobs.allocate_all_cohorts',
+}
+
+Artifact = namedtuple('Artifact', ['file_name', 'content_type', 'data'])
+
+
+def enqueue_job(kind, parameters=None, input_file=None, user=None):
+    """
+    Queue a job of one of the kinds of JOB_HANDLERS
+    :param input_file: optional uploaded file, stored with the job
+    :param user: user queueing the job, the only one besides superusers allowed to follow it
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError('Unknown job kind %r' % kind)
+    job = Job(kind=kind, parameters=parameters or {}, message='Waiting for a worker',
+              created_by=user if user is not None and user.is_authenticated else None)
+    if input_file is not None:
+        job.input_file = input_file.read()
+        job.input_file_name = getattr(input_file, 'name', '') or ''
+    job.save()
+    return job
+
+
+def can_access_job(user, job):
+    """
+    Whether a staff user may see the status and the file of a job. Jobs without an owner,
+    queued by allocate_cohorts or other system paths, are left to superusers.
+    """
+    return user.is_superuser or (job.created_by_id is not None and job.created_by_id == user.pk)
+
+
+def update_job_progress(job, progress, message=''):
+    """Record the progress (0-100) of a running job, which is also a heartbeat of its worker"""
+    job.progress, job.message, job.updated_at = progress, message, timezone.now()
+    Job.objects.filter(pk=job.pk).update(progress=progress, message=message, updated_at=job.updated_at)
+
+
+def record_heartbeat(job_ids):
+    """Mark running jobs as alive, see requeue_stale_jobs"""
+    return Job.objects.filter(pk__in=job_ids, status='running').update(updated_at=timezone.now())
+
+
+def get_worker_name():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def claim_next_job(worker_name):
+    """Mark the oldest queued job as running for worker_name and return it, or None if the queue is empty"""
+    for job_id in Job.objects.filter(status='queued').order_by('created_at', 'pk').values_list('pk', flat=True)[:10]:
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job_id, status='queued').update(
+            status='running', worker=worker_name, started_at=now, updated_at=now, message='Started')
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def requeue_stale_jobs(older_than):
+    """
+    Queue again the running jobs without a heartbeat for older_than, left by a worker that died.
+    Returns how many there were.
+    """
+    cutoff = timezone.now() - older_than
+    return Job.objects.filter(Q(updated_at__lt=cutoff) | Q(updated_at__isnull=True, started_at__lt=cutoff),
+                              status='running').update(
+        status='queued', worker='', progress=0, message='Requeued after the worker stopped')
+
+
+def run_job(job_id):
+    """Run a claimed job and store its outcome. Returns the final status."""
+    job = Job.objects.get(pk=job_id)
+    try:
+        handler = import_string(JOB_HANDLERS[job.kind])
+        result, artifact = handler(job)
+        job.status, job.result, job.progress, job.message = 'succeeded', result, 100, 'Finished'
+        if artifact is not None:
+            job.artifact_name, job.artifact_content_type, job.artifact = artifact
+    except Exception as e:
+        job.status, job.message = 'failed', str(e)[:255]
+        job.error = traceback.format_exc()
+    job.finished_at = job.updated_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'progress', 'message', 'artifact', 'artifact_name',
+                            'artifact_content_type', 'error', 'updated_at', 'finished_at'])
+    # Workers are long-lived threads or processes, do not keep a connection per finished job
+    connection.close()
+    return job.status
+
+
+def get_job_status(job):
+    """JSON-serializable state of a job, as polled by the report and upload pages"""
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'result': job.result,
+        'has_artifact': bool(job.artifact_name),
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def delete_old_jobs(older_than=timedelta(days=7)):
+    """Delete finished jobs, with their files, older than older_than"""
+    return Job.objects.filter(status__in=('succeeded', 'failed'),
+                              finished_at__lt=timezone.now() - older_than).delete()[0]
@@ -0,0 +1,91 @@
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from apps.system.jobs import claim_next_job, get_worker_name, requeue_stale_jobs, run_job, delete_old_jobs, \
+    record_heartbeat
+from apps.system.models import Job
+
+
+# Seconds between two looks for jobs left running by a worker that died
+STALE_CHECK_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (priority uploads, allocation runs and exports)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Number of jobs run at the same time')
+        parser.add_argument('--processes', action='store_true',
+                            help='Run jobs in a process pool instead of a thread pool')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait before looking for new jobs when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=10,
+                            help='Minutes without a heartbeat after which a running job is queued again')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def requeue_stale_jobs(self, stale_after):
+        requeued = requeue_stale_jobs(stale_after)
+        if requeued:
+            self.stdout.write('Requeued %d stale jobs' % requeued)
+
+    def handle(self, *args, **options):
+        worker_name = get_worker_name()
+        stale_after = timedelta(minutes=options['stale_after'])
+        self.requeue_stale_jobs(stale_after)
+        deleted = delete_old_jobs()
+        if deleted:
+            self.stdout.write('Deleted %d old jobs' % deleted)
+
+        if options['processes']:
+            # Forked children must not share the database connection of this process
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=options['workers'],
+                                           mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=django.setup)
+        else:
+            executor = ThreadPoolExecutor(max_workers=options['workers'])
+
+        self.stdout.write('Worker %s running up to %d jobs' % (worker_name, options['workers']))
+        running = {}
+        last_stale_check = time.monotonic()
+        try:
+            with executor:
+                while True:
+                    # Jobs of other workers that died are picked up without waiting for a restart
+                    if time.monotonic() - last_stale_check >= STALE_CHECK_INTERVAL:
+                        self.requeue_stale_jobs(stale_after)
+                        last_stale_check = time.monotonic()
+
+                    while len(running) < options['workers']:
+                        job = claim_next_job(worker_name)
+                        if job is None:
+                            break
+                        self.stdout.write('Started %s' % job)
+                        running[executor.submit(run_job, job.pk)] = job
+
+                    if not running:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    record_heartbeat([job.pk for job in running.values()])
+                    done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job = running.pop(future)
+                        try:
+                            self.stdout.write('%s job #%d %s' % (job.get_kind_display(), job.pk, future.result()))
+                        except Exception as e:
+                            # The pool itself failed, e.g. a worker process was killed
+                            self.stderr.write('%s job #%d crashed: %s' % (job.get_kind_display(), job.pk, e))
+                            Job.objects.filter(pk=job.pk, status='running').update(
+                                status='failed', message=str(e)[:255], finished_at=timezone.now())
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping, waiting for the running jobs to finish')
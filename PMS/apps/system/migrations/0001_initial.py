@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('import_priorities', 'Import priorities from Excel'), ('allocate', 'Run allocation'), ('export_allocation', 'Export combined results'), ('export_subject_zip', 'Export subject-wise ZIP'), ('export_master', 'Export master Excel')], max_length=30)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('parameters', models.JSONField(blank=True, default=dict)),
+                ('input_file', models.BinaryField(blank=True, null=True)),
+                ('input_file_name', models.CharField(blank=True, default='', max_length=255)),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('message', models.CharField(blank=True, default='', max_length=255)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('artifact', models.BinaryField(blank=True, null=True)),
+                ('artifact_name', models.CharField(blank=True, default='', max_length=255)),
+                ('artifact_content_type', models.CharField(blank=True, default='', max_length=100)),
+                ('error', models.TextField(blank=True, default='')),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Job',
+                'verbose_name_plural': 'Jobs',
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['status', 'created_at'], name='system_job_status_a7e251_idx')],
+            },
+        ),
+    ]
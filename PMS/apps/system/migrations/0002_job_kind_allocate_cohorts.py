@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('import_priorities', 'Import priorities from Excel'), ('allocate', 'Run allocation'), ('export_allocation', 'Export combined results'), ('export_subject_zip', 'Export subject-wise ZIP'), ('export_master', 'Export master Excel'), ('allocate_cohorts', 'Allocate every cohort')], max_length=30),
+        ),
+    ]
@@ -1,3 +1,62 @@
+from django.conf import settings
 from django.db import models
 
 # Create your models here.
+
+JOB_STATUS_CHOICES = (
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('succeeded', 'Succeeded'),
+    ('failed', 'Failed'),
+)
+
+JOB_KIND_CHOICES = (
+    ('import_priorities', 'Import priorities from Excel'),
+    ('allocate', 'Run allocation'),
+    ('export_allocation', 'Export combined results'),
+    ('export_subject_zip', 'Export subject-wise ZIP'),
+    ('export_master', 'Export master Excel'),
+    ('allocate_cohorts', 'Allocate every cohort'),
+)
+
+
+class Job(models.Model):
+    """
+    A background job, run by the run_jobs management command, see apps.system.jobs
+    """
+    kind = models.CharField(choices=JOB_KIND_CHOICES, max_length=30)
+    status = models.CharField(choices=JOB_STATUS_CHOICES, max_length=10, default='queued')
+    parameters = models.JSONField(default=dict, blank=True)
+    # Uploaded file the job works on, e.g. the Excel file of a priority import
+    input_file = models.BinaryField(null=True, blank=True)
+    input_file_name = models.CharField(max_length=255, blank=True, default='')
+    progress = models.PositiveSmallIntegerField(default=0)
+    message = models.CharField(max_length=255, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    # File produced by the job, downloaded once it has succeeded
+    artifact = models.BinaryField(null=True, blank=True)
+    artifact_name = models.CharField(max_length=255, blank=True, default='')
+    artifact_content_type = models.CharField(max_length=100, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    worker = models.CharField(max_length=100, blank=True, default='')
+    # Staff user who queued the job, only they and superusers can follow it and download its file
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL,
+                                   related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Last heartbeat of the worker running the job, a running job without one for long is requeued
+    updated_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return '%s #%d (%s)' % (self.get_kind_display(), self.pk, self.status)
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    class Meta:
+        ordering = ('-created_at',)
+        indexes = [models.Index(fields=['status', 'created_at'])]
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
@@ -1,3 +1,142 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import tracemalloc
 
-# Create your tests here.
+from django.contrib.auth.models import Group
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from apps.system.instrumentation import (
+    RequestTimingMiddleware, read_timing_records, summarize_timing_records, timed_stage
+)
+
+
+@override_settings(REQUEST_TIMING_ENABLED=True, REQUEST_TIMING_PATHS=('/report/',), REQUEST_TIMING_TRACE_MEMORY=False)
+class RequestTimingMiddlewareTests(TestCase):
+    def get_response(self, request):
+        with timed_stage('allocate'):
+            list(Group.objects.all())
+        return HttpResponse('report')
+
+    def get_streaming_response(self, request):
+        def chunks():
+            for number in range(3):
+                with timed_stage('excel'):
+                    list(Group.objects.all())
+                yield b'chunk %d' % number
+
+        return StreamingHttpResponse(chunks())
+
+    def call(self, get_response, path='/report/'):
+        # assertLogs installs its own handler, so the middleware does not add the log file handler
+        return RequestTimingMiddleware(get_response)(RequestFactory().get(path))
+
+    def get_metrics(self, response):
+        return [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+
+    def test_server_timing_header_and_log_line(self):
+        with self.assertLogs('pms.request_timing', 'INFO') as logs:
+            response = self.call(self.get_response)
+
+        self.assertEqual(self.get_metrics(response)[:2], ['allocate', 'db'])
+        self.assertEqual(self.get_metrics(response)[-1], 'total')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+        self.assertEqual(len(logs.records), 1)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['method'], record['path'], record['endpoint'], record['status'], record['streamed']),
+                         ('GET', '/report/', '/report/', 200, False))
+        self.assertEqual(record['queries'], 1)
+        self.assertEqual(list(record['stages_ms']), ['allocate'])
+        self.assertGreaterEqual(record['total_ms'], record['stages_ms']['allocate'])
+        self.assertIsNone(record['peak_traced_kib'])
+
+    def test_streamed_response_is_logged_after_last_chunk(self):
+        with self.assertLogs('pms.request_timing', 'INFO') as logs:
+            response = self.call(self.get_streaming_response)
+            # Nothing was built before the first chunk
+            self.assertEqual(self.get_metrics(response)[0], 'db')
+            self.assertIn('desc="0 queries"', response['Server-Timing'])
+            content = iter(response.streaming_content)
+            next(content)
+            self.assertEqual(logs.records, [])
+            self.assertEqual(list(content), [b'chunk 1', b'chunk 2'])
+
+        self.assertEqual(len(logs.records), 1)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(record['streamed'])
+        self.assertEqual(record['queries'], 3)
+        self.assertEqual(list(record['stages_ms']), ['excel'])
+
+    def test_other_paths_are_not_instrumented(self):
+        with self.assertNoLogs('pms.request_timing'):
+            response = self.call(self.get_response, path='/admin/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(REQUEST_TIMING_TRACE_MEMORY=True)
+    def test_peak_memory(self):
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+
+        def get_response(request):
+            data = bytearray(4 * 1024 * 1024)
+            return HttpResponse(len(data))
+
+        with self.assertLogs('pms.request_timing', 'INFO') as logs:
+            response = self.call(get_response)
+        self.assertIn('mem;desc="peak', response['Server-Timing'])
+        self.assertGreaterEqual(json.loads(logs.records[0].getMessage())['peak_traced_kib'], 4 * 1024)
+
+
+class TimingLogTests(SimpleTestCase):
+    def write_lines(self, path, lines):
+        with open(path, 'w', encoding='utf-8') as log:
+            log.writelines(line + '\n' for line in lines)
+
+    def make_record(self, endpoint, total_ms, status=200, stages_ms=None):
+        return json.dumps({
+            'time': '2024-11-01T10:00:%02dZ' % (total_ms % 60), 'method': 'GET', 'path': endpoint,
+            'endpoint': endpoint, 'status': status, 'streamed': False, 'total_ms': total_ms,
+            'stages_ms': stages_ms or {}, 'queries': 4, 'query_ms': total_ms / 10,
+            'peak_traced_kib': None, 'peak_rss_kib': 1024,
+        })
+
+    def test_read_rotated_logs_oldest_first(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log_file = os.path.join(directory, 'request_timing.log')
+            self.write_lines(log_file + '.2', [self.make_record('report/', 1)])
+            self.write_lines(log_file + '.1', [self.make_record('report/', 2), 'Traceback (most recent call last):'])
+            self.write_lines(log_file, [self.make_record('report/', 3), ''])
+
+            records = read_timing_records(log_file)
+
+        self.assertEqual([record['total_ms'] for record in records], [1, 2, 3])
+
+    def test_summary_of_sample_log(self):
+        # 21 report requests of 0, 5, ..., 100 ms, the last one failing, and 2 faster downloads
+        lines = [self.make_record('report/', total_ms, stages_ms={'allocate': total_ms / 2} if total_ms % 10 else None)
+                 for total_ms in range(0, 100, 5)]
+        lines.append(self.make_record('report/', 100, status=500))
+        lines += [self.make_record('download-allocation/', total_ms, stages_ms={'excel': total_ms})
+                  for total_ms in (10, 20)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            log_file = os.path.join(directory, 'request_timing.log')
+            self.write_lines(log_file, lines)
+            summary = summarize_timing_records(read_timing_records(log_file))
+
+        self.assertEqual([(row['endpoint'], row['count'], row['errors']) for row in summary],
+                         [('report/', 21, 1), ('download-allocation/', 2, 0)])
+        report, download = summary
+        self.assertEqual(report['total_ms'], (50.0, 95.0))
+        self.assertEqual(report['query_ms'], (5.0, 9.5))
+        self.assertEqual(report['queries'], (4.0, 4.0))
+        self.assertEqual(report['peak_traced_kib'], (None, None))
+        self.assertEqual(report['peak_rss_kib'], (1024.0, 1024.0))
+        # Requests without the stage count as 0 ms
+        self.assertEqual(report['stages_ms'], [('allocate', (0.0, 42.5))])
+        self.assertEqual(report['last_seen'], '2024-11-01T10:00:55Z')
+        self.assertEqual(download['total_ms'], (15.0, 19.5))
+        self.assertEqual(download['stages_ms'], [('excel', (15.0, 19.5))])
@@ -1,13 +1,25 @@
+import json
+
+from django.conf import settings
 from django.contrib import admin
 # Create your views here.
+from django.http import HttpResponse, JsonResponse, Http404
+from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
 
-from apps.algorithm.generic_algorithm import GenericAlgorithm
 from apps.authuser.models import StudentProxyModel
-from apps.course.forms import StreamForm
-from apps.course.models import ElectiveSubject
+from apps.course.forms import StreamForm, SimulationForm
+from apps.course.models import ElectiveSubject, ElectiveSession, Batch, Stream
+from apps.course.services import get_allocation, simulate_allocation
+from apps.course.snapshots import get_outdated_snapshot
+from apps.system.instrumentation import timed_stage, read_timing_records, summarize_timing_records, \
+    get_log_file
+from apps.system.jobs import get_job_status, can_access_job
+from apps.system.models import Job
 from apps.utils import check_if_the_data_entry_is_complete, \
-    get_outliers_message, prepare_pandas_dataframe_from_database, get_normalized_result_from_dataframe
+    get_outliers_message, get_normalized_result_from_dataframe
 
 
 def get_admin_context():
@@ -32,7 +44,8 @@ def display_report(request, *args, **kwargs):
             subjects = ElectiveSubject.objects.filter(elective_for=semester, stream=stream).values_list('id',
                                                                                                         flat=True)
             student_queryset = StudentProxyModel.objects.filter(batch=batch, stream=stream)
-            is_data_entry_complete = check_if_the_data_entry_is_complete(batch, stream, semester)
+            with timed_stage('db_load'):
+                is_data_entry_complete = check_if_the_data_entry_is_complete(batch, stream, semester)
             
             context['has_data'] = True
             context['is_data_entry_ok'] = is_data_entry_complete
@@ -42,19 +55,22 @@ def display_report(request, *args, **kwargs):
             context['stream'] = stream
 
             if is_data_entry_complete:
-                prepare_pandas_dataframe_from_database(batch, semester, stream)
-                
-                algo = GenericAlgorithm(batch, semester, stream)
-                result_as_df = algo.run()
+                algorithm = get_allocation(batch, semester, stream)
+                result_as_df = algorithm.result_df
+                # A saved (possibly edited) allocation of earlier inputs is no longer shown
+                context['outdated_snapshot'] = get_outdated_snapshot(batch.pk, semester.pk, stream.pk,
+                                                                     algorithm.input_hash)
                 
-                normalized_result = get_normalized_result_from_dataframe(result_as_df)
+                with timed_stage('normalize'):
+                    normalized_result = get_normalized_result_from_dataframe(result_as_df)
                 # AlgorithClass = get_suitable_algorithm_class(semester.subjects_provided)
                 # algorithm = AlgorithClass(student_queryset, semester, list(subjects))
                 # algorithm.run()
                 # normalized_result = normalize_result(algorithm.get_result())
                 context['result'] = normalized_result
             else:
-                outlier_messages = get_outliers_message(batch, stream, semester)
+                with timed_stage('db_load'):
+                    outlier_messages = get_outliers_message(batch, stream, semester)
                 context['outlier_messages'] = outlier_messages
                 context['available_subject_count'] = len(subjects)
             context['is_download'] = '_get_pdf' in request.POST
@@ -64,3 +80,85 @@ def display_report(request, *args, **kwargs):
         'admin/course/display_report.html',
         context
     )
+
+
+def request_timings(request):
+    """p50/p95 of the instrumented requests per endpoint, read from the request timing log"""
+    context = get_admin_context()
+    context['title'] = 'Request timings'
+    context['is_enabled'] = getattr(settings, 'REQUEST_TIMING_ENABLED', False)
+    context['log_file'] = get_log_file()
+    context['summary'] = summarize_timing_records(read_timing_records())
+    return TemplateResponse(
+        request,
+        'admin/system/request_timings.html',
+        context
+    )
+
+
+def allocation_simulation(request):
+    """Admin page comparing the allocation under a grid of subject capacities and thresholds"""
+    context = get_admin_context()
+    context['title'] = 'Allocation simulation'
+    if request.method == 'GET':
+        form = SimulationForm()
+    else:
+        form = SimulationForm(request.POST)
+        if form.is_valid():
+            try:
+                context['results'] = simulate_allocation(form.cleaned_data['batch'], form.cleaned_data['semester'],
+                                                         form.cleaned_data['stream'], form.get_grid())
+            except ValueError as error:
+                form.add_error(None, str(error))
+    context['form'] = form
+    return TemplateResponse(
+        request,
+        'admin/system/allocation_simulation.html',
+        context
+    )
+
+
+@require_http_methods(["POST"])
+def allocation_simulation_api(request):
+    """
+    Simulate a grid of capacities and thresholds, see apps.algorithm.simulation
+    Expects a JSON body with session_id, batch_id, stream_id and grid, returns the comparison table
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    if not isinstance(data, dict) or not all(data.get(key) for key in ('session_id', 'batch_id', 'stream_id')):
+        return JsonResponse({'success': False, 'error': 'Missing required parameters'}, status=400)
+
+    session = get_object_or_404(ElectiveSession, pk=data['session_id'])
+    batch = get_object_or_404(Batch, pk=data['batch_id'])
+    stream = get_object_or_404(Stream, pk=data['stream_id'])
+    try:
+        results = simulate_allocation(batch, session, stream, data.get('grid') or {})
+    except ValueError as error:
+        return JsonResponse({'success': False, 'error': str(error)}, status=400)
+    return JsonResponse({'success': True, 'results': results})
+
+
+def job_status(request, job_id):
+    """Progress of a background job as JSON, polled until the job is finished"""
+    job = get_object_or_404(Job.objects.defer('input_file', 'artifact'), pk=job_id)
+    if not can_access_job(request.user, job):
+        raise Http404('No Job matches the given query.')
+    status = get_job_status(job)
+    if job.status == 'succeeded' and job.artifact_name:
+        status['download_url'] = reverse('download_job_artifact', args=[job.pk])
+    return JsonResponse(status)
+
+
+def download_job_artifact(request, job_id):
+    """Download the file produced by a finished background job"""
+    job = get_object_or_404(Job, pk=job_id)
+    if not can_access_job(request.user, job):
+        raise Http404('No Job matches the given query.')
+    if job.status != 'succeeded' or not job.artifact_name:
+        return HttpResponse("The job has not produced a file yet", status=404)
+    response = HttpResponse(bytes(job.artifact), content_type=job.artifact_content_type)
+    response['Content-Disposition'] = f'attachment; filename="{job.artifact_name}"'
+    return response
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from django.shortcuts import get_object_or_404
 
@@ -60,61 +61,81 @@ def get_outliers_message(batch, stream, semester):
 
 
 def prepare_pandas_dataframe_from_database(batch, semester, stream):
-    # Get only students who have at least one elective priority selection for this semester
-    students_with_priorities = ElectivePriority.objects.filter(
-        student__batch=batch, 
-        student__stream=stream, 
-        session=semester
-    ).values_list('student__name', flat=True).distinct()
-    
-    students_names = list(students_with_priorities)
+    """
+    Build the subjects x students priority matrix for a batch/semester/stream, with
+    subject names as rows and student ids as columns.
+
+    All priority rows are fetched with a single values_list query and pivoted in
+    memory. Cells for subjects a student did not select are left as NaN.
+    """
     subjects = list(
-        ElectiveSubject.objects.filter(elective_for=semester, stream=stream).values_list('subject_name', flat=True))
-    
+        ElectiveSubject.objects.filter(elective_for=semester, stream=stream).order_by('pk').values_list(
+            'subject_name', flat=True))
+
+    priority_rows = ElectivePriority.objects.filter(
+        student__batch=batch,
+        student__stream=stream,
+        session=semester
+    ).order_by('pk').values_list('student_id', 'subject__subject_name', 'priority')
+    return build_priority_dataframe(subjects, priority_rows)
+
+
+def build_priority_dataframe(subjects, priority_rows):
+    """
+    Pivot (student id, subject name, priority) rows, in primary key order, into the
+    priority matrix of prepare_pandas_dataframe_from_database
+    :param subjects: subject names of the matrix rows, in primary key order
+    """
+    # Students appear as columns in the order of their first priority row
+    student_ids = []
+    priorities = {}
+    for student_id, subject_name, priority in priority_rows:
+        if student_id not in priorities:
+            student_ids.append(student_id)
+            priorities[student_id] = {}
+        # Keep the first record when duplicates exist for the same cell
+        priorities[student_id].setdefault(subject_name, priority)
+
     # If no students have selected any electives, return empty DataFrame
-    if not students_names:
+    if not student_ids:
         return pd.DataFrame()
-    
-    # Initialize DataFrame with NaN values
-    df = pd.DataFrame(data={}, index=subjects, columns=students_names)
-    
-    # Only populate cells where students have actually made priority selections
-    for index in df.index:
-        for column in df.columns:
-            try:
-                # Try to get the priority for this student-subject combination
-                # Use filter().first() to handle potential duplicate records
-                priority_obj = ElectivePriority.objects.filter(student__name=column, subject__subject_name=index,
-                                                              session=semester).first()
-                if priority_obj:
-                    df.at[index, column] = priority_obj.priority
-                else:
-                    # If student hasn't selected this subject, leave it as NaN
-                    df.at[index, column] = float('nan')
-            except ElectivePriority.DoesNotExist:
-                # If student hasn't selected this subject, leave it as NaN
-                df.at[index, column] = float('nan')
-
-    return df
+
+    subject_positions = {subject_name: i for i, subject_name in enumerate(subjects)}
+    matrix = np.full((len(subjects), len(student_ids)), np.nan)
+    for column, student_id in enumerate(student_ids):
+        for subject_name, priority in priorities[student_id].items():
+            row = subject_positions.get(subject_name)
+            if row is not None:
+                matrix[row, column] = priority
+
+    return pd.DataFrame(matrix, index=subjects, columns=pd.Index(student_ids, dtype=np.int64))
 
 
 def get_normalized_result_from_dataframe(result_df):
+    """
+    Subjects of result_df with their assigned students, as plain dicts for display_report.html.
+
+    Assignments are read from one mask of the whole frame and every assigned student is
+    loaded with a single query, so rendering the report runs no further queries.
+    """
+    # Skip non-student columns like 'number_of_students'
+    student_columns = [student for student in result_df.columns
+                       if student not in ['number_of_students'] and not str(student).startswith('Unnamed')]
+    assigned = result_df[student_columns].to_numpy() == 1  # Only students assigned (value = 1)
+    student_ids = np.array(student_columns, dtype=np.int64)
+    students_by_id = {
+        student['pk']: student for student in StudentProxyModel.objects.filter(
+            pk__in=student_ids[assigned.any(axis=0)].tolist()).values('pk', 'name', 'roll_number')
+    }
+
     normalized_data_list = []
-    for subject in result_df.index:
+    for row, subject in enumerate(result_df.index):
         normalized_data = dict()
         normalized_data['subject_name'] = subject
-        students = []
-        
-        for student in result_df.columns:
-            # Skip non-student columns like 'number_of_students'
-            if student in ['number_of_students'] or student.startswith('Unnamed'):
-                continue
-            
-            if result_df.at[subject, student] == 1:  # Only students assigned (value = 1)
-                students.append(student)
-        
-        normalized_data['students'] = StudentProxyModel.objects.filter(name__in=students)
-        
+        students = [students_by_id[student_id] for student_id in np.sort(student_ids[assigned[row]]).tolist()
+                    if student_id in students_by_id]
+        normalized_data['students'] = students
+
         # Calculate student count from actual assignments, not from a separate column
         student_count = len(students)
         normalized_data['student_count'] = student_count
@@ -0,0 +1,153 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Every benchmark runs against a throwaway in-memory SQLite database so the
+numbers never depend on (or touch) the local pms_db.sqlite3.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESOURCES_DIR = os.path.join(PROJECT_DIR, 'resources', 'files')
+
+
+def setup_django():
+    """Configure Django and create an empty, migrated test database."""
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PMS.settings')
+
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment(debug=False)
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def create_cohort(roll_numbers, subject_names, level_name='Bachelors', min_students=10, max_students=24):
+    """
+    Create the batch, stream, semester, subjects and students needed for an allocation run.
+    Returns (batch, semester, stream).
+    """
+    from apps.authuser.models import User
+    from apps.course.models import AcademicLevel, Batch, ElectiveSession, ElectiveSubject, Stream
+
+    level = AcademicLevel.objects.create(name=level_name)
+    batch = Batch.objects.create(name='Benchmark Batch')
+    stream = Stream.objects.create(stream_name='Benchmark Stream', level=level)
+    semester = ElectiveSession.objects.create(level=level, semester=7, min_student=min_students,
+                                              subjects_provided=2)
+    ElectiveSubject.objects.bulk_create([
+        ElectiveSubject(subject_name=subject_name, elective_for=semester, stream=stream,
+                        min_students=min_students, max_students=max_students)
+        for subject_name in subject_names
+    ])
+    User.objects.bulk_create([
+        User(username=roll_number, name='Student %s' % roll_number, roll_number=roll_number,
+             user_type='Student', batch=batch, stream=stream, level=level, current_semester=semester)
+        for roll_number in roll_numbers
+    ])
+    return batch, semester, stream
+
+
+PRIORITY_DISTRIBUTIONS = ('uniform', 'popular', 'identical')
+
+
+def create_synthetic_cohort(students=500, subjects=12, priorities_per_student=5, distribution='popular',
+                            masters_share=0.0, min_students=10, max_students=24, seed=0):
+    """
+    Create a cohort (see create_cohort) whose students already entered their priorities.
+
+    distribution: 'uniform' picks every student's subjects uniformly at random, 'popular'
+    weights subjects by a Zipf law so a few subjects are oversubscribed, and 'identical'
+    gives every student the same ranking.
+    masters_share: fraction of students at the Masters level, who want 3 subjects instead of 2.
+    Returns (batch, semester, stream).
+    """
+    import numpy as np
+    from apps.authuser.models import User
+    from apps.course.models import AcademicLevel, ElectiveSubject
+    from apps.student.models import ElectivePriority
+
+    if distribution not in PRIORITY_DISTRIBUTIONS:
+        raise ValueError('distribution must be one of %s' % ', '.join(PRIORITY_DISTRIBUTIONS))
+    rng = np.random.default_rng(seed)
+    priorities_per_student = min(priorities_per_student, subjects)
+    roll_numbers = ['081SYN%05d' % i for i in range(1, students + 1)]
+    batch, semester, stream = create_cohort(roll_numbers, ['Synthetic Subject %02d' % i for i in range(1, subjects + 1)],
+                                            min_students=min_students, max_students=max_students)
+
+    student_ids = list(User.objects.filter(batch=batch, stream=stream).order_by('pk').values_list('id', flat=True))
+    masters_ids = set(rng.choice(student_ids, int(round(students * masters_share)), replace=False).tolist())
+    if masters_ids:
+        masters = AcademicLevel.objects.create(name='Masters')
+        User.objects.filter(pk__in=masters_ids).update(level=masters)
+
+    subject_ids = list(ElectiveSubject.objects.filter(stream=stream).order_by('pk').values_list('id', flat=True))
+    weights = 1.0 / np.arange(1, subjects + 1)
+    weights /= weights.sum()
+    priorities = []
+    for student_id in student_ids:
+        if distribution == 'identical':
+            chosen = range(priorities_per_student)
+        elif distribution == 'popular':
+            chosen = rng.choice(subjects, priorities_per_student, replace=False, p=weights)
+        else:
+            chosen = rng.choice(subjects, priorities_per_student, replace=False)
+        desired_number_of_subjects = min(3 if student_id in masters_ids else 2, priorities_per_student)
+        priorities.extend(
+            ElectivePriority(student_id=student_id, subject_id=subject_ids[subject], priority=priority,
+                             session=semester, desired_number_of_subjects=desired_number_of_subjects)
+            for priority, subject in enumerate(chosen, 1))
+    ElectivePriority.objects.bulk_create(priorities, batch_size=2000)
+    return batch, semester, stream
+
+
+def load_excel_fixture(file_name, **cohort_kwargs):
+    """
+    Create a cohort for one of the files in resources/files and import its priorities
+    through the regular Excel upload path. Returns (batch, semester, stream).
+    """
+    import pandas as pd
+    from apps.student.views import extract_student_pref
+
+    path = os.path.join(RESOURCES_DIR, file_name)
+    df = pd.read_excel(path)
+    columns = {str(column).strip().lower(): column for column in df.columns}
+    roll_number_column = next(columns[alias] for alias in ('roll number', 'roll no', 'student id') if alias in columns)
+    roll_numbers = sorted(set(str(value).strip() for value in df[roll_number_column].dropna()))
+    priority_columns = [column for key, column in columns.items() if key.startswith('priority')]
+    subject_names = sorted(set(str(value).strip() for column in priority_columns for value in df[column].dropna()))
+
+    batch, semester, stream = create_cohort(roll_numbers, subject_names, **cohort_kwargs)
+    with open(path, 'rb') as excel_file:
+        extract_student_pref(excel_file, semester, stream, batch)
+    return batch, semester, stream
+
+
+@contextmanager
+def count_queries():
+    """Context manager yielding a list that holds the captured queries once the block exits."""
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+
+    reset_queries()
+    captured = []
+    with CaptureQueriesContext(connection) as context:
+        yield captured
+    captured.extend(context.captured_queries)
+
+
+def best_of(function, repeat=5):
+    """Run function `repeat` times and return (best wall time in seconds, last return value)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
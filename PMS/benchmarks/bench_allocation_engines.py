@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Compare the pandas and NumPy allocation engines of GenericAlgorithm.
+
+Every fixture in resources/files is imported into a throwaway database, allocated
+with both engines, and the two result_df frames are checked to be identical.
+
+Usage: python benchmarks/bench_allocation_engines.py
+"""
+import os
+import sys
+from glob import glob
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import RESOURCES_DIR, setup_django, load_excel_fixture, best_of
+
+# (min_students, max_students) settings each fixture is allocated with
+CAPACITY_SETTINGS = ((10, 24), (5, 60), (3, 8))
+
+
+def run_engine(batch, semester, stream, engine):
+    from apps.algorithm.allocation_cache import get_allocation_cache
+    from apps.algorithm.generic_algorithm import GenericAlgorithm
+
+    # Both engines share cached results, so every run has to start from an empty cache
+    get_allocation_cache().clear()
+    algorithm = GenericAlgorithm(batch, semester, stream, engine=engine)
+    return algorithm.run()
+
+
+def main():
+    setup_django()
+    from django.conf import settings
+    from django.db import transaction
+    import apps.course.views
+
+    # Always allocate from scratch instead of reading an edited allocation or repairing the last one
+    apps.course.views.get_cached_allocation = lambda *args: None
+    settings.INCREMENTAL_ALLOCATION_ENABLED = False
+
+    print('%-58s %9s %12s %12s' % ('fixture', 'min/max', 'pandas ms', 'numpy ms'))
+    for path in sorted(glob(os.path.join(RESOURCES_DIR, '*.xlsx'))):
+        file_name = os.path.basename(path)
+        for min_students, max_students in CAPACITY_SETTINGS:
+            with transaction.atomic():
+                batch, semester, stream = load_excel_fixture(file_name, min_students=min_students,
+                                                             max_students=max_students)
+                pandas_seconds, pandas_result = best_of(lambda: run_engine(batch, semester, stream, 'pandas'), 3)
+                numpy_seconds, numpy_result = best_of(lambda: run_engine(batch, semester, stream, 'numpy'), 3)
+                transaction.set_rollback(True)
+
+            if not pandas_result.empty or not numpy_result.empty:
+                assert list(pandas_result.index) == list(numpy_result.index), file_name
+                assert list(pandas_result.columns) == list(numpy_result.columns), file_name
+                assert (pandas_result.astype(int).values == numpy_result.values).all(), file_name
+            print('%-58s %9s %12.2f %12.2f' % (file_name[:58], '%d/%d' % (min_students, max_students),
+                                               pandas_seconds * 1000, numpy_seconds * 1000))
+    print('Both engines produced identical allocations.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Benchmark for the Excel exporters in apps/excel_generator.py.
+
+Builds a synthetic 2,000-student, 30-subject allocation and records wall time and
+peak Python memory (tracemalloc) of the subject-wise workbooks, the master workbook and
+the subject-wise ZIP download, built in memory and streamed.
+
+Usage: python benchmarks/bench_excel_export.py [--students N] [--subjects N]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import setup_django, create_cohort
+
+
+def make_result_df(batch, stream, subjects_per_student=2, seed=0):
+    """Random allocation over the cohort: every student gets `subjects_per_student` subjects."""
+    import numpy as np
+    import pandas as pd
+    from apps.authuser.models import StudentProxyModel
+    from apps.course.models import ElectiveSubject
+
+    rng = np.random.default_rng(seed)
+    students = list(StudentProxyModel.objects.filter(batch=batch, stream=stream).values_list('id', flat=True))
+    subjects = list(ElectiveSubject.objects.filter(stream=stream).values_list('subject_name', flat=True))
+    matrix = np.zeros((len(subjects), len(students)), dtype=int)
+    for column in range(len(students)):
+        matrix[rng.choice(len(subjects), subjects_per_student, replace=False), column] = 1
+    return pd.DataFrame(matrix, index=subjects, columns=students)
+
+
+def measure(label, function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('%-28s %9.2f s  peak %8.1f MiB' % (label, elapsed, peak / 2 ** 20))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--subjects', type=int, default=30)
+    args = parser.parse_args()
+
+    setup_django()
+    from apps.excel_generator import create_subject_wise_excel_files, create_master_excel_with_all_subjects, \
+        create_zip_of_subject_files, iter_subject_wise_excel_files, stream_zip_of_subject_files
+
+    roll_numbers = ['080BCT%04d' % i for i in range(1, args.students + 1)]
+    subject_names = ['Elective Subject %02d' % i for i in range(1, args.subjects + 1)]
+    batch, semester, stream = create_cohort(roll_numbers, subject_names)
+    result_df = make_result_df(batch, stream)
+    print('%d students, %d subjects' % (args.students, args.subjects))
+
+    excel_files = measure('subject-wise workbooks', lambda: create_subject_wise_excel_files(
+        batch, semester, stream, result_df))
+    master = measure('master workbook', lambda: create_master_excel_with_all_subjects(
+        batch, semester, stream, result_df))
+    print('subject-wise total %.1f KiB, master %.1f KiB' % (
+        sum(len(data) for data in excel_files.values()) / 1024, len(master) / 1024))
+
+    zip_data = measure('in-memory ZIP', lambda: create_zip_of_subject_files(create_subject_wise_excel_files(
+        batch, semester, stream, result_df), batch.name, stream.stream_name, ''))
+
+    def consume_stream():
+        chunks = stream_zip_of_subject_files(iter_subject_wise_excel_files(batch, semester, stream, result_df),
+                                             batch.name, stream.stream_name, '')
+        start = time.perf_counter()
+        size = len(next(chunks))
+        first_chunk_seconds = time.perf_counter() - start
+        return first_chunk_seconds, size + sum(len(chunk) for chunk in chunks)
+
+    first_chunk_seconds, streamed_size = measure('streamed ZIP', consume_stream)
+    print('ZIP %.1f KiB in memory, %.1f KiB streamed, first chunk after %.3f s' % (
+        len(zip_data) / 1024, streamed_size / 1024, first_chunk_seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Benchmark for prepare_pandas_dataframe_from_database on the 200-student fixture.
+
+Compares the single-query loader against the previous per-cell implementation
+and checks that both build the same priority matrix.
+
+Usage: python benchmarks/bench_priority_loader.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import setup_django, load_excel_fixture, count_queries, best_of
+
+FIXTURE = '10_large_200_students.xlsx'
+
+
+def legacy_prepare_pandas_dataframe_from_database(batch, semester, stream):
+    """The original loader, issuing one query per (subject, student) cell."""
+    import pandas as pd
+    from apps.course.models import ElectiveSubject
+    from apps.student.models import ElectivePriority
+
+    students_names = list(ElectivePriority.objects.filter(
+        student__batch=batch, student__stream=stream, session=semester
+    ).values_list('student__name', flat=True).distinct())
+    subjects = list(
+        ElectiveSubject.objects.filter(elective_for=semester, stream=stream).values_list('subject_name', flat=True))
+    if not students_names:
+        return pd.DataFrame()
+    df = pd.DataFrame(data={}, index=subjects, columns=students_names)
+    for index in df.index:
+        for column in df.columns:
+            priority_obj = ElectivePriority.objects.filter(student__name=column, subject__subject_name=index,
+                                                          session=semester).first()
+            df.at[index, column] = priority_obj.priority if priority_obj else float('nan')
+    return df
+
+
+def main():
+    setup_django()
+    from apps.utils import prepare_pandas_dataframe_from_database
+
+    batch, semester, stream = load_excel_fixture(FIXTURE)
+
+    results = {}
+    for label, loader in (('per-cell (legacy)', legacy_prepare_pandas_dataframe_from_database),
+                          ('single query', prepare_pandas_dataframe_from_database)):
+        with count_queries() as queries:
+            loader(batch, semester, stream)
+        seconds, df = best_of(lambda: loader(batch, semester, stream))
+        results[label] = df
+        print('%-18s %8.2f ms  %5d queries  shape=%s' % (label, seconds * 1000, len(queries), df.shape))
+
+    from apps.authuser.models import User
+
+    # The legacy loader labels students by name, the current one by id
+    legacy, current = results['per-cell (legacy)'], results['single query']
+    current = current.rename(columns=dict(User.objects.values_list('id', 'name')))
+    legacy = legacy[current.columns].astype(float)
+    assert legacy.index.equals(current.index), 'subject order differs'
+    assert legacy.equals(current), 'priority matrices differ'
+    print('Both loaders produced identical matrices.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Benchmark for the parse stage of extract_student_pref on the 200-student fixture.
+
+Compares the column-wise parse (usecols, parse_priority_rows) against the previous
+row-by-row iterrows() parse and checks that both accept the same rows and report the
+same errors. The read and the validation are timed separately, and the validation is
+also timed on the fixture rows repeated --scale times. No database writes are involved.
+
+Usage: python benchmarks/bench_priority_parse.py [--fixture FILE] [--scale N]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import RESOURCES_DIR, setup_django, best_of
+
+FIXTURE = '10_large_200_students.xlsx'
+
+
+def find_columns(columns):
+    from apps.student.subject_matcher import normalize_key
+
+    roll_number_column = next(col for col in columns if normalize_key(col) in ('roll number', 'roll no', 'student id'))
+    priority_columns = sorted((col for col in columns if normalize_key(col).startswith('priority')),
+                              key=lambda col: int(normalize_key(col).split()[-1]))
+    return roll_number_column, priority_columns
+
+
+def legacy_read(path):
+    import pandas as pd
+
+    return pd.read_excel(path)
+
+
+def legacy_parse(df, subject_matcher):
+    """The previous parse stage: one iterrows() pass normalising every cell."""
+    from apps.student.subject_matcher import normalize_text
+
+    roll_number_column, priority_columns = find_columns(df.columns)
+    rows, errors_by_row = [], {}
+    for index, row in df.iterrows():
+        roll_number = normalize_text(row.get(roll_number_column))
+        if not roll_number or roll_number.lower() == 'nan':
+            errors_by_row[index] = f'Row {index + 2}: Roll Number is empty'
+            continue
+        if len(roll_number) < 6:
+            errors_by_row[index] = f'Row {index + 2}: Invalid roll number format. Expected format: 079bct007'
+            continue
+        priorities = [normalize_text(row.get(col)) for col in priority_columns]
+        priorities = [p for p in priorities if p and p.lower() != 'nan']
+        if not priorities:
+            errors_by_row[index] = f'Row {index + 2}: No priorities provided'
+            continue
+        matched_subjects = {priority: subject_matcher.match(priority)[0] for priority in priorities}
+        invalid_subjects = [priority for priority in priorities if matched_subjects[priority] is None]
+        if invalid_subjects:
+            errors_by_row[index] = f'Row {index + 2}: Invalid subject names: {", ".join(invalid_subjects)}'
+            continue
+        resolved_priorities = [matched_subjects[p] for p in priorities]
+        if len(set(resolved_priorities)) != len(resolved_priorities):
+            errors_by_row[index] = f'Row {index + 2}: Duplicate subjects found. Each subject should appear only once.'
+            continue
+        rows.append((index, roll_number, resolved_priorities, None))
+    return rows, errors_by_row
+
+
+def columnwise_read(path):
+    import pandas as pd
+    from apps.student.views import is_priority_file_column
+
+    return pd.read_excel(path, usecols=is_priority_file_column)
+
+
+def columnwise_parse(df, subject_matcher):
+    from apps.student.views import parse_priority_rows
+
+    roll_number_column, priority_columns = find_columns(df.columns)
+    return parse_priority_rows(df, roll_number_column, priority_columns, None, subject_matcher)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--fixture', default=FIXTURE)
+    parser.add_argument('--scale', type=int, default=25)
+    args = parser.parse_args()
+
+    setup_django()
+    import pandas as pd
+    from apps.student.subject_matcher import SubjectMatcher
+
+    path = os.path.join(RESOURCES_DIR, args.fixture)
+    df = pd.read_excel(path)
+    _, priority_columns = find_columns(df.columns)
+    subject_names = sorted(set(str(value).strip() for col in priority_columns for value in df[col].dropna()))
+
+    results = {}
+    print('%-18s %10s %10s %10s %12s' % ('', 'read ms', 'parse ms', 'total ms', 'parse x%d ms' % args.scale))
+    for label, read, parse in (('iterrows (legacy)', legacy_read, legacy_parse),
+                               ('column-wise', columnwise_read, columnwise_parse)):
+        read_seconds, frame = best_of(lambda: read(path))
+        # A fresh matcher per run, so the resolution cache does not carry over between runs
+        parse_seconds, results[label] = best_of(lambda: parse(frame, SubjectMatcher(subject_names)))
+        scaled = pd.concat([frame] * args.scale, ignore_index=True)
+        scaled_seconds, _ = best_of(lambda: parse(scaled, SubjectMatcher(subject_names)), 3)
+        print('%-18s %10.2f %10.2f %10.2f %12.2f' % (label, read_seconds * 1000, parse_seconds * 1000,
+                                                      (read_seconds + parse_seconds) * 1000, scaled_seconds * 1000))
+
+    legacy_rows, legacy_errors = results['iterrows (legacy)']
+    rows, errors = results['column-wise']
+    assert [row[:3] for row in legacy_rows] == [row[:3] for row in rows], 'parsed rows differ'
+    assert legacy_errors == errors, 'errors differ'
+    print('Both parsers produced identical rows and errors.')
+
+
+if __name__ == '__main__':
+    main()
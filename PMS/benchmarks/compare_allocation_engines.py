@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Compare the min-cost flow engine with the greedy engine of GenericAlgorithm.
+
+Every fixture in resources/files (with several capacity settings) and a few synthetic
+cohorts are allocated with each engine. The runtime and the satisfaction metrics of
+apps.algorithm.satisfaction are reported side by side, and every allocation is checked
+against the subject capacities and the desired subject counts.
+
+Usage: python benchmarks/compare_allocation_engines.py [--engines pandas,min_cost_flow] [--no-fixtures]
+           [--output results.json]
+"""
+import argparse
+import json
+import os
+import sys
+from glob import glob
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import RESOURCES_DIR, setup_django, load_excel_fixture, create_synthetic_cohort, best_of
+
+# (min_students, max_students) settings each fixture is allocated with
+CAPACITY_SETTINGS = ((10, 24), (5, 60), (3, 8))
+
+SYNTHETIC_COHORTS = (
+    dict(students=200, subjects=8, distribution='uniform', min_students=10, max_students=40),
+    dict(students=300, subjects=12, distribution='popular', min_students=10, max_students=40),
+    dict(students=500, subjects=12, distribution='popular', min_students=15, max_students=60, masters_share=0.2),
+    dict(students=300, subjects=10, distribution='identical', min_students=10, max_students=30),
+)
+
+
+def check_allocation(algorithm, df_of_priorities, result_df):
+    """Assert that an allocation respects the capacities, the selections and the desired counts"""
+    for subject in result_df.index:
+        count = int(result_df.loc[subject].sum())
+        assert count >= max(algorithm.min_students_per_subject.get(subject, 0), 1), (subject, count)
+        assert count <= algorithm.max_students_per_subject.get(subject, 24), (subject, count)
+        assigned = result_df.columns[result_df.loc[subject].to_numpy() == 1]
+        assert df_of_priorities.loc[subject, assigned].notna().all(), subject
+    for student in result_df.columns:
+        assert result_df[student].sum() <= algorithm.get_desired_number_of_subjects_for_student(student), student
+
+
+def compare_engines(batch, semester, stream, engines):
+    from apps.algorithm.allocation_cache import get_allocation_cache
+    from apps.algorithm.generic_algorithm import GenericAlgorithm
+    from apps.algorithm.satisfaction import get_satisfaction_metrics
+    from apps.utils import prepare_pandas_dataframe_from_database
+
+    def run_engine(engine):
+        get_allocation_cache().clear()
+        algorithm = GenericAlgorithm(batch, semester, stream, engine=engine)
+        algorithm.run()
+        return algorithm
+
+    df_of_priorities = prepare_pandas_dataframe_from_database(batch, semester, stream)
+    results = {}
+    for engine in engines:
+        seconds, algorithm = best_of(lambda: run_engine(engine), 3)
+        if algorithm.result_df is not None and not algorithm.result_df.empty:
+            check_allocation(algorithm, df_of_priorities, algorithm.result_df)
+        results[engine] = dict(get_satisfaction_metrics(df_of_priorities, algorithm.result_df,
+                                                        algorithm.get_desired_number_of_subjects_for_student),
+                               milliseconds=seconds * 1000)
+    return results
+
+
+def print_results(case, results):
+    for engine, metrics in results.items():
+        print('%-44s %-14s %9.1f %6d/%-6d %6d %8.1f%% %8.1f%% %8s %5d' % (
+            case[:44], engine, metrics['milliseconds'], metrics['assignments'], metrics['demand'],
+            metrics['fully_satisfied_students'], 100.0 * metrics['fully_satisfied_students'] / max(metrics['students'], 1),
+            100.0 * metrics['first_choice_share'],
+            '-' if metrics['mean_priority'] is None else '%.3f' % metrics['mean_priority'],
+            metrics['subjects_offered']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--engines', default='pandas,min_cost_flow')
+    parser.add_argument('--no-fixtures', action='store_true', help='Only allocate the synthetic cohorts')
+    parser.add_argument('--output', help='Write the metrics of every case to this JSON file')
+    args = parser.parse_args()
+    engines = args.engines.split(',')
+
+    setup_django()
+    from django.db import transaction
+    import apps.course.views
+
+    # Always allocate from scratch instead of reading an edited allocation
+    apps.course.views.get_cached_allocation = lambda *args: None
+
+    cases = []
+    if not args.no_fixtures:
+        for path in sorted(glob(os.path.join(RESOURCES_DIR, '*.xlsx'))):
+            for min_students, max_students in CAPACITY_SETTINGS:
+                cases.append(('%s %d/%d' % (os.path.basename(path), min_students, max_students),
+                              lambda path=path, low=min_students, high=max_students: load_excel_fixture(
+                                  os.path.basename(path), min_students=low, max_students=high)))
+    for cohort in SYNTHETIC_COHORTS:
+        cases.append(('synthetic %(students)d %(distribution)s %(min_students)d/%(max_students)d' % cohort,
+                      lambda cohort=cohort: create_synthetic_cohort(**cohort)))
+
+    print('%-44s %-14s %9s %13s %6s %9s %9s %8s %5s' % ('case', 'engine', 'ms', 'given/demand', 'full', 'full %',
+                                                       '1st %', 'mean pr.', 'subj.'))
+    all_results = {}
+    for case, create in cases:
+        with transaction.atomic():
+            batch, semester, stream = create()
+            all_results[case] = compare_engines(batch, semester, stream, engines)
+            transaction.set_rollback(True)
+        print_results(case, all_results[case])
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(all_results, output, indent=2)
+        print('Results written to %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
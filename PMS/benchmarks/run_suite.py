@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+Allocation benchmark suite.
+
+Generates a synthetic cohort (see benchmarks.create_synthetic_cohort) in a throwaway
+SQLite database and times every stage from the priorities in the database to the
+exported files: prepare_pandas_dataframe_from_database, GenericAlgorithm.run (from
+scratch, and repairing the previous allocation after one student's priorities changed),
+get_normalized_result_from_dataframe and each exporter. The queries of each stage are
+counted as well. Results are written as JSON, and a previous result file can be passed
+with --compare to flag stages that became slower or issue more queries.
+
+Usage: python benchmarks/run_suite.py [--students N] [--subjects N] [--priorities N]
+           [--distribution uniform|popular|identical] [--masters-share F]
+           [--min-students N] [--max-students N] [--engine pandas|numpy] [--repeat N]
+           [--output results.json] [--compare previous.json] [--threshold 1.25]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import PROJECT_DIR, PRIORITY_DISTRIBUTIONS, setup_django, create_synthetic_cohort, count_queries
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_stage(function, repeat, before_each=None):
+    """
+    Run function repeat times after one run whose queries are counted.
+    Returns (stage result dict, return value of the last run).
+    """
+    if before_each:
+        before_each()
+    with count_queries() as queries, contextlib.redirect_stdout(io.StringIO()):
+        value = function()
+    seconds = []
+    for _ in range(repeat):
+        if before_each:
+            before_each()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            value = function()
+            seconds.append(time.perf_counter() - start)
+    return {
+        'best_seconds': min(seconds),
+        'median_seconds': statistics.median(seconds),
+        'queries': len(queries),
+    }, value
+
+
+def run_suite(args):
+    from apps.algorithm.allocation_cache import get_allocation_cache
+    from apps.algorithm.generic_algorithm import GenericAlgorithm, GREEDY_ENGINES
+    from apps.student.models import ElectivePriority
+    from apps.excel_generator import create_allocation_result_excel, create_subject_wise_excel_files, \
+        create_master_excel_with_all_subjects, iter_subject_wise_excel_files, stream_zip_of_subject_files
+    from apps.utils import prepare_pandas_dataframe_from_database, get_normalized_result_from_dataframe
+
+    start = time.perf_counter()
+    batch, semester, stream = create_synthetic_cohort(
+        students=args.students, subjects=args.subjects, priorities_per_student=args.priorities,
+        distribution=args.distribution, masters_share=args.masters_share, min_students=args.min_students,
+        max_students=args.max_students, seed=args.seed)
+    setup_seconds = time.perf_counter() - start
+
+    def run_allocation():
+        algorithm = GenericAlgorithm(batch, semester, stream, engine=args.engine)
+        algorithm.run()
+        return algorithm
+
+    stages = {}
+    stages['prepare_dataframe'], _ = time_stage(
+        lambda: prepare_pandas_dataframe_from_database(batch, semester, stream), args.repeat)
+    # Every run allocates from scratch instead of reading the cached result
+    stages['allocation_run'], algorithm = time_stage(run_allocation, args.repeat,
+                                                     before_each=get_allocation_cache().clear)
+    if args.engine in GREEDY_ENGINES:
+        # A late change of one student: their first two priorities swap on every run
+        student_id = ElectivePriority.objects.filter(session=semester).order_by('pk').values_list(
+            'student_id', flat=True)[args.students // 2]
+
+        def change_one_student():
+            get_allocation_cache().clear()
+            run_allocation()
+            first, second = ElectivePriority.objects.filter(session=semester, student_id=student_id).order_by(
+                'priority')[:2]
+            first.priority, second.priority = second.priority, first.priority
+            first.save()
+            second.save()
+
+        stages['incremental_run'], _ = time_stage(run_allocation, args.repeat, before_each=change_one_student)
+    result_df = algorithm.result_df
+    stages['normalize_result'], _ = time_stage(lambda: get_normalized_result_from_dataframe(result_df), args.repeat)
+
+    exporters = {
+        'export_allocation': lambda: create_allocation_result_excel(result_df),
+        'export_subject_wise': lambda: create_subject_wise_excel_files(batch, semester, stream, result_df),
+        'export_subject_zip': lambda: b''.join(stream_zip_of_subject_files(
+            iter_subject_wise_excel_files(batch, semester, stream, result_df),
+            batch.name, stream.stream_name, '')),
+        'export_master': lambda: create_master_excel_with_all_subjects(batch, semester, stream, result_df),
+    }
+    for name, export in exporters.items():
+        stages[name], data = time_stage(export, args.repeat)
+        stages[name]['bytes'] = sum(map(len, data.values())) if isinstance(data, dict) else len(data or b'')
+
+    return {
+        'commit': get_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'students': args.students,
+            'subjects': args.subjects,
+            'priorities': args.priorities,
+            'distribution': args.distribution,
+            'masters_share': args.masters_share,
+            'min_students': args.min_students,
+            'max_students': args.max_students,
+            'engine': args.engine,
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'cohort': {
+            'setup_seconds': setup_seconds,
+            'allocated_subjects': len(result_df.index),
+            'allocated_students': len(result_df.columns),
+            'assignments': int((result_df.to_numpy() == 1).sum()),
+        },
+        'stages': stages,
+    }
+
+
+def compare(results, previous, threshold):
+    """Print the change of every stage against a previous run, returns the names of regressed stages"""
+    if previous.get('parameters') != results['parameters']:
+        print('Warning: the previous results were measured with different parameters')
+    regressions = []
+    print('\n%-22s %12s %12s %8s %8s' % ('vs ' + str(previous.get('commit')), 'before ms', 'now ms', 'ratio',
+                                         'queries'))
+    for name, stage in results['stages'].items():
+        before = previous.get('stages', {}).get(name)
+        if before is None:
+            continue
+        ratio = stage['median_seconds'] / before['median_seconds'] if before['median_seconds'] else float('inf')
+        regressed = ratio > threshold or stage['queries'] > before['queries']
+        if regressed:
+            regressions.append(name)
+        print('%-22s %12.2f %12.2f %7.2fx %3d->%-3d%s' % (
+            name, before['median_seconds'] * 1000, stage['median_seconds'] * 1000, ratio, before['queries'],
+            stage['queries'], '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--subjects', type=int, default=12)
+    parser.add_argument('--priorities', type=int, default=5, help='Priorities entered by each student')
+    parser.add_argument('--distribution', choices=PRIORITY_DISTRIBUTIONS, default='popular')
+    parser.add_argument('--masters-share', type=float, default=0.0,
+                        help='Fraction of Masters students, who take 3 subjects instead of 2')
+    parser.add_argument('--min-students', type=int, default=10)
+    parser.add_argument('--max-students', type=int, default=60)
+    parser.add_argument('--engine', choices=('pandas', 'numpy', 'min_cost_flow'), default='pandas')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Results JSON of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Slowdown ratio of the median time reported as a regression')
+    args = parser.parse_args()
+
+    setup_django()
+    results = run_suite(args)
+
+    print('%-22s %10s %10s %8s' % ('stage', 'best ms', 'median ms', 'queries'))
+    for name, stage in results['stages'].items():
+        print('%-22s %10.2f %10.2f %8d' % (name, stage['best_seconds'] * 1000, stage['median_seconds'] * 1000,
+                                          stage['queries']))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+        print('Results written to %s' % args.output)
+
+    if args.compare:
+        with open(args.compare) as previous:
+            regressions = compare(results, json.load(previous), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
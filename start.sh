@@ -28,6 +28,10 @@ EOF
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
+# Start the worker running background uploads, allocation runs and exports
+echo "Starting background job worker..."
+python manage.py run_jobs --workers 2 &
+
 # Start the application
 echo "Starting Gunicorn server..."
 exec gunicorn --bind 0.0.0.0:8000 --workers 3 --timeout 120 PMS.wsgi:application